@@ -0,0 +1,100 @@
+"""Load benchmark: threaded vs eventlet server mode.
+
+Starts server.py.py once per async mode (with its own temporary db.json),
+connects many Socket.IO clients, fires gestures at /esp_upload and measures
+how long every connected client takes to see each update.
+
+    python bench_async_modes.py --clients 1000 --gestures 50
+    python bench_async_modes.py --modes eventlet --clients 3000
+
+Requires aiohttp and python-socketio[asyncio_client] on the benchmark side.
+"""
+import argparse
+import asyncio
+import statistics
+import tempfile
+import time
+
+import aiohttp
+
+from bench_common import connect_clients, disconnect_clients, percentile, start_server, wait_healthy
+
+
+async def run_mode(mode, args):
+    port = args.port
+    url = f"http://127.0.0.1:{port}"
+    with tempfile.TemporaryDirectory() as workdir:
+        proc = start_server(mode, port, workdir)
+        try:
+            await wait_healthy(url)
+
+            received = {}
+            started = time.perf_counter()
+            clients = await connect_clients(
+                url, args.clients, args.connect_concurrency,
+                lambda index, data: received.setdefault(index, []).append(time.perf_counter()))
+            connect_time = time.perf_counter() - started
+
+            sent = []
+            request_latencies = []
+            async with aiohttp.ClientSession() as session:
+                for _ in range(args.gestures):
+                    t0 = time.perf_counter()
+                    sent.append(t0)
+                    async with session.post(f"{url}/esp_upload", json={"circle": True}) as resp:
+                        await resp.read()
+                    request_latencies.append(time.perf_counter() - t0)
+                    await asyncio.sleep(args.spacing)
+            await asyncio.sleep(args.drain)
+
+            latencies = []
+            missing = 0
+            for client_index in range(args.clients):
+                client_received = received.get(client_index, [])
+                for index, t_sent in enumerate(sent):
+                    t_next = sent[index + 1] if index + 1 < len(sent) else float("inf")
+                    hits = [t for t in client_received if t_sent <= t < t_next + args.drain]
+                    if hits:
+                        latencies.append(hits[0] - t_sent)
+                    else:
+                        missing += 1
+
+            await disconnect_clients(clients)
+        finally:
+            proc.terminate()
+            proc.wait()
+
+    return {
+        "mode": mode,
+        "clients": len(clients),
+        "connect_s": connect_time,
+        "http_p50_ms": percentile(request_latencies, 50) * 1000,
+        "fanout_p50_ms": percentile(latencies, 50) * 1000,
+        "fanout_p99_ms": percentile(latencies, 99) * 1000,
+        "fanout_mean_ms": (statistics.mean(latencies) * 1000) if latencies else float("nan"),
+        "missing": missing,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--modes", nargs="+", default=["threading", "eventlet"])
+    parser.add_argument("--clients", type=int, default=500)
+    parser.add_argument("--gestures", type=int, default=30)
+    parser.add_argument("--spacing", type=float, default=0.2, help="seconds between gestures")
+    parser.add_argument("--drain", type=float, default=1.0, help="seconds to wait for the last updates")
+    parser.add_argument("--connect-concurrency", type=int, default=100)
+    parser.add_argument("--port", type=int, default=5055)
+    args = parser.parse_args()
+
+    print(f"{'mode':<10} {'clients':>7} {'connect s':>9} {'http p50':>9} "
+          f"{'fanout p50':>10} {'fanout p99':>10} {'missing':>8}")
+    for mode in args.modes:
+        result = asyncio.run(run_mode(mode, args))
+        print(f"{result['mode']:<10} {result['clients']:>7} {result['connect_s']:>9.2f} "
+              f"{result['http_p50_ms']:>7.1f}ms {result['fanout_p50_ms']:>8.1f}ms "
+              f"{result['fanout_p99_ms']:>8.1f}ms {result['missing']:>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,219 @@
+"""End-to-end load and latency benchmark for the local broker.
+
+Runs a fake MQTT broker and server.py.py, then drives it at fixed rates with
+simulated traffic:
+
+  * bands posting gestures to /esp_upload
+  * bands publishing gestures on the esp/data MQTT topic
+  * phones sending PATCH /symbols/<id>
+  * dashboards connected over Socket.IO
+
+Each source works on its own symbols, so the results can be checked per
+source. Reports throughput, p50/p99 latency from gesture to the dashboards'
+"update" event, and lost toggles (symbols whose final state does not match
+the parity of the gestures sent to them).
+
+    python bench_broker.py --duration 10 --http-rate 50 --mqtt-rate 50 --dashboards 20
+    python bench_broker.py --mode eventlet --json results.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import tempfile
+import time
+
+import aiohttp
+import paho.mqtt.client as mqtt
+
+from bench_common import connect_clients, disconnect_clients, percentile, start_server, wait_healthy
+from fake_mqtt_broker import FakeMqttBroker
+from routing import RoutingTable
+
+HTTP_SYMBOLS = ["circle", "wave", "updown", "double_tap"]
+MQTT_SYMBOLS = ["swipe_up", "swipe_down", "double_wave", "flick"]
+PATCH_SYMBOLS = ["knock", "clap"]
+
+
+class Tracker:
+    """Send times per symbol and dashboard receive times, for latency matching"""
+
+    def __init__(self):
+        self.sent = {}
+        self.received = {}
+
+    def on_sent(self, symbol_id, sent_at):
+        self.sent.setdefault(symbol_id, []).append(sent_at)
+
+    def on_update(self, client_index, data):
+        now = time.perf_counter()
+        for symbol_id in data:
+            self.received.setdefault((client_index, symbol_id), []).append(now)
+
+    def latencies(self, clients):
+        """Latency of each gesture to each dashboard: first update for its symbol at or after it was sent"""
+        latencies, missing = [], 0
+        for symbol_id, sent_times in self.sent.items():
+            for client_index in range(clients):
+                received = self.received.get((client_index, symbol_id), [])
+                position = 0
+                for sent_at in sent_times:
+                    while position < len(received) and received[position] < sent_at:
+                        position += 1
+                    if position < len(received):
+                        latencies.append(received[position] - sent_at)
+                    else:
+                        missing += 1
+        return latencies, missing
+
+
+async def paced(rate, duration, send):
+    """Call ``send()`` ``rate`` times per second for ``duration`` seconds (open loop)"""
+    if rate <= 0:
+        return []
+    tasks = []
+    interval = 1.0 / rate
+    started = time.perf_counter()
+    next_at = started
+    while next_at - started < duration:
+        tasks.append(asyncio.ensure_future(send()))
+        next_at += interval
+        await asyncio.sleep(max(0.0, next_at - time.perf_counter()))
+    return await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def run(args):
+    routes = RoutingTable.load(args.routes)
+    symbol_ids = {name: routes.resolve(name).symbol_id for name in HTTP_SYMBOLS + MQTT_SYMBOLS + PATCH_SYMBOLS}
+
+    broker = FakeMqttBroker().start()
+    url = f"http://127.0.0.1:{args.port}"
+    tracker = Tracker()
+    counts = {"http": 0, "http_errors": 0, "mqtt": 0, "patch": 0, "patch_errors": 0}
+    gestures = {symbol_id: 0 for symbol_id in symbol_ids.values()}
+    last_patch = {}
+
+    with tempfile.TemporaryDirectory() as workdir:
+        proc = start_server(args.mode, args.port, workdir, mqtt_port=broker.port)
+        band = mqtt.Client()
+        try:
+            await wait_healthy(url, mqtt=True)
+            band.connect(broker.host, broker.port)
+            band.loop_start()
+
+            dashboards = await connect_clients(url, args.dashboards, 50, tracker.on_update)
+
+            async with aiohttp.ClientSession() as session:
+                async with session.get(f"{url}/symbols") as resp:
+                    initial = await resp.json()
+
+                async def http_gesture():
+                    name = random.choice(HTTP_SYMBOLS)
+                    symbol_id = symbol_ids[name]
+                    sent_at = time.perf_counter()
+                    tracker.on_sent(symbol_id, sent_at)
+                    async with session.post(f"{url}/esp_upload", json={name: True}) as resp:
+                        await resp.read()
+                        if resp.status == 200:
+                            counts["http"] += 1
+                            gestures[symbol_id] += 1
+                        else:
+                            counts["http_errors"] += 1
+
+                async def mqtt_gesture():
+                    name = random.choice(MQTT_SYMBOLS)
+                    symbol_id = symbol_ids[name]
+                    tracker.on_sent(symbol_id, time.perf_counter())
+                    band.publish("esp/data", json.dumps({name: True}), qos=1)
+                    counts["mqtt"] += 1
+                    gestures[symbol_id] += 1
+
+                async def patch():
+                    name = random.choice(PATCH_SYMBOLS)
+                    symbol_id = symbol_ids[name]
+                    state = random.random() < 0.5
+                    tracker.on_sent(symbol_id, time.perf_counter())
+                    async with session.patch(f"{url}/symbols/{symbol_id}", json={"name": name, "state": state}) as resp:
+                        await resp.read()
+                        if resp.status == 200:
+                            counts["patch"] += 1
+                            last_patch[symbol_id] = state
+                        else:
+                            counts["patch_errors"] += 1
+
+                started = time.perf_counter()
+                await asyncio.gather(
+                    paced(args.http_rate, args.duration, http_gesture),
+                    paced(args.mqtt_rate, args.duration, mqtt_gesture),
+                    paced(args.patch_rate, args.duration, patch),
+                )
+                elapsed = time.perf_counter() - started
+                await asyncio.sleep(args.drain)
+
+                async with session.get(f"{url}/symbols") as resp:
+                    final = await resp.json()
+
+            await disconnect_clients(dashboards)
+        finally:
+            band.loop_stop()
+            proc.terminate()
+            proc.wait()
+            broker.stop()
+
+    lost = []
+    for symbol_id, count in gestures.items():
+        if symbol_id in last_patch:
+            expected = last_patch[symbol_id]
+        elif count:
+            expected = initial.get(symbol_id, {}).get("state", False) ^ (count % 2 == 1)
+        else:
+            continue
+        if final.get(symbol_id, {}).get("state", False) != expected:
+            lost.append(symbol_id)
+
+    latencies, missing = tracker.latencies(len(dashboards))
+    total = counts["http"] + counts["mqtt"] + counts["patch"]
+    return {
+        "mode": args.mode,
+        "duration_s": elapsed,
+        "dashboards": len(dashboards),
+        "requests": counts,
+        "throughput_per_s": total / elapsed if elapsed else 0.0,
+        "latency_p50_ms": percentile(latencies, 50) * 1000,
+        "latency_p99_ms": percentile(latencies, 99) * 1000,
+        "latency_samples": len(latencies),
+        "missing_updates": missing,
+        "lost_toggle_symbols": lost,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mode", default="threading", choices=["threading", "eventlet"])
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds of traffic")
+    parser.add_argument("--http-rate", type=float, default=20.0, help="/esp_upload gestures per second")
+    parser.add_argument("--mqtt-rate", type=float, default=20.0, help="esp/data gestures per second")
+    parser.add_argument("--patch-rate", type=float, default=5.0, help="PATCH /symbols requests per second")
+    parser.add_argument("--dashboards", type=int, default=10, help="Socket.IO clients")
+    parser.add_argument("--drain", type=float, default=2.0, help="seconds to wait for the last updates")
+    parser.add_argument("--port", type=int, default=5056)
+    parser.add_argument("--routes", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "routes.json"))
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    result = asyncio.run(run(args))
+    print(f"mode {result['mode']}: {result['throughput_per_s']:.1f} req/s over {result['duration_s']:.1f}s, "
+          f"{result['dashboards']} dashboards")
+    print(f"  requests: {result['requests']}")
+    print(f"  gesture -> dashboard update: p50 {result['latency_p50_ms']:.1f} ms, "
+          f"p99 {result['latency_p99_ms']:.1f} ms ({result['latency_samples']} samples, "
+          f"{result['missing_updates']} missing)")
+    print(f"  lost toggles: {len(result['lost_toggle_symbols'])} symbols {result['lost_toggle_symbols']}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""Helpers shared by the broker benchmarks (bench_*.py)."""
+import asyncio
+import os
+import subprocess
+import sys
+import time
+
+import aiohttp
+import socketio
+
+SERVER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "server.py.py")
+
+
+def percentile(values, pct):
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def start_server(mode, port, workdir, mqtt_port=1, env=None):
+    """Start server.py.py in ``mode`` as a subprocess with its db.json in ``workdir``
+
+    ``mqtt_port=1`` points it at a closed port, i.e. runs without MQTT.
+    Gesture debouncing is off unless BROKER_DEBOUNCE_WINDOW is set, since the
+    benchmarks repeat gestures faster than a person would.
+    """
+    server_env = dict(os.environ, BROKER_ASYNC_MODE=mode, BROKER_PORT=str(port),
+                      BROKER_DB_PATH=os.path.join(workdir, "db.json"),
+                      BROKER_MQTT_HOST="127.0.0.1", BROKER_MQTT_PORT=str(mqtt_port),
+                      BROKER_LOG_MESSAGES=os.environ.get("BROKER_LOG_MESSAGES", "0"),
+                      BROKER_DEBOUNCE_WINDOW=os.environ.get("BROKER_DEBOUNCE_WINDOW", "0"))
+    server_env.update(env or {})
+    return subprocess.Popen([sys.executable, SERVER], cwd=workdir, env=server_env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+async def wait_healthy(url, timeout=20.0, mqtt=False):
+    """Wait until /health answers (and, with ``mqtt``, reports an MQTT connection)"""
+    deadline = time.monotonic() + timeout
+    async with aiohttp.ClientSession() as session:
+        while time.monotonic() < deadline:
+            try:
+                async with session.get(f"{url}/health") as resp:
+                    if resp.status == 200 and (not mqtt or (await resp.json())["mqtt_connected"]):
+                        return
+            except aiohttp.ClientError:
+                pass
+            await asyncio.sleep(0.2)
+    raise RuntimeError(f"server at {url} did not become healthy")
+
+
+async def connect_clients(url, count, concurrency, on_update):
+    """Connect ``count`` Socket.IO clients; ``on_update(index, data)`` gets their "update" events"""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def connect_one(index):
+        sio = socketio.AsyncClient(reconnection=False)
+        sio.on("update", lambda data: on_update(index, data))
+        async with semaphore:
+            try:
+                await sio.connect(url, transports=["websocket"], wait_timeout=30)
+            except Exception:
+                return None
+        return sio
+
+    clients = await asyncio.gather(*(connect_one(index) for index in range(count)))
+    return [sio for sio in clients if sio is not None]
+
+
+async def disconnect_clients(clients):
+    await asyncio.gather(*(sio.disconnect() for sio in clients), return_exceptions=True)
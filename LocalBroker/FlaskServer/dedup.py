@@ -0,0 +1,154 @@
+import threading
+import time
+from collections import OrderedDict, deque
+
+from metrics import Counter
+
+
+class RecentKeys:
+    """Keys with the time they were last seen, expiring after ``ttl`` seconds.
+
+    Insertions are filed into time buckets of ``ttl / buckets`` seconds, so
+    expiry drops whole buckets from the front instead of scanning every key.
+    Memory is bounded by ``max_entries``: past it, the oldest bucket is
+    dropped even if it has not expired yet (least recently seen first).
+    Times must come from one clock; if it goes backwards (a band rebooted)
+    everything is forgotten.
+    """
+
+    def __init__(self, ttl, max_entries=10000, buckets=16):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.bucket = max(ttl / buckets, 0.001)
+        self._last = {}
+        self._buckets = deque()  # (bucket number, [keys added in it])
+        self._refs = 0
+
+    def __len__(self):
+        return len(self._last)
+
+    def last_seen(self, key, now):
+        """Time ``key`` was last added, or None if unknown or expired"""
+        self._expire(now)
+        seen = self._last.get(key)
+        if seen is None or now - seen >= self.ttl:
+            return None
+        return seen
+
+    def add(self, key, now):
+        number = int(now // self.bucket)
+        if self._buckets and number < self._buckets[-1][0]:
+            self.clear()
+        self._last[key] = now
+        if not self._buckets or self._buckets[-1][0] != number:
+            self._buckets.append((number, []))
+        self._buckets[-1][1].append(key)
+        self._refs += 1
+        while self._refs > self.max_entries and self._buckets:
+            self._drop_oldest()
+
+    def clear(self):
+        self._last.clear()
+        self._buckets.clear()
+        self._refs = 0
+
+    def _expire(self, now):
+        horizon = int((now - self.ttl) // self.bucket)
+        while self._buckets and self._buckets[0][0] < horizon:
+            self._drop_oldest()
+
+    def _drop_oldest(self):
+        number, keys = self._buckets.popleft()
+        self._refs -= len(keys)
+        end = (number + 1) * self.bucket
+        for key in keys:
+            seen = self._last.get(key)
+            # Keys seen again later are still referenced by a newer bucket
+            if seen is not None and seen < end:
+                del self._last[key]
+
+
+class GestureDeduplicator:
+    """Drops repeated gesture events before they reach the toggle engine.
+
+    A band that recognizes one gesture twice sends two True payloads, which
+    would flip the device on and straight back off. ``check`` rejects:
+
+      * "duplicate": an event ID already seen from the same band within
+        ``id_ttl`` seconds, e.g. a batch the band retried after a timeout
+      * "debounced": a symbol already toggled by the same band less than
+        ``window`` seconds earlier
+
+    Events without a band share one debounce slot per symbol. ``window=0``
+    disables debouncing and ``id_ttl=0`` the event-ID check. Suppressed
+    events are counted by reason in ``suppressed``.
+
+    Each band that sends its own timestamps gets its own debounce table.
+    A table is dropped once its band has been quiet for ``window`` seconds
+    (everything in it has expired), and past ``max_clocks`` tables the
+    least recently used one goes, so memory stays bounded however many
+    band IDs clients make up.
+    """
+
+    def __init__(self, window=0.3, id_ttl=60.0, max_entries=10000, max_clocks=1024):
+        self.window = window
+        self.id_ttl = id_ttl
+        self.max_entries = max_entries
+        self.max_clocks = max_clocks
+        # One table per clock, least recently used first: clock -> [RecentKeys, last use on the server clock]
+        self._recent = OrderedDict()
+        self._ids = RecentKeys(id_ttl, max_entries) if id_ttl > 0 else None
+        self._lock = threading.Lock()
+        self.suppressed = Counter()
+
+    def check(self, band, symbol_id, event_id=None, at=None, clock="server"):
+        """Return None to accept the event (and remember it) or the reason it was dropped
+
+        ``at`` is the event time on ``clock``; by default the arrival time on
+        the server's monotonic clock. Times from different clocks (e.g. a
+        band's own timestamps) are never compared with each other.
+        """
+        now = time.monotonic()
+        if at is None:
+            at, clock = now, "server"
+        with self._lock:
+            if self._ids is not None and event_id is not None:
+                id_key = (band, event_id, symbol_id)
+                if self._ids.last_seen(id_key, now) is not None:
+                    self.suppressed.inc("duplicate")
+                    return "duplicate"
+                self._ids.add(id_key, now)
+
+            if self.window > 0:
+                recent = self._clock_table(clock, now)
+                key = (band, symbol_id)
+                last = recent.last_seen(key, at)
+                if last is not None and 0 <= at - last < self.window:
+                    self.suppressed.inc("debounced")
+                    return "debounced"
+                recent.add(key, at)
+        return None
+
+    def _clock_table(self, clock, now):
+        """The debounce table for ``clock``, marked as just used; forgets idle and excess clocks"""
+        entry = self._recent.pop(clock, None)
+        while self._recent:
+            oldest, (_, used) = next(iter(self._recent.items()))
+            if now - used < self.window and len(self._recent) < self.max_clocks:
+                break
+            del self._recent[oldest]
+        if entry is None:
+            entry = [RecentKeys(self.window, self.max_entries), now]
+        entry[1] = now
+        self._recent[clock] = entry
+        return entry[0]
+
+    def metrics(self):
+        with self._lock:
+            return {
+                "window": self.window,
+                "tracked_clocks": len(self._recent),
+                "tracked_symbols": sum(len(recent) for recent, _ in self._recent.values()),
+                "tracked_ids": len(self._ids) if self._ids is not None else 0,
+                "suppressed": self.suppressed.values(),
+            }
@@ -0,0 +1,203 @@
+"""Minimal in-process MQTT 3.1.1 broker for benchmarks and local testing.
+
+Supports just what the FlickNest server, bands and devices use: CONNECT,
+SUBSCRIBE (exact topics and a trailing "#" wildcard), PUBLISH at QoS 0/1
+(forwarded to subscribers at QoS 0), PINGREQ and DISCONNECT. No retained
+messages, sessions or authentication.
+
+    python fake_mqtt_broker.py --port 1883
+"""
+import argparse
+import socket
+import struct
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+CONNECT, CONNACK, PUBLISH, PUBACK, SUBSCRIBE, SUBACK = 1, 2, 3, 4, 8, 9
+UNSUBSCRIBE, UNSUBACK, PINGREQ, PINGRESP, DISCONNECT = 10, 11, 12, 13, 14
+
+
+def _recv_exact(sock, size):
+    data = b""
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise ConnectionError("client closed connection")
+        data += chunk
+    return data
+
+
+def _read_remaining_length(sock):
+    multiplier, value = 1, 0
+    while True:
+        byte = _recv_exact(sock, 1)[0]
+        value += (byte & 0x7F) * multiplier
+        if not byte & 0x80:
+            return value
+        multiplier *= 128
+
+
+def _encode_remaining_length(length):
+    encoded = bytearray()
+    while True:
+        digit, length = length % 128, length // 128
+        encoded.append(digit | (0x80 if length else 0))
+        if not length:
+            return bytes(encoded)
+
+
+def _packet(packet_type, body, flags=0):
+    return bytes([(packet_type << 4) | flags]) + _encode_remaining_length(len(body)) + body
+
+
+def _read_string(body, offset):
+    length = struct.unpack_from("!H", body, offset)[0]
+    return body[offset + 2:offset + 2 + length].decode(), offset + 2 + length
+
+
+def topic_matches(pattern, topic):
+    if pattern == topic or pattern == "#":
+        return True
+    return pattern.endswith("/#") and (topic == pattern[:-2] or topic.startswith(pattern[:-1]))
+
+
+class FakeMqttBroker:
+    """Thread-per-connection MQTT broker listening on ``host:port`` (0 picks a free port)"""
+
+    def __init__(self, host="127.0.0.1", port=0):
+        self._server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._server.bind((host, port))
+        self.host, self.port = self._server.getsockname()
+        self._lock = threading.Lock()
+        self._connections = {}
+        self._running = False
+
+        self.received = 0
+        self.forwarded = 0
+
+    def start(self):
+        self._server.listen(256)
+        self._running = True
+        threading.Thread(target=self._accept_loop, name="fake-mqtt-accept", daemon=True).start()
+        return self
+
+    def stop(self):
+        self._running = False
+        self._server.close()
+        self.disconnect_all()
+
+    def disconnect_all(self):
+        """Drop every client connection, e.g. to simulate a broker blip"""
+        with self._lock:
+            connections = list(self._connections)
+            self._connections.clear()
+        for conn in connections:
+            try:
+                conn.shutdown(socket.SHUT_RDWR)
+                conn.close()
+            except OSError:
+                pass
+
+    def _accept_loop(self):
+        while self._running:
+            try:
+                conn, _ = self._server.accept()
+            except OSError:
+                return
+            conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            with self._lock:
+                self._connections[conn] = (set(), threading.Lock())
+            threading.Thread(target=self._serve, args=(conn,), daemon=True).start()
+
+    def _send(self, conn, data):
+        with self._lock:
+            entry = self._connections.get(conn)
+        if entry is None:
+            return
+        with entry[1]:
+            conn.sendall(data)
+
+    def _publish(self, topic, payload):
+        body = struct.pack("!H", len(topic.encode())) + topic.encode() + payload
+        packet = _packet(PUBLISH, body)
+        with self._lock:
+            targets = [conn for conn, (patterns, _) in self._connections.items()
+                       if any(topic_matches(pattern, topic) for pattern in patterns)]
+        for conn in targets:
+            try:
+                self._send(conn, packet)
+                self.forwarded += 1
+            except OSError:
+                pass
+
+    def _serve(self, conn):
+        try:
+            while True:
+                header = _recv_exact(conn, 1)[0]
+                body = _recv_exact(conn, _read_remaining_length(conn))
+                packet_type, flags = header >> 4, header & 0x0F
+
+                if packet_type == CONNECT:
+                    self._send(conn, _packet(CONNACK, b"\x00\x00"))
+                elif packet_type == PUBLISH:
+                    qos = (flags >> 1) & 0x03
+                    topic, offset = _read_string(body, 0)
+                    if qos:
+                        packet_id = body[offset:offset + 2]
+                        offset += 2
+                        self._send(conn, _packet(PUBACK, packet_id))
+                    self.received += 1
+                    self._publish(topic, body[offset:])
+                elif packet_type == SUBSCRIBE:
+                    packet_id, offset, granted = body[:2], 2, bytearray()
+                    with self._lock:
+                        patterns = self._connections[conn][0]
+                    while offset < len(body):
+                        topic, offset = _read_string(body, offset)
+                        offset += 1  # requested QoS
+                        patterns.add(topic)
+                        granted.append(0)
+                    self._send(conn, _packet(SUBACK, packet_id + bytes(granted)))
+                elif packet_type == UNSUBSCRIBE:
+                    packet_id, offset = body[:2], 2
+                    with self._lock:
+                        patterns = self._connections[conn][0]
+                    while offset < len(body):
+                        topic, offset = _read_string(body, offset)
+                        patterns.discard(topic)
+                    self._send(conn, _packet(UNSUBACK, packet_id))
+                elif packet_type == PINGREQ:
+                    self._send(conn, _packet(PINGRESP, b""))
+                elif packet_type == DISCONNECT:
+                    break
+        except (ConnectionError, OSError, KeyError):
+            pass
+        finally:
+            with self._lock:
+                self._connections.pop(conn, None)
+            try:
+                conn.close()
+            except OSError:
+                pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=1883)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    broker = FakeMqttBroker(args.host, args.port).start()
+    logger.info(f"Fake MQTT broker listening on {broker.host}:{broker.port}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        broker.stop()
+
+
+if __name__ == "__main__":
+    main()
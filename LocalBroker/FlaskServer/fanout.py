@@ -0,0 +1,225 @@
+import threading
+import time
+import logging
+from collections import deque
+from contextlib import contextmanager
+
+from metrics import Histogram
+
+logger = logging.getLogger(__name__)
+
+# Socket.IO room holding clients that never subscribed; they keep receiving
+# the original single-symbol "update" event for every change
+LEGACY_ROOM = "legacy"
+
+
+class DeltaFanout:
+    """Coalesces symbol changes and fans them out to subscribed WebSocket clients.
+
+    Changes recorded within one ``window`` are merged per symbol and sent as
+    a single versioned delta ``{"seq": n, "symbols": {id: data}}``. Each
+    subscribed client only receives the symbols (or rooms) it asked for, and
+    clients whose subscriptions match the same changes share one emit. The
+    last ``history_size`` deltas are kept so a reconnecting client can resync
+    from its last seen ``seq`` instead of pulling the full snapshot.
+    """
+
+    def __init__(self, socketio, store, window=0.05, history_size=1000):
+        self.socketio = socketio
+        self.store = store
+        self.window = window
+
+        self._lock = threading.Lock()
+        # Held from assigning a delta's seq until it is emitted, so deltas go out in seq order
+        self._emit_lock = threading.Lock()
+        self._local = threading.local()
+        self._pending = {}
+        self._seq = 0
+        self._history = deque(maxlen=history_size)
+        self._clients = {}
+        self._by_symbol = {}
+        self._by_room = {}
+        self._running = False
+
+        self.deltas = 0
+        self.emits = 0
+        self.coalesced = 0
+        # Time from a change's received_at (or record time) to its emit
+        self.emit_latency = Histogram()
+
+    @property
+    def seq(self):
+        return self._seq
+
+    def start(self):
+        """Start the coalescing loop (no-op when ``window`` is 0)"""
+        if self.window <= 0 or self._running:
+            return
+        self._running = True
+        self.socketio.start_background_task(self._run)
+
+    def stop(self):
+        self._running = False
+        self.flush()
+
+    def record(self, symbol_id, symbol_data, received_at=None):
+        """Queue a change; used as a ToggleEngine listener"""
+        if received_at is None:
+            received_at = time.monotonic()
+        if getattr(self._local, "depth", 0):
+            # Inside this thread's batch(): kept apart until the batch ends
+            self._merge(self._local.pending, symbol_id, symbol_data, received_at)
+            return
+        with self._lock:
+            self._merge(self._pending, symbol_id, symbol_data, received_at)
+        if self.window <= 0:
+            self.flush()
+
+    def _merge(self, pending, symbol_id, symbol_data, received_at):
+        previous = pending.get(symbol_id)
+        if previous is not None:
+            self.coalesced += 1
+            # Latency is measured from the oldest change merged into the delta
+            received_at = min(received_at, previous[1])
+        pending[symbol_id] = (symbol_data, received_at)
+
+    @contextmanager
+    def batch(self):
+        """Hold back this thread's changes until the block ends, then send them as one delta
+
+        Only the calling thread is held; other threads' changes go out as usual.
+        """
+        depth = getattr(self._local, "depth", 0)
+        if depth == 0:
+            self._local.pending = {}
+        self._local.depth = depth + 1
+        try:
+            yield self
+        finally:
+            self._local.depth -= 1
+            if self._local.depth == 0:
+                held, self._local.pending = self._local.pending, {}
+                with self._lock:
+                    for symbol_id, (symbol_data, received_at) in held.items():
+                        self._merge(self._pending, symbol_id, symbol_data, received_at)
+                self.flush()
+
+    def subscribe(self, sid, symbols=(), rooms=(), since=None):
+        """Set a client's subscriptions and return ``(event, payload)`` to resync it"""
+        with self._lock:
+            self._remove_locked(sid)
+            symbols, rooms = frozenset(symbols), frozenset(rooms)
+            self._clients[sid] = (symbols, rooms)
+            for symbol_id in symbols:
+                self._by_symbol.setdefault(symbol_id, set()).add(sid)
+            for room in rooms:
+                self._by_room.setdefault(room, set()).add(sid)
+
+            if since is not None and self._can_resync_locked(since):
+                changes = {}
+                for seq, delta in self._history:
+                    if seq > since:
+                        changes.update(delta)
+                return "delta", {"seq": self._seq, "symbols": self._filter(changes, symbols, rooms)}
+            seq = self._seq
+
+        return "snapshot", {"seq": seq, "symbols": self._filter(self.store.get_all(), symbols, rooms)}
+
+    def remove(self, sid):
+        with self._lock:
+            self._remove_locked(sid)
+
+    def metrics(self):
+        with self._lock:
+            return {
+                "seq": self._seq,
+                "pending": len(self._pending),
+                "subscribed_clients": len(self._clients),
+                "deltas": self.deltas,
+                "emits": self.emits,
+                "coalesced": self.coalesced,
+            }
+
+    def flush(self):
+        """Emit everything recorded since the last flush"""
+        with self._emit_lock:
+            self._flush_in_order()
+
+    def _flush_in_order(self):
+        with self._lock:
+            if not self._pending:
+                return
+            self._seq += 1
+            seq = self._seq
+            changes = {
+                symbol_id: {**symbol_data, "version": seq}
+                for symbol_id, (symbol_data, _) in self._pending.items()
+            }
+            received = [received_at for _, received_at in self._pending.values()]
+            self._pending = {}
+            self._history.append((seq, changes))
+            self.deltas += 1
+
+            # Group subscribers by the exact set of changed symbols they should see
+            per_client = {}
+            for symbol_id, symbol_data in changes.items():
+                sids = set(self._by_symbol.get(symbol_id, ()))
+                room = symbol_data.get("room")
+                if room is not None:
+                    sids |= self._by_room.get(room, set())
+                for sid in sids:
+                    per_client.setdefault(sid, []).append(symbol_id)
+            groups = {}
+            for sid, symbol_ids in per_client.items():
+                groups.setdefault(tuple(sorted(symbol_ids)), []).append(sid)
+
+        for symbol_id, symbol_data in changes.items():
+            self.socketio.emit("update", {symbol_id: symbol_data}, to=LEGACY_ROOM)
+            self.emits += 1
+        for symbol_ids, sids in groups.items():
+            payload = {"seq": seq, "symbols": {symbol_id: changes[symbol_id] for symbol_id in symbol_ids}}
+            self.socketio.emit("delta", payload, to=sids)
+            self.emits += 1
+
+        emitted_at = time.monotonic()
+        for received_at in received:
+            self.emit_latency.observe(emitted_at - received_at)
+
+    def _run(self):
+        while self._running:
+            self.socketio.sleep(self.window)
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Error emitting symbol deltas: {e}")
+
+    def _can_resync_locked(self, since):
+        if since > self._seq:
+            # Client saw a seq from before a server restart
+            return False
+        if since == self._seq:
+            return True
+        return bool(self._history) and self._history[0][0] <= since + 1
+
+    def _remove_locked(self, sid):
+        symbols, rooms = self._clients.pop(sid, ((), ()))
+        for symbol_id in symbols:
+            self._discard(self._by_symbol, symbol_id, sid)
+        for room in rooms:
+            self._discard(self._by_room, room, sid)
+
+    @staticmethod
+    def _discard(index, key, sid):
+        sids = index.get(key)
+        if sids is not None:
+            sids.discard(sid)
+            if not sids:
+                del index[key]
+
+    @staticmethod
+    def _filter(symbols_data, symbols, rooms):
+        return {
+            symbol_id: symbol_data
+            for symbol_id, symbol_data in symbols_data.items()
+            if symbol_id in symbols or symbol_data.get("room") in rooms
+        }
@@ -0,0 +1,107 @@
+import bisect
+import threading
+
+# Latency buckets in seconds, from sub-millisecond up to a minute
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+class Histogram:
+    """Cumulative-bucket histogram of observed durations (seconds)"""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._sum = 0.0
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[index] += 1
+            self._sum += value
+            self._count += 1
+
+    def snapshot(self):
+        """Return count, sum and cumulative bucket counts keyed by upper bound"""
+        with self._lock:
+            counts = list(self._counts)
+            total, count = self._sum, self._count
+
+        cumulative = {}
+        running = 0
+        for bound, bucket_count in zip(self.buckets, counts):
+            running += bucket_count
+            cumulative[format(bound, "g")] = running
+        cumulative["+Inf"] = count
+        return {"count": count, "sum": total, "buckets": cumulative}
+
+
+class Counter:
+    """Monotonic counter, optionally split by one label value"""
+
+    def __init__(self):
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, label=None, amount=1):
+        with self._lock:
+            self._values[label] = self._values.get(label, 0) + amount
+
+    def values(self):
+        with self._lock:
+            return dict(self._values)
+
+
+class Registry:
+    """Named metrics rendered in the Prometheus text exposition format.
+
+    Histograms are the objects components already update; counters and
+    gauges are read through callables returning a number, or a dict of
+    ``{label_value: number}`` when a ``label`` name is given.
+    """
+
+    def __init__(self):
+        self._metrics = []
+
+    def histogram(self, name, help_text, histogram=None):
+        histogram = histogram if histogram is not None else Histogram()
+        self._metrics.append((name, "histogram", help_text, histogram, None))
+        return histogram
+
+    def counter(self, name, help_text, value_fn, label=None):
+        self._metrics.append((name, "counter", help_text, value_fn, label))
+
+    def gauge(self, name, help_text, value_fn, label=None):
+        self._metrics.append((name, "gauge", help_text, value_fn, label))
+
+    def render(self):
+        lines = []
+        for name, kind, help_text, source, label in self._metrics:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            if kind == "histogram":
+                snapshot = source.snapshot()
+                for bound, count in snapshot["buckets"].items():
+                    lines.append(f'{name}_bucket{{le="{bound}"}} {count}')
+                lines.append(f"{name}_sum {snapshot['sum']}")
+                lines.append(f"{name}_count {snapshot['count']}")
+                continue
+
+            try:
+                value = source()
+            except Exception:
+                continue
+            if isinstance(value, dict):
+                for label_value, number in value.items():
+                    if label_value is None:
+                        lines.append(f"{name} {_number(number)}")
+                    else:
+                        lines.append(f'{name}{{{label}="{label_value}"}} {_number(number)}')
+            else:
+                lines.append(f"{name} {_number(value)}")
+        return "\n".join(lines) + "\n"
+
+
+def _number(value):
+    return int(value) if isinstance(value, bool) else value
@@ -0,0 +1,147 @@
+import random
+import threading
+import time
+import logging
+
+import paho.mqtt.client as mqtt
+
+from metrics import Histogram
+
+logger = logging.getLogger(__name__)
+
+
+class MqttConnectionManager:
+    """Owns the MQTT client's network loop and reconnects it on disconnect.
+
+    A single supervisor thread connects, runs ``client.loop()`` until the
+    connection drops and then retries with jittered exponential backoff, so
+    no other thread ever touches the socket. Subscriptions are replayed on
+    every successful connect, and the time from disconnect to reconnect is
+    recorded in ``reconnect_latency``.
+    """
+
+    def __init__(self, client, host, port, keepalive=60, min_backoff=0.5, max_backoff=30.0,
+                 on_connected=None, on_disconnected=None):
+        self.client = client
+        self.host = host
+        self.port = port
+        self.keepalive = keepalive
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self.on_connected = on_connected
+        self.on_disconnected = on_disconnected
+
+        self._subscriptions = {}
+        self._connected = False
+        self._attempt = 0
+        self._disconnected_at = None
+        self._stop = threading.Event()
+        self._thread = None
+
+        self.connects = 0
+        self.failed_attempts = 0
+        self.reconnect_latency = Histogram()
+
+        client.on_connect = self._on_connect
+        client.on_disconnect = self._on_disconnect
+
+    @property
+    def connected(self):
+        return self._connected
+
+    def subscribe(self, topic, qos=0):
+        """Subscribe now if connected and again after every reconnect"""
+        self._subscriptions[topic] = qos
+        if self._connected:
+            self.client.subscribe(topic, qos)
+
+    def start(self):
+        """Start the supervisor thread"""
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="mqtt-connection", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        try:
+            self.client.disconnect()
+        except Exception:
+            pass
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def metrics(self):
+        return {
+            "connected": self._connected,
+            "connects": self.connects,
+            "failed_attempts": self.failed_attempts,
+            "reconnect_latency_seconds": self.reconnect_latency.snapshot(),
+        }
+
+    def next_backoff(self):
+        """Delay before the next attempt: exponential in the attempt number, with jitter"""
+        delay = min(self.max_backoff, self.min_backoff * (2 ** self._attempt))
+        return random.uniform(delay / 2, delay)
+
+    def _run(self):
+        first = True
+        while not self._stop.is_set():
+            try:
+                if first:
+                    logger.info(f"Connecting to MQTT broker at {self.host}:{self.port}")
+                    self.client.connect(self.host, self.port, self.keepalive)
+                else:
+                    logger.info("Attempting MQTT reconnection...")
+                    self.client.reconnect()
+                first = False
+
+                # Runs callbacks (connect, message, disconnect) on this thread
+                while not self._stop.is_set():
+                    rc = self.client.loop(timeout=1.0)
+                    if rc != mqtt.MQTT_ERR_SUCCESS:
+                        break
+            except Exception as e:
+                logger.error(f"MQTT connection failed: {e}")
+
+            if self._stop.is_set():
+                break
+
+            if self._connected:
+                # loop() failed without on_disconnect being called
+                self._on_disconnect(self.client, None, mqtt.MQTT_ERR_CONN_LOST)
+
+            self.failed_attempts += 1
+            delay = self.next_backoff()
+            self._attempt += 1
+            logger.info(f"MQTT retrying in {delay:.2f}s")
+            self._stop.wait(delay)
+
+    def _on_connect(self, client, userdata, flags, rc):
+        if rc == 0:
+            self._connected = True
+            self._attempt = 0
+            self.connects += 1
+            if self._disconnected_at is not None:
+                latency = time.monotonic() - self._disconnected_at
+                self.reconnect_latency.observe(latency)
+                logger.info(f"MQTT reconnected after {latency:.2f}s")
+                self._disconnected_at = None
+
+            for topic, qos in self._subscriptions.items():
+                client.subscribe(topic, qos)
+                logger.info(f"Subscribed to topic: {topic}")
+
+        if self.on_connected:
+            self.on_connected(client, userdata, flags, rc)
+
+    def _on_disconnect(self, client, userdata, rc):
+        was_connected = self._connected
+        self._connected = False
+        if was_connected and self._disconnected_at is None:
+            self._disconnected_at = time.monotonic()
+
+        if self.on_disconnected:
+            self.on_disconnected(client, userdata, rc)
@@ -0,0 +1,154 @@
+import json
+import threading
+import time
+import logging
+from collections import OrderedDict
+
+import paho.mqtt.client as mqtt
+
+from metrics import Histogram
+
+logger = logging.getLogger(__name__)
+
+
+class MqttPublisher:
+    """Outbound MQTT queue drained by a dedicated worker thread.
+
+    ``publish`` only enqueues and returns immediately. Messages sharing a
+    coalescing key (e.g. the symbol ID) replace each other while still
+    pending, so a device only receives the latest command. While the broker
+    is disconnected messages stay buffered; once ``max_pending`` is reached
+    the oldest pending message is dropped.
+    """
+
+    def __init__(self, qos=0, max_pending=1000, batch_size=100):
+        self.qos = qos
+        self.max_pending = max_pending
+        self.batch_size = batch_size
+
+        self._client = None
+        self._connected = False
+        self._pending = OrderedDict()
+        self._cond = threading.Condition()
+        self._next_id = 0
+        self._stop = False
+        self._thread = None
+
+        self.published = 0
+        self.coalesced = 0
+        self.dropped = 0
+        self.failed = 0
+        # Time from publish() to the message being handed to the client
+        self.publish_latency = Histogram()
+
+    def set_client(self, client):
+        with self._cond:
+            self._client = client
+            self._cond.notify()
+
+    def set_connected(self, connected):
+        """Called from the MQTT connect/disconnect callbacks"""
+        with self._cond:
+            self._connected = connected
+            self._cond.notify()
+
+    def start(self):
+        """Start the publish worker thread"""
+        if self._thread is not None:
+            return
+        self._stop = False
+        self._thread = threading.Thread(target=self._run, name="mqtt-publisher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        with self._cond:
+            self._stop = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def publish(self, topic, message, key=None, qos=None):
+        """Queue ``message`` (JSON-serialized by the worker) for ``topic``"""
+        with self._cond:
+            if key is None:
+                key = ("_", self._next_id)
+                self._next_id += 1
+            else:
+                key = (topic, key)
+
+            if key in self._pending:
+                # Keep the original queue position, send only the newest command
+                self.coalesced += 1
+            elif len(self._pending) >= self.max_pending:
+                self._pending.popitem(last=False)
+                self.dropped += 1
+                logger.warning("MQTT publish queue full, dropped oldest message")
+
+            self._pending[key] = (topic, message, self.qos if qos is None else qos, time.monotonic())
+            self._cond.notify()
+
+    def metrics(self):
+        """Queue depth and counters for /health"""
+        with self._cond:
+            return {
+                "depth": len(self._pending),
+                "max_pending": self.max_pending,
+                "connected": self._connected,
+                "published": self.published,
+                "coalesced": self.coalesced,
+                "dropped": self.dropped,
+                "failed": self.failed,
+            }
+
+    def _take_batch(self):
+        with self._cond:
+            while not self._stop and not (self._pending and self._connected and self._client):
+                self._cond.wait()
+            if self._stop:
+                return None
+            batch = []
+            while self._pending and len(batch) < self.batch_size:
+                batch.append(self._pending.popitem(last=False))
+            return self._client, batch
+
+    def _requeue(self, items):
+        """Put unsent messages back at the front unless a newer one is pending"""
+        with self._cond:
+            for key, item in reversed(items):
+                if key not in self._pending:
+                    self._pending[key] = item
+                    self._pending.move_to_end(key, last=False)
+            while len(self._pending) > self.max_pending:
+                self._pending.popitem(last=True)
+                self.dropped += 1
+
+    def _run(self):
+        while True:
+            taken = self._take_batch()
+            if taken is None:
+                return
+            client, batch = taken
+
+            for index, (key, (topic, message, qos, enqueued_at)) in enumerate(batch):
+                try:
+                    info = client.publish(topic, json.dumps(message), qos=qos)
+                    rc = info.rc
+                except Exception as e:
+                    logger.error(f"Error publishing to MQTT: {e}")
+                    rc = mqtt.MQTT_ERR_UNKNOWN
+
+                if rc == mqtt.MQTT_ERR_SUCCESS:
+                    self.published += 1
+                    self.publish_latency.observe(time.monotonic() - enqueued_at)
+                    logger.debug(f"Published to MQTT {topic}: {message} "
+                                 f"({(time.monotonic() - enqueued_at) * 1000:.1f} ms in queue)")
+                    continue
+
+                self.failed += 1
+                if rc == mqtt.MQTT_ERR_NO_CONN:
+                    # Broker went away mid-batch: keep the rest for the reconnect
+                    self.set_connected(False)
+                    self._requeue(batch[index:])
+                    break
+                logger.error(f"MQTT publish to {topic} failed with code {rc}")
@@ -0,0 +1,157 @@
+import json
+import os
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def _encode_state(key, state):
+    return {key: state}
+
+
+def _encode_on_off(key, state):
+    return {key: "on" if state else "off"}
+
+
+# How a target turns a symbol state into its MQTT message
+ACTIONS = {
+    "state": _encode_state,
+    "on_off": _encode_on_off,
+}
+
+
+class Target:
+    """One device topic a symbol is published to"""
+
+    __slots__ = ("topic", "key", "encode")
+
+    def __init__(self, topic, key=None, action="state"):
+        if action not in ACTIONS:
+            raise ValueError(f"Unknown action '{action}' for topic {topic}")
+        self.topic = topic
+        self.key = key
+        self.encode = ACTIONS[action]
+
+    def message(self, symbol_name, state):
+        return self.encode(self.key or symbol_name, state)
+
+
+class Route:
+    """A gesture symbol and the device topics it drives"""
+
+    __slots__ = ("name", "symbol_id", "targets")
+
+    def __init__(self, name, symbol_id, targets):
+        self.name = name
+        self.symbol_id = symbol_id
+        self.targets = targets
+
+
+class RoutingTable:
+    """Gesture name -> symbol ID -> device topics, compiled for O(1) dispatch.
+
+    Loaded from a JSON file such as::
+
+        {
+          "default_targets": [{"topic": "esp/control"}],
+          "symbols": {
+            "circle": {"id": "sym_001"},
+            "wave": {"id": "sym_002", "targets": [{"topic": "home/living/lamp", "action": "on_off"}]}
+          }
+        }
+
+    Name lookups are precomputed for the common spellings (as configured,
+    lower, upper and capitalized), so routing a message is a dict lookup.
+    Symbols without their own targets use ``default_targets``.
+    """
+
+    def __init__(self, routes, default_targets):
+        self.default_targets = tuple(default_targets)
+        self.by_id = {}
+        self.by_name = {}
+        for route in routes:
+            if route.symbol_id in self.by_id:
+                raise ValueError(f"Symbol ID {route.symbol_id} is mapped more than once")
+            self.by_id[route.symbol_id] = route
+            for spelling in (route.name, route.name.lower(), route.name.upper(), route.name.capitalize()):
+                self.by_name.setdefault(spelling, route)
+
+    @classmethod
+    def from_dict(cls, config):
+        default_targets = tuple(Target(**target) for target in config.get("default_targets", []))
+        routes = []
+        for name, entry in config.get("symbols", {}).items():
+            if "targets" in entry:
+                targets = tuple(Target(**target) for target in entry["targets"])
+            else:
+                targets = default_targets
+            routes.append(Route(name, entry["id"], targets))
+        return cls(routes, default_targets)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "r") as f:
+            return cls.from_dict(json.load(f))
+
+    def resolve(self, name):
+        """Route for a gesture name, or None"""
+        route = self.by_name.get(name)
+        if route is None and isinstance(name, str):
+            # Unusual spelling: fall back to a case-insensitive match
+            route = self.by_name.get(name.lower())
+        return route
+
+    def targets_for(self, symbol_id):
+        route = self.by_id.get(symbol_id)
+        return route.targets if route else self.default_targets
+
+
+class RoutingTableWatcher:
+    """Holds the current RoutingTable and reloads it when the file changes.
+
+    A bad edit is logged and the previous table stays active.
+    """
+
+    def __init__(self, path, interval=2.0):
+        self.path = path
+        self.interval = interval
+        self.table = RoutingTable.load(path)
+        self._mtime = os.path.getmtime(path)
+        self._stop = threading.Event()
+        self._thread = None
+
+    def reload(self):
+        """Load and swap in the table; returns True on success"""
+        try:
+            self._mtime = os.path.getmtime(self.path)
+            table = RoutingTable.load(self.path)
+        except Exception as e:
+            # Not retried until the file changes again
+            logger.error(f"Error loading routing table {self.path}, keeping previous one: {e}")
+            return False
+        self.table = table
+        logger.info(f"Routing table loaded: {len(table.by_id)} symbols")
+        return True
+
+    def start(self):
+        if self.interval <= 0 or self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._watch, name="routing-watcher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _watch(self):
+        while not self._stop.wait(self.interval):
+            try:
+                changed = os.path.getmtime(self.path) != self._mtime
+            except OSError:
+                continue
+            if changed:
+                self.reload()
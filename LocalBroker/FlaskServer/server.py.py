@@ -1,81 +1,260 @@
+import os
+
+# Runtime: "threading" (thread per request) or "eventlet" (HTTP, Socket.IO and
+# MQTT share one event loop). Must be decided before anything else is imported.
+ASYNC_MODE = os.environ.get("BROKER_ASYNC_MODE", "threading")
+if ASYNC_MODE == "eventlet":
+    import eventlet
+    import eventlet.tpool
+    eventlet.monkey_patch()
+
 from flask import Flask, request, jsonify
-from flask_socketio import SocketIO, emit
+from flask_socketio import SocketIO, emit, join_room, leave_room
 import json
-import os
+import logging
 import threading
 import time
-import logging
 from datetime import datetime
 import paho.mqtt.client as mqtt
 from flask_cors  import CORS
 
+from dedup import GestureDeduplicator
+from fanout import DeltaFanout, LEGACY_ROOM
+from metrics import Counter, Registry
+from mqtt_connection import MqttConnectionManager
+from mqtt_publisher import MqttPublisher
+from routing import RoutingTableWatcher
+from sqlite_storage import SqliteStorage
+from symbol_store import JsonStorage, SymbolStore
+from symbols_cache import SymbolsCache, SymbolsQuery
+from toggle_engine import ToggleEngine
+
+# Per-message INFO logging (every request, gesture and publish, plus the
+# Socket.IO/Engine.IO packet logs). Set BROKER_LOG_MESSAGES=0 in production.
+LOG_MESSAGES = os.environ.get("BROKER_LOG_MESSAGES", "1") != "0"
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
-CORS(app)
+# Let browser dashboards read the /symbols paging and version headers
+CORS(app, expose_headers=["ETag", "X-Symbols-Version", "X-Total-Count", "X-Next-Offset"])
 app.config['SECRET_KEY'] = 'your-secret-key-here'
-socketio = SocketIO(app, cors_allowed_origins="*", logger=True, engineio_logger=True)
+socketio = SocketIO(app, async_mode=ASYNC_MODE, cors_allowed_origins="*",
+                    logger=LOG_MESSAGES, engineio_logger=LOG_MESSAGES)
 
 # Configuration
-DB_PATH = "db.json"
-MQTT_BROKER = "localhost"
+SERVER_HOST = "0.0.0.0"
+SERVER_PORT = int(os.environ.get("BROKER_PORT", 5000))
+DB_BACKEND = os.environ.get("BROKER_DB_BACKEND", "json")  # "json" (db.json) or "sqlite" (WAL, keeps event history)
+DB_PATH = os.environ.get("BROKER_DB_PATH", "db.json")
+DB_SQLITE_PATH = os.environ.get("BROKER_DB_SQLITE_PATH", "db.sqlite3")  # Imports DB_PATH when first created
+DB_FLUSH_INTERVAL = 0.5  # Seconds between write-behind flushes; 0 writes through on every change
+DB_FSYNC = False  # fsync each flush for durability across power loss
+MAX_EVENTS_PAGE = 1000
+MAX_SYMBOLS_PAGE = 1000  # Upper bound for GET /symbols?limit=
+ROUTES_PATH = os.environ.get("BROKER_ROUTES_PATH",
+                             os.path.join(os.path.dirname(os.path.abspath(__file__)), "routes.json"))
+ROUTES_RELOAD_INTERVAL = 2  # Seconds between checks for an edited routes file; 0 disables
+WS_COALESCE_WINDOW = 0.05  # Seconds of symbol changes merged into one WebSocket delta; 0 emits immediately
+WS_HISTORY_SIZE = 1000  # Deltas kept so reconnecting clients can resync from a sequence number
+GESTURE_DEBOUNCE_WINDOW = float(os.environ.get("BROKER_DEBOUNCE_WINDOW", 0.3))  # Seconds a band's repeat of a gesture is ignored; 0 disables
+GESTURE_ID_TTL = 60  # Seconds an event ID is remembered to drop retried uploads; 0 disables
+GESTURE_DEDUP_MAX_ENTRIES = 10000  # Bound on remembered gestures and event IDs
+BAND_TIMESTAMP_UNIT = 0.001  # Seconds per unit of a band's event "timestamp" (ESP32 millis())
+MQTT_BROKER = os.environ.get("BROKER_MQTT_HOST", "localhost")
 MQTT_TOPIC = "esp/data"
-MQTT_PORT = 1883
+MQTT_BATCH_TOPIC = "esp/data/batch"
+MAX_BATCH_EVENTS = 1000
+MQTT_PORT = int(os.environ.get("BROKER_MQTT_PORT", 1883))
 MQTT_KEEPALIVE = 60
+MQTT_RECONNECT_MIN_DELAY = 0.5  # Seconds; doubles on each failed attempt (with jitter)
+MQTT_RECONNECT_MAX_DELAY = 30
+MQTT_QOS = 1
+MQTT_PUBLISH_QUEUE_SIZE = 1000  # Messages buffered while the broker is unreachable
+
+def run_blocking(fn, *args):
+    """Run blocking file I/O off the event loop when one is in use"""
+    if ASYNC_MODE == "eventlet":
+        return eventlet.tpool.execute(fn, *args)
+    return fn(*args)
+
+def make_storage():
+    """Storage backend selected by DB_BACKEND"""
+    if DB_BACKEND == "sqlite":
+        return SqliteStorage(DB_SQLITE_PATH, import_path=DB_PATH,
+                             synchronous="FULL" if DB_FSYNC else "NORMAL")
+    if DB_BACKEND == "json":
+        return JsonStorage(DB_PATH, fsync=DB_FSYNC)
+    raise ValueError(f"Unknown BROKER_DB_BACKEND '{DB_BACKEND}'")
+
+# Authoritative in-memory symbol state, persisted by the storage backend in the background
+store = SymbolStore(make_storage(), flush_interval=DB_FLUSH_INTERVAL, run_io=run_blocking)
+
+# Serialized GET /symbols responses, dropped whenever a symbol changes
+symbols_cache = SymbolsCache(store)
+
+# Repeated gestures are dropped here, before they touch the store, fan-out or MQTT
+dedup = GestureDeduplicator(window=GESTURE_DEBOUNCE_WINDOW, id_ttl=GESTURE_ID_TTL,
+                            max_entries=GESTURE_DEDUP_MAX_ENTRIES)
 
-# Global MQTT client
+# Every symbol mutation (HTTP or MQTT) goes through the engine's per-symbol locks
+engine = ToggleEngine(store)
+
+# Event history (source, time, latency of each transition) for backends that keep it
+engine.add_listener(store.record_event)
+
+# Coalesced, per-subscription WebSocket updates
+fanout = DeltaFanout(socketio, store, window=WS_COALESCE_WINDOW, history_size=WS_HISTORY_SIZE)
+engine.add_listener(fanout.record)
+
+# Global MQTT client and the manager that owns its connection
 mqtt_client = None
+mqtt_manager = None
 mqtt_connected = False
 
-# Hardcoded name → ID map
-SYMBOL_NAME_TO_ID = {
-    "circle": "sym_001",
-    "wave": "sym_002",
-    "updown": "sym_003",
-    "double_tap": "sym_004",
-    "swipe_up": "sym_005",
-    "swipe_down": "sym_006",
-    "double_wave": "sym_007",
-    "flick": "sym_008",
-    "knock": "sym_009",
-    "clap": "sym_010",
-    "press": "sym_011",
-    "tilt": "sym_012",
-    "rotate": "sym_013",
-    "flip": "sym_014",
-    "tap": "sym_015",
-    "arise": "sym_016",
-    "rectangle": "sym_017",
-}
-
-
-def load_db():
-    """Load database from JSON file"""
-    try:
-        if not os.path.exists(DB_PATH):
-            logger.info(f"Database file {DB_PATH} not found, creating new one")
-            return {"symbols": {}}
-        
-        with open(DB_PATH, "r") as f:
-            data = json.load(f)
-            # Ensure symbols key exists
-            if "symbols" not in data:
-                data["symbols"] = {}
-            return data
-    except Exception as e:
-        logger.error(f"Error loading database: {e}")
-        return {"symbols": {}}
+# Outbound MQTT messages are queued and sent by a dedicated worker
+publisher = MqttPublisher(qos=MQTT_QOS, max_pending=MQTT_PUBLISH_QUEUE_SIZE)
+
+# Gesture name → symbol ID → device topics, reloaded when ROUTES_PATH changes
+routing = RoutingTableWatcher(ROUTES_PATH, interval=ROUTES_RELOAD_INTERVAL)
+
+# Prometheus metrics served on /metrics
+gestures_received = Counter()
+# Events in batches rejected for exceeding MAX_BATCH_EVENTS, by source
+batch_overflow = Counter()
+websocket_clients = 0
+websocket_clients_lock = threading.Lock()
+
+metrics = Registry()
+metrics.histogram("flicknest_gesture_to_emit_seconds",
+                  "Time from a gesture or PATCH arriving to its WebSocket emit", fanout.emit_latency)
+metrics.histogram("flicknest_db_load_seconds", "Time to load the symbol database", store.load_latency)
+metrics.histogram("flicknest_db_save_seconds", "Time to write changes to the symbol database", store.save_latency)
+metrics.histogram("flicknest_mqtt_publish_seconds",
+                  "Time from queueing an MQTT command to handing it to the client", publisher.publish_latency)
+metrics.counter("flicknest_gestures_total", "Gesture events received",
+                gestures_received.values, label="source")
+metrics.counter("flicknest_gestures_suppressed_total", "Gesture events dropped as repeats",
+                dedup.suppressed.values, label="reason")
+metrics.counter("flicknest_batch_events_rejected_total", "Gesture events in batches over MAX_BATCH_EVENTS",
+                batch_overflow.values, label="source")
+metrics.gauge("flicknest_mqtt_connected", "1 if connected to the MQTT broker", lambda: mqtt_connected)
+metrics.gauge("flicknest_mqtt_publish_queue_depth", "MQTT commands waiting to be sent",
+              lambda: publisher.metrics()["depth"])
+metrics.counter("flicknest_mqtt_published_total", "MQTT commands sent", lambda: publisher.published)
+metrics.counter("flicknest_mqtt_dropped_total", "MQTT commands dropped from a full queue",
+                lambda: publisher.dropped)
+metrics.gauge("flicknest_websocket_clients", "Connected Socket.IO clients", lambda: websocket_clients)
+metrics.gauge("flicknest_websocket_subscribed_clients", "Socket.IO clients with subscriptions",
+              lambda: fanout.metrics()["subscribed_clients"])
+metrics.gauge("flicknest_websocket_pending_symbols", "Symbol changes waiting for the next delta",
+              lambda: fanout.metrics()["pending"])
+metrics.counter("flicknest_symbols_cache_total", "GET /symbols responses by cache result",
+                lambda: {"hit": symbols_cache.hits, "miss": symbols_cache.misses}, label="result")
+metrics.counter("flicknest_websocket_emits_total", "Socket.IO emits for symbol updates",
+                lambda: fanout.emits)
+
+
+def find_true_symbol(data):
+    """Return the first key whose value is boolean True, or None"""
+    for key, value in data.items():
+        if isinstance(value, bool) and value:
+            return key
+    return None
+
+def toggle_gesture(symbol, received_at=None, band=None, event_id=None, timestamp=None):
+    """Toggle the device mapped to a gesture name; returns (symbol_id, data) or None
+
+    ``data`` is None when the gesture was dropped by the deduplicator.
+    ``timestamp`` is the band's own event time, used for debouncing when given.
+    """
+    route = routing.table.resolve(symbol)
+    if not route:
+        return None
+
+    if timestamp is None:
+        suppressed = dedup.check(band, route.symbol_id, event_id)
+    else:
+        suppressed = dedup.check(band, route.symbol_id, event_id,
+                                 at=timestamp * BAND_TIMESTAMP_UNIT, clock=("band", band))
+    if suppressed:
+        if LOG_MESSAGES:
+            logger.info(f"Ignored {symbol} from band {band}: {suppressed}")
+        return route.symbol_id, None
+
+    symbol_data = engine.toggle(route.symbol_id, source="broker", received_at=received_at)
+    return route.symbol_id, symbol_data
+
+def gesture_names(event):
+    """Gesture names in one event: {"symbol": "circle"} or the band's {"circle": true}"""
+    symbol = event.get("symbol")
+    if isinstance(symbol, str):
+        return [symbol]
+    return [key for key, value in event.items() if isinstance(value, bool) and value]
+
+def event_timestamp(event):
+    timestamp = event.get("timestamp") if isinstance(event, dict) else None
+    return timestamp if isinstance(timestamp, (int, float)) and not isinstance(timestamp, bool) else None
+
+def ingest_events(events, received_at=None):
+    """Apply a batch of gesture events and return one result per event
+
+    Events are applied in timestamp order (events without a timestamp after
+    the timestamped ones, in upload order). The whole batch costs one
+    database flush and one WebSocket delta.
+    """
+    order = sorted(range(len(events)), key=lambda i: (
+        event_timestamp(events[i]) is None, event_timestamp(events[i]) or 0, i))
+    results = [None] * len(events)
+
+    with store.batch(), fanout.batch():
+        for index in order:
+            event = events[index]
+            result = {"index": index}
+            results[index] = result
+            if not isinstance(event, dict):
+                result.update(status="invalid", error="Event must be an object")
+                continue
+            for field in ("id", "band", "timestamp"):
+                if field in event:
+                    result[field] = event[field]
+
+            names = gesture_names(event)
+            if not names:
+                result.update(status="invalid", error="No symbol in event")
+                continue
+
+            toggled, suppressed, unknown = [], [], []
+            for name in names:
+                toggle_result = toggle_gesture(name, received_at, band=event.get("band"),
+                                               event_id=event.get("id"), timestamp=event_timestamp(event))
+                if not toggle_result:
+                    unknown.append(name)
+                elif toggle_result[1] is None:
+                    suppressed.append(name)
+                else:
+                    symbol_id, symbol_data = toggle_result
+                    toggled.append({"symbol": symbol_id, "symbol_name": name, "new_state": symbol_data["state"]})
+            result["toggled"] = toggled
+            if suppressed:
+                result["suppressed"] = suppressed
+            if unknown:
+                result["unknown"] = unknown
+            if toggled:
+                result["status"] = "ok"
+            else:
+                result["status"] = "suppressed" if suppressed else "unknown_symbol"
+
+    return results
+
+def batch_events(data):
+    """Extract the event list from a batch body: a list or {"events": [...]}"""
+    if isinstance(data, dict):
+        data = data.get("events")
+    return data if isinstance(data, list) else None
 
-def save_db(data):
-    """Save database to JSON file"""
-    try:
-        with open(DB_PATH, "w") as f:
-            json.dump(data, f, indent=2)
-        logger.info("Database saved successfully")
-    except Exception as e:
-        logger.error(f"Error saving database: {e}")
 
 @app.route("/health", methods=["GET"])
 def health_check():
@@ -83,25 +262,88 @@ def health_check():
     return jsonify({
         "status": "healthy",
         "mqtt_connected": mqtt_connected,
+        "mqtt_publish_queue": publisher.metrics(),
+        "mqtt_connection": mqtt_manager.metrics() if mqtt_manager else None,
+        "websocket": fanout.metrics(),
+        "dedup": dedup.metrics(),
         "timestamp": datetime.now().isoformat()
     })
 
+@app.route("/metrics", methods=["GET"])
+def prometheus_metrics():
+    """Prometheus scrape endpoint"""
+    return metrics.render(), 200, {"Content-Type": "text/plain; version=0.0.4"}
+
+@app.route("/routes", methods=["GET"])
+def get_routes():
+    """Show the active routing table"""
+    table = routing.table
+    return jsonify({
+        route.name: {
+            "id": route.symbol_id,
+            "targets": [target.topic for target in route.targets],
+        }
+        for route in table.by_id.values()
+    })
+
+@app.route("/routes/reload", methods=["POST"])
+def reload_routes():
+    """Reload the routing table from ROUTES_PATH now"""
+    if not routing.reload():
+        return jsonify({"error": f"Could not load {ROUTES_PATH}, previous table kept"}), 500
+    return jsonify({"symbols": len(routing.table.by_id)})
+
 @app.route("/symbols", methods=["GET"])
 def get_all_symbols():
-    """Get all symbols"""
-    db = load_db()
-    return jsonify(db.get("symbols", {}))
+    """Get all symbols: ?since=<version>&offset=<n>&limit=<n>&fields=name,state, honors If-None-Match"""
+    try:
+        query = SymbolsQuery.from_args(request.args, max_limit=MAX_SYMBOLS_PAGE)
+    except ValueError as e:
+        return jsonify({"error": f"Invalid query: {e}"}), 400
+
+    # Unchanged since the client's copy: answer from the revision alone
+    revision = store.revision
+    if request.if_none_match.contains(SymbolsCache.etag(revision, query)):
+        response = app.response_class(status=304)
+    else:
+        page = symbols_cache.get(query)
+        revision = page.revision
+        response = app.response_class(page.body, mimetype="application/json")
+        response.headers["X-Total-Count"] = str(page.total)
+        if page.next_offset is not None:
+            response.headers["X-Next-Offset"] = str(page.next_offset)
+
+    response.set_etag(SymbolsCache.etag(revision, query))
+    # Pass back as ?since= to get only the symbols changed after this response
+    response.headers["X-Symbols-Version"] = str(revision)
+    response.headers["Cache-Control"] = "no-cache"
+    return response
+
+@app.route("/events", methods=["GET"])
+def get_events():
+    """Toggle history, newest first: ?symbol=<id>&since=<unix time>&limit=<n>"""
+    try:
+        since = request.args.get("since", type=float)
+        limit = min(request.args.get("limit", 100, type=int), MAX_EVENTS_PAGE)
+        events = store.history(request.args.get("symbol"), since, limit)
+    except Exception as e:
+        logger.error(f"Error reading event history: {e}")
+        return jsonify({"error": str(e)}), 500
+    if events is None:
+        return jsonify({"error": f"The {DB_BACKEND} storage backend keeps no event history"}), 501
+    return jsonify({"events": events})
 
 @app.route("/symbols/<symbol>", methods=["GET", "PATCH"])
 def handle_symbol(symbol):
     """Handle GET and PATCH requests for specific symbol"""
-    logger.info(f"Request for symbol: {symbol}, method: {request.method}")
-    
-    db = load_db()
+    received_at = time.monotonic()
+    if LOG_MESSAGES:
+        logger.info(f"Request for symbol: {symbol}, method: {request.method}")
     
     if request.method == "GET":
-        symbol_data = db["symbols"].get(symbol, {})
-        logger.info(f"GET {symbol}: {symbol_data}")
+        symbol_data = store.get(symbol)
+        if LOG_MESSAGES:
+            logger.info(f"GET {symbol}: {symbol_data}")
         return jsonify(symbol_data)
     
     elif request.method == "PATCH":
@@ -110,76 +352,84 @@ def handle_symbol(symbol):
             if not update_data:
                 return jsonify({"error": "No data provided"}), 400
             
-            logger.info(f"PATCH {symbol}: {update_data}")
+            if LOG_MESSAGES:
+                logger.info(f"PATCH {symbol}: {update_data}")
             
-            # Initialize symbol if it doesn't exist
-            if symbol not in db["symbols"]:
-                db["symbols"][symbol] = {}
+            # Update symbol data (created if it doesn't exist); the engine emits the update
+            symbol_data = engine.update(symbol, update_data, source="mobile", received_at=received_at)
+            symbol_name = symbol_data.get("name")
             
-            # Update symbol data
-            db["symbols"][symbol].update(update_data)
-            db["symbols"][symbol]["source"] = "mobile"
-            
-            save_db(db)
-            symbol_name = db["symbols"][symbol].get("name")
-            
-            state  = db["symbols"][symbol].get("state")
+            state  = symbol_data.get("state")
 
             publish_to_mqtt(symbol, symbol_name, state)
-            # Emit update via WebSocket
-            socketio.emit("update", {symbol: db["symbols"][symbol]})
             
-            return jsonify({symbol: db["symbols"][symbol]})
+            return jsonify({symbol: symbol_data})
             
         except Exception as e:
             logger.error(f"Error updating symbol {symbol}: {e}")
             return jsonify({"error": str(e)}), 500
 
+@app.route("/esp_upload/batch", methods=["POST"])
+def esp_upload_batch():
+    """Handle buffered gesture events from bands or gateways"""
+    received_at = time.monotonic()
+    try:
+        events = batch_events(request.get_json(silent=True))
+        if events is None:
+            return jsonify({"error": "Expected a list of events or {\"events\": [...]}"}), 400
+        if len(events) > MAX_BATCH_EVENTS:
+            batch_overflow.inc("http_batch", len(events))
+            logger.warning(f"Rejected ESP batch upload of {len(events)} events (limit {MAX_BATCH_EVENTS})")
+            return jsonify({"error": f"Batch exceeds {MAX_BATCH_EVENTS} events"}), 413
+
+        gestures_received.inc("http_batch", len(events))
+        results = ingest_events(events, received_at)
+        applied = sum(1 for result in results if result["status"] == "ok")
+        if LOG_MESSAGES:
+            logger.info(f"ESP batch upload: {applied}/{len(events)} events applied")
+        return jsonify({"applied": applied, "rejected": len(events) - applied, "results": results})
+    except Exception as e:
+        logger.error(f"Error in ESP batch upload: {e}")
+        return jsonify({"error": str(e)}), 500
+
 @app.route("/esp_upload", methods=["POST"])
 def esp_upload():
     """Handle ESP32 HTTP uploads"""
+    received_at = time.monotonic()
     try:
         data = request.get_json()
         if not data:
             return jsonify({"error": "No data provided"}), 400
         
-        logger.info(f"ESP upload data: {data}")
+        gestures_received.inc("http")
+        if LOG_MESSAGES:
+            logger.info(f"ESP upload data: {data}")
         
         # Find the symbol with boolean value True
-        symbol = None
-        for key, value in data.items():# Might have problems so change how the json comes symbol: circle
-            if isinstance(value, bool) and value:
-                symbol = key
-                break
+        symbol = find_true_symbol(data) # Might have problems so change how the json comes symbol: circle
         
         if not symbol:
             return jsonify({"error": "No valid symbol with True value found"}), 400
         
-        db = load_db()
-        symbol_name = symbol.lower()
-        found_symbol = SYMBOL_NAME_TO_ID.get(symbol_name)
-
-        if not found_symbol:
-                logger.warning(f"Symbol with name '{symbol}' not found in database, ignoring MQTT message")
-                return
-            
-        # Get current state and toggle it
-        current_state = db["symbols"][found_symbol].get("state", False)
-        new_state = not current_state
-
-
-        # Update symbol data
-        db["symbols"][found_symbol].update({
-            "state": new_state,
-            "source": "broker",
-        })
-        
-        save_db(db)
+        result = toggle_gesture(symbol, received_at, band=data.get("band"), event_id=data.get("id"))
+        if not result:
+                logger.warning(f"Symbol with name '{symbol}' not found in database, ignoring ESP upload")
+                return jsonify({"error": f"Unknown symbol '{symbol}'"}), 404
         
-        # Emit update via WebSocket - use the symbol key for consistency
-        socketio.emit("update", {found_symbol: db["symbols"][found_symbol]}) #update the format
+        found_symbol, symbol_data = result
+        if symbol_data is None:
+            # Repeat of a gesture just applied: acknowledge so the band doesn't retry
+            return jsonify({
+                "message": f"{symbol} ignored as a repeated gesture",
+                "symbol": found_symbol,
+                "symbol_name": symbol,
+                "new_state": store.get(found_symbol).get("state"),
+                "suppressed": True
+            })
+        new_state = symbol_data["state"]
         
-        logger.info(f"ESP32 HTTP: {symbol} state set to on")
+        if LOG_MESSAGES:
+            logger.info(f"ESP32 HTTP: {symbol} state set to on")
         return jsonify({
             "message": f"{symbol} state toggled to {new_state}", 
             "symbol": found_symbol,
@@ -195,63 +445,45 @@ def mqtt_on_connect(client, userdata, flags, rc):
     global mqtt_connected
     if rc == 0:
         mqtt_connected = True
+        publisher.set_connected(True)
         logger.info("MQTT connected successfully")
-        client.subscribe(MQTT_TOPIC)
-        logger.info(f"Subscribed to topic: {MQTT_TOPIC}")
     else:
         mqtt_connected = False
+        publisher.set_connected(False)
         logger.error(f"MQTT connection failed with code {rc}")
 
 def mqtt_on_disconnect(client, userdata, rc):
     """MQTT disconnection callback"""
     global mqtt_connected
     mqtt_connected = False
+    publisher.set_connected(False)
     logger.warning(f"MQTT disconnected with code {rc}")
 
 def mqtt_on_message(client, userdata, msg):
     """MQTT message callback"""
+    received_at = time.monotonic()
     try:
         payload = msg.payload.decode()
-        logger.info(f"MQTT message received: {payload}")
+        gestures_received.inc("mqtt")
+        if LOG_MESSAGES:
+            logger.info(f"MQTT message received: {payload}")
         
         data = json.loads(payload)
         
         # Find the symbol with boolean value True
-        symbol = None
-        for key, value in data.items():
-            if isinstance(value, bool) and value:
-                symbol = key.lower()
-                break
+        symbol = find_true_symbol(data)
         
         if symbol:
-            db = load_db()
-            
-            # Initialize symbol if it doesn't exist
-            symbol_name = symbol.lower()
-            found_symbol_key = SYMBOL_NAME_TO_ID.get(symbol_name)
-
-            if not found_symbol_key:
+            result = toggle_gesture(symbol, received_at, band=data.get("band"), event_id=data.get("id"))
+            if not result:
                 logger.warning(f"Symbol with name '{symbol}' not found in database, ignoring MQTT message")
                 return
             
-            # Get current state and toggle it
-            current_state = db["symbols"][found_symbol_key].get("state", False)
-            new_state = not current_state
-            
-            logger.info(f"MQTT: {found_symbol_key} ({symbol}) toggling from {current_state} to {new_state}")
-            
-            # Update symbol data with toggled state
-            db["symbols"][found_symbol_key].update({
-                "state": new_state,
-                "source": "broker"
-            })
-            
-            save_db(db)
-            
-            # Emit update via WebSocket
-            socketio.emit("update", {symbol: db["symbols"][found_symbol_key]})
-            
-            logger.info(f"MQTT: {symbol} state set to on")
+            found_symbol_key, symbol_data = result
+            if symbol_data is None:
+                return
+            if LOG_MESSAGES:
+                logger.info(f"MQTT: {found_symbol_key} ({symbol}) toggled to {symbol_data['state']}")
         else:
             logger.warning(f"No valid symbol found in MQTT message: {data}")
             
@@ -260,90 +492,156 @@ def mqtt_on_message(client, userdata, msg):
     except Exception as e:
         logger.error(f"MQTT message processing error: {e}")
 
+def mqtt_on_batch_message(client, userdata, msg):
+    """MQTT batch callback: {"events": [...], "reply_to": "optional/topic"}"""
+    received_at = time.monotonic()
+    try:
+        data = json.loads(msg.payload.decode())
+        events = batch_events(data)
+        if events is None:
+            logger.warning(f"No event list in MQTT batch message on {msg.topic}")
+            return
+        reply_to = data.get("reply_to") if isinstance(data, dict) else None
+        if len(events) > MAX_BATCH_EVENTS:
+            # Rejected whole, like the HTTP batch's 413, so the band can resend it in smaller batches
+            batch_overflow.inc("mqtt_batch", len(events))
+            logger.warning(f"Rejected MQTT batch of {len(events)} events on {msg.topic} (limit {MAX_BATCH_EVENTS})")
+            if reply_to:
+                publisher.publish(reply_to, {"error": f"Batch exceeds {MAX_BATCH_EVENTS} events",
+                                             "applied": 0, "rejected": len(events)})
+            return
+
+        gestures_received.inc("mqtt_batch", len(events))
+        results = ingest_events(events, received_at)
+        applied = sum(1 for result in results if result["status"] == "ok")
+        if LOG_MESSAGES:
+            logger.info(f"MQTT batch: {applied}/{len(events)} events applied")
+
+        if reply_to:
+            publisher.publish(reply_to, {"applied": applied, "rejected": len(events) - applied, "results": results})
+    except json.JSONDecodeError as e:
+        logger.error(f"MQTT batch JSON decode error: {e}")
+    except Exception as e:
+        logger.error(f"MQTT batch processing error: {e}")
+
 def start_mqtt():
-    """Start MQTT client in a separate thread"""
-    global mqtt_client
+    """Start the MQTT connection manager (connects and reconnects in its own thread)"""
+    global mqtt_client, mqtt_manager
     
     try:
         mqtt_client = mqtt.Client()
-        mqtt_client.on_connect = mqtt_on_connect
-        mqtt_client.on_disconnect = mqtt_on_disconnect
         mqtt_client.on_message = mqtt_on_message
+        mqtt_client.message_callback_add(MQTT_BATCH_TOPIC, mqtt_on_batch_message)
+        publisher.set_client(mqtt_client)
         
-        logger.info(f"Connecting to MQTT broker at {MQTT_BROKER}:{MQTT_PORT}")
-        mqtt_client.connect(MQTT_BROKER, MQTT_PORT, MQTT_KEEPALIVE)
-        
-        # Start the MQTT loop
-        mqtt_client.loop_forever()
+        # Reconnects are driven by on_disconnect with exponential backoff;
+        # subscriptions are replayed and the publish queue drains on every connect
+        mqtt_manager = MqttConnectionManager(
+            mqtt_client, MQTT_BROKER, MQTT_PORT, MQTT_KEEPALIVE,
+            min_backoff=MQTT_RECONNECT_MIN_DELAY,
+            max_backoff=MQTT_RECONNECT_MAX_DELAY,
+            on_connected=mqtt_on_connect,
+            on_disconnected=mqtt_on_disconnect,
+        )
+        mqtt_manager.subscribe(MQTT_TOPIC)
+        mqtt_manager.subscribe(MQTT_BATCH_TOPIC)
+        metrics.histogram("flicknest_mqtt_reconnect_seconds", "Time from MQTT disconnect to reconnect",
+                          mqtt_manager.reconnect_latency)
+        mqtt_manager.start()
         
     except Exception as e:
         logger.error(f"MQTT setup error: {e}")
         logger.info("Server will continue without MQTT functionality")
 
-def mqtt_reconnect():
-    """Reconnect to MQTT broker"""
-    global mqtt_client, mqtt_connected
-    
-    while True:
-        if not mqtt_connected and mqtt_client:
-            try:
-                logger.info("Attempting MQTT reconnection...")
-                mqtt_client.reconnect()
-            except Exception as e:
-                logger.error(f"MQTT reconnection failed: {e}")
-        
-        time.sleep(30)  # Try reconnecting every 30 seconds
-
 @socketio.on('connect')
 def handle_connect():
     """Handle WebSocket connection"""
-    logger.info(f"Client connected: {request.sid}")
-    emit('status', {'message': 'Connected to server'})
+    global websocket_clients
+    with websocket_clients_lock:
+        websocket_clients += 1
+    if LOG_MESSAGES:
+        logger.info(f"Client connected: {request.sid}")
+    # Until it subscribes, a client gets an "update" for every symbol change
+    join_room(LEGACY_ROOM)
+    emit('status', {'message': 'Connected to server', 'seq': fanout.seq})
 
 @socketio.on('disconnect')
 def handle_disconnect():
     """Handle WebSocket disconnection"""
-    logger.info(f"Client disconnected: {request.sid}")
+    global websocket_clients
+    with websocket_clients_lock:
+        websocket_clients -= 1
+    fanout.remove(request.sid)
+    if LOG_MESSAGES:
+        logger.info(f"Client disconnected: {request.sid}")
+
+@socketio.on('subscribe')
+def handle_subscribe(data):
+    """Subscribe to {"symbols": [...], "rooms": [...], "since": seq}
+
+    The client then receives "delta" events for those symbols only. With
+    "since" it gets the changes it missed as one delta, otherwise (or when
+    "since" is too old) a "snapshot" of its symbols.
+    """
+    data = data or {}
+    leave_room(LEGACY_ROOM)
+    event, payload = fanout.subscribe(
+        request.sid,
+        symbols=data.get("symbols", []),
+        rooms=data.get("rooms", []),
+        since=data.get("since"),
+    )
+    emit(event, payload)
+
+@socketio.on('unsubscribe')
+def handle_unsubscribe():
+    """Drop subscriptions and go back to receiving every update"""
+    fanout.remove(request.sid)
+    join_room(LEGACY_ROOM)
 
 @socketio.on('request_all_symbols')
 def handle_request_all_symbols():
     """Handle request for all symbols via WebSocket"""
-    db = load_db()
-    emit('all_symbols', db.get("symbols", {}))
+    emit('all_symbols', store.get_all())
 
 def publish_to_mqtt(symbol_key, symbol_name, state):
-    """Publish symbol state to MQTT"""
-    global mqtt_client
-    
-    if mqtt_client and mqtt_connected:
-        try:
-            # Create message with symbol name and its toggled state
-            message = {symbol_name: state}
-            
-            # Publish to esp/control topic (or whatever topic your ESP32 subscribes to)
-            mqtt_client.publish("esp/control", json.dumps(message))
-            logger.info(f"Published to MQTT: {message} for symbol {symbol_key}")
-            
-        except Exception as e:
-            logger.error(f"Error publishing to MQTT: {e}")
-    else:
-        logger.warning("MQTT client not connected, cannot publish")
+    """Queue symbol state for publishing to MQTT (sent by the publisher thread)"""
+    # Send to every device topic routed from this symbol (esp/control by default).
+    # Repeated commands for the same symbol collapse into the latest one.
+    for target in routing.table.targets_for(symbol_key):
+        message = target.message(symbol_name, state)
+        publisher.publish(target.topic, message, key=symbol_key)
+        if LOG_MESSAGES:
+            logger.info(f"Queued MQTT message: {message} to {target.topic} for symbol {symbol_key}")
 
 
 if __name__ == "__main__":
-    # Initialize database
-    db = load_db()
-    save_db(db)
+    # Initialize database (loaded by the storage backend when the store was created)
+    store.mark_dirty()
+    store.flush()
+    store.start()
     logger.info("Database initialized")
     
-    # Start MQTT client in a separate thread
-    mqtt_thread = threading.Thread(target=start_mqtt, daemon=True)
-    mqtt_thread.start()
+    # Start the routes watcher, the WebSocket delta loop and the MQTT publish worker
+    routing.start()
+    fanout.start()
+    publisher.start()
     
-    # Start MQTT reconnection thread
-    reconnect_thread = threading.Thread(target=mqtt_reconnect, daemon=True)
-    reconnect_thread.start()
+    # Start MQTT client (the manager runs the network loop in its own thread)
+    start_mqtt()
     
     # Start the Flask-SocketIO server
-    logger.info("Starting Flask-SocketIO server on 0.0.0.0:5000")
-    socketio.run(app, host="0.0.0.0", port=5000, debug=False)
+    logger.info(f"Starting Flask-SocketIO server on {SERVER_HOST}:{SERVER_PORT} ({ASYNC_MODE} mode)")
+    try:
+        # Threading mode serves through Werkzeug, which newer Flask-SocketIO
+        # refuses to run outside debug unless explicitly allowed
+        socketio.run(app, host=SERVER_HOST, port=SERVER_PORT, debug=False,
+                     allow_unsafe_werkzeug=True)
+    finally:
+        # Write any changes still waiting for the next flush
+        if mqtt_manager:
+            mqtt_manager.stop()
+        publisher.stop()
+        fanout.stop()
+        routing.stop()
+        store.stop()
@@ -0,0 +1,134 @@
+import json
+import os
+import sqlite3
+import threading
+import logging
+
+from symbol_store import load_db
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS symbols (
+    id TEXT PRIMARY KEY,
+    name TEXT,
+    state INTEGER,
+    source TEXT,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS symbols_name ON symbols (name);
+
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    symbol_id TEXT NOT NULL,
+    source TEXT,
+    state INTEGER,
+    timestamp REAL NOT NULL,
+    latency_ms REAL
+);
+CREATE INDEX IF NOT EXISTS events_symbol_time ON events (symbol_id, timestamp);
+CREATE INDEX IF NOT EXISTS events_time ON events (timestamp);
+"""
+
+
+def _symbol_row(symbol_id, data):
+    state = data.get("state")
+    return (symbol_id, data.get("name"), None if state is None else int(bool(state)),
+            data.get("source"), json.dumps(data))
+
+
+class SqliteStorage:
+    """SQLite database in WAL mode for SymbolStore.
+
+    Each symbol is one row keyed by its ID, so a flush only rewrites the
+    symbols that changed. Every transition is appended to the ``events``
+    table with its source, wall-clock timestamp and the latency from the
+    gesture or request arriving to the state change. WAL lets other
+    processes (and ``events`` queries) read while the flush thread writes.
+
+    If the database has no symbols yet and ``import_path`` names an existing
+    db.json, its symbols are imported on load.
+    """
+
+    whole_document = False
+    keeps_history = True
+
+    def __init__(self, path, import_path=None, synchronous="NORMAL"):
+        self.path = path
+        self.import_path = import_path
+        # NORMAL only fsyncs at WAL checkpoints; FULL also fsyncs every commit
+        self.synchronous = synchronous
+        self._lock = threading.Lock()
+        self._conn = self._connect()
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(SCHEMA)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=10, check_same_thread=False, isolation_level=None)
+        conn.execute(f"PRAGMA synchronous={self.synchronous}")
+        return conn
+
+    def load(self):
+        with self._lock:
+            rows = self._conn.execute("SELECT id, data FROM symbols").fetchall()
+        if rows:
+            return {"symbols": {symbol_id: json.loads(data) for symbol_id, data in rows}}
+
+        if self.import_path and os.path.exists(self.import_path):
+            document = load_db(self.import_path)
+            logger.info(f"Importing {len(document['symbols'])} symbols from {self.import_path} into {self.path}")
+            self.save(None, document["symbols"], [])
+            return {"symbols": document["symbols"]}
+        return {"symbols": {}}
+
+    def save(self, document, changed, events):
+        """Upsert the ``changed`` symbols and append ``events`` in one transaction"""
+        with self._lock:
+            conn = self._conn
+            conn.execute("BEGIN")
+            try:
+                conn.executemany("INSERT OR REPLACE INTO symbols (id, name, state, source, data) "
+                                 "VALUES (?, ?, ?, ?, ?)",
+                                 [_symbol_row(symbol_id, data) for symbol_id, data in changed.items()])
+                conn.executemany("INSERT INTO events (symbol_id, source, state, timestamp, latency_ms) "
+                                 "VALUES (?, ?, ?, ?, ?)",
+                                 [(symbol_id, source, None if state is None else int(bool(state)), timestamp,
+                                   None if latency is None else latency * 1000)
+                                  for symbol_id, source, state, timestamp, latency in events])
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+    def events(self, symbol_id=None, since=None, limit=100):
+        """Events newest first, optionally for one symbol and after a Unix timestamp"""
+        query = "SELECT id, symbol_id, source, state, timestamp, latency_ms FROM events"
+        conditions, params = [], []
+        if symbol_id is not None:
+            conditions.append("symbol_id = ?")
+            params.append(symbol_id)
+        if since is not None:
+            conditions.append("timestamp > ?")
+            params.append(since)
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += " ORDER BY timestamp DESC, id DESC LIMIT ?"
+        params.append(limit)
+
+        # Separate connection: WAL readers don't wait for the writer
+        conn = self._connect()
+        try:
+            rows = conn.execute(query, params).fetchall()
+        finally:
+            conn.close()
+        return [
+            {"id": row[0], "symbol_id": row[1], "source": row[2],
+             "state": None if row[3] is None else bool(row[3]),
+             "timestamp": row[4], "latency_ms": row[5]}
+            for row in rows
+        ]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,86 @@
+"""Stress test for the toggle path.
+
+Fires thousands of concurrent toggles at a handful of symbols from many
+threads (as Flask workers and the MQTT loop would) and checks that no toggle
+was lost: each symbol's final state must match the parity of the number of
+toggles it received, both in memory and in the flushed database. With the
+sqlite backend it also checks that every toggle was recorded in the event
+history.
+
+    python stress_toggle.py --toggles 5000 --threads 32
+    python stress_toggle.py --backend sqlite
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlite_storage import SqliteStorage
+from symbol_store import JsonStorage, SymbolStore
+from toggle_engine import ToggleEngine
+
+
+def open_storage(backend, tmp):
+    if backend == "sqlite":
+        return SqliteStorage(os.path.join(tmp, "db.sqlite3"))
+    return JsonStorage(os.path.join(tmp, "db.json"))
+
+
+def run(toggles, threads, symbols, flush_interval, backend="json"):
+    """Run the stress test and return True if every symbol has the right parity"""
+    with tempfile.TemporaryDirectory() as tmp:
+        store = SymbolStore(open_storage(backend, tmp), flush_interval=flush_interval)
+        store.start()
+        engine = ToggleEngine(store)
+        engine.add_listener(store.record_event)
+
+        symbol_ids = [f"sym_{i:03d}" for i in range(1, symbols + 1)]
+        targets = [random.choice(symbol_ids) for _ in range(toggles)]
+        expected = {symbol_id: targets.count(symbol_id) % 2 == 1 for symbol_id in symbol_ids}
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            list(pool.map(engine.toggle, targets))
+        elapsed = time.perf_counter() - started
+        store.stop()
+
+        in_memory = store.get_all()
+        reopened = open_storage(backend, tmp)
+        on_disk = reopened.load()["symbols"]
+        history = reopened.events(limit=toggles + 1)
+        reopened.close()
+
+    ok = True
+    if history is not None and len(history) != toggles:
+        ok = False
+        print(f"FAIL history: {len(history)} events recorded for {toggles} toggles")
+    for symbol_id in symbol_ids:
+        memory_state = in_memory.get(symbol_id, {}).get("state", False)
+        disk_state = on_disk.get(symbol_id, {}).get("state", False)
+        if memory_state != expected[symbol_id] or disk_state != expected[symbol_id]:
+            ok = False
+            print(f"FAIL {symbol_id}: expected {expected[symbol_id]}, memory {memory_state}, disk {disk_state}")
+
+    print(f"{toggles} toggles on {symbols} symbols from {threads} threads in {elapsed:.3f}s "
+          f"({toggles / elapsed:.0f} toggles/s): {'OK' if ok else 'LOST TOGGLES'}")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--toggles", type=int, default=5000)
+    parser.add_argument("--threads", type=int, default=32)
+    parser.add_argument("--symbols", type=int, default=4)
+    parser.add_argument("--flush-interval", type=float, default=0.05)
+    parser.add_argument("--backend", default="json", choices=["json", "sqlite"])
+    args = parser.parse_args()
+
+    ok = run(args.toggles, args.threads, args.symbols, args.flush_interval, args.backend)
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,258 @@
+import json
+import os
+import tempfile
+import threading
+import time
+import logging
+from contextlib import contextmanager
+
+from metrics import Histogram
+
+logger = logging.getLogger(__name__)
+
+
+def load_db(path):
+    """Load database from JSON file"""
+    try:
+        if not os.path.exists(path):
+            logger.info(f"Database file {path} not found, creating new one")
+            return {"symbols": {}}
+
+        with open(path, "r") as f:
+            data = json.load(f)
+            # Ensure symbols key exists
+            if "symbols" not in data:
+                data["symbols"] = {}
+            return data
+    except Exception as e:
+        logger.error(f"Error loading database: {e}")
+        return {"symbols": {}}
+
+
+def save_db(path, data, fsync=False):
+    """Atomically save database to JSON file (write temp file, then rename)"""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix=".db-", suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(data, f, indent=2)
+            if fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        # Readers of the file only ever see the old or the new document
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+class JsonStorage:
+    """Whole-document JSON file (db.json).
+
+    Every save rewrites the full document and no event history is kept.
+    """
+
+    whole_document = True
+    keeps_history = False
+
+    def __init__(self, path, fsync=False):
+        self.path = path
+        self.fsync = fsync
+
+    def load(self):
+        return load_db(self.path)
+
+    def save(self, document, changed, events):
+        save_db(self.path, document, self.fsync)
+
+    def events(self, symbol_id=None, since=None, limit=100):
+        return None
+
+    def close(self):
+        pass
+
+
+class SymbolStore:
+    """Authoritative in-memory copy of the database.
+
+    Reads are served from memory. Mutations only mark the store dirty; a
+    background thread hands the changes to ``storage`` every
+    ``flush_interval`` seconds, so a burst of gestures costs a single write.
+    With ``flush_interval=0`` every mutation is written through before
+    returning. ``storage`` is a JsonStorage or SqliteStorage; the latter
+    writes only the changed symbol rows and also keeps the event history
+    passed to ``record_event``. ``run_io(fn, *args)`` runs the write, e.g. on
+    a native thread pool when the server is running on an event loop.
+    """
+
+    def __init__(self, storage, flush_interval=0.5, run_io=None):
+        self.storage = storage
+        self.flush_interval = flush_interval
+        self.run_io = run_io or (lambda fn, *args: fn(*args))
+
+        self.load_latency = Histogram()
+        self.save_latency = Histogram()
+
+        started = time.perf_counter()
+        self._data = storage.load()
+        self.load_latency.observe(time.perf_counter() - started)
+        self._lock = threading.RLock()
+        self._flush_lock = threading.Lock()
+        self._version = 0
+        self._flushed_version = 0
+        self._changed = set()
+        self._events = []
+        # Bumped by every symbol change; _revisions holds each symbol's last one.
+        # Starts at the load time in milliseconds so revisions keep increasing
+        # across restarts and a client's old revision still selects everything.
+        self._revision = int(time.time() * 1000)
+        self._revisions = dict.fromkeys(self._data["symbols"], self._revision)
+        self._stop = threading.Event()
+        self._thread = None
+        self._local = threading.local()
+
+    @property
+    def dirty(self):
+        return self._version != self._flushed_version
+
+    @property
+    def revision(self):
+        """Revision of the latest symbol change"""
+        return self._revision
+
+    def start(self):
+        """Start the background flush thread"""
+        if self.flush_interval <= 0 or self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._flush_loop, name="symbol-store-flush", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the flush thread, write any pending changes and close the storage"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+        self.storage.close()
+
+    def get_all(self):
+        """Return a copy of all symbols"""
+        with self._lock:
+            return {key: dict(value) for key, value in self._data["symbols"].items()}
+
+    def get(self, symbol):
+        """Return a copy of one symbol, or an empty dict if unknown"""
+        with self._lock:
+            return dict(self._data["symbols"].get(symbol, {}))
+
+    def changed_since(self, revision):
+        """Return ``(current_revision, symbols)`` with copies of the symbols changed after ``revision``
+
+        ``revision=None`` returns every symbol, as does a revision from a
+        previous run.
+        """
+        with self._lock:
+            if revision is None or revision > self._revision:
+                symbols = {key: dict(value) for key, value in self._data["symbols"].items()}
+            else:
+                symbols = {key: dict(self._data["symbols"][key])
+                           for key, changed in self._revisions.items() if changed > revision}
+            return self._revision, symbols
+
+    def update(self, symbol, fields):
+        """Merge ``fields`` into a symbol (creating it if needed) and return a copy"""
+        with self._lock:
+            entry = self._data["symbols"].setdefault(symbol, {})
+            entry.update(fields)
+            result = dict(entry)
+            self._changed.add(symbol)
+            self._revision += 1
+            self._revisions[symbol] = self._revision
+            self._version += 1
+        self._written()
+        return result
+
+    def mark_dirty(self):
+        """Force the next flush to write every symbol"""
+        with self._lock:
+            self._changed.update(self._data["symbols"])
+            self._version += 1
+        self._written()
+
+    def record_event(self, symbol_id, symbol_data, received_at=None):
+        """ToggleEngine listener: queue a history row for the transition just applied"""
+        if not self.storage.keeps_history:
+            return
+        now = time.monotonic()
+        latency = now - received_at if received_at is not None else None
+        with self._lock:
+            self._events.append((symbol_id, symbol_data.get("source"), symbol_data.get("state"),
+                                 time.time(), latency))
+            self._version += 1
+        self._written()
+
+    def history(self, symbol_id=None, since=None, limit=100):
+        """Recorded events, newest first, or None if the storage keeps no history"""
+        if not self.storage.keeps_history:
+            return None
+        # Pending events are written first so the answer includes them
+        self.flush()
+        return self.run_io(self.storage.events, symbol_id, since, limit)
+
+    @contextmanager
+    def batch(self):
+        """Group this thread's mutations so write-through mode flushes once at the end"""
+        self._local.depth = getattr(self._local, "depth", 0) + 1
+        try:
+            yield self
+        finally:
+            self._local.depth -= 1
+            if self._local.depth == 0:
+                self._written()
+
+    def _written(self):
+        # Write-through mode; must not be called with _lock held (flush takes
+        # _flush_lock first, then _lock)
+        if self.flush_interval <= 0 and not getattr(self._local, "depth", 0):
+            self.flush()
+
+    def flush(self):
+        """Write the changes since the last flush to the storage"""
+        with self._flush_lock:
+            with self._lock:
+                if not self.dirty:
+                    return False
+                version = self._version
+                changed = {key: dict(self._data["symbols"][key]) for key in self._changed}
+                events = self._events
+                self._changed = set()
+                self._events = []
+                if self.storage.whole_document:
+                    snapshot = dict(self._data)
+                    snapshot["symbols"] = {key: dict(value) for key, value in self._data["symbols"].items()}
+                else:
+                    snapshot = None
+
+            started = time.perf_counter()
+            try:
+                self.run_io(self.storage.save, snapshot, changed, events)
+                self.save_latency.observe(time.perf_counter() - started)
+            except Exception as e:
+                # Stay dirty so the next flush retries
+                logger.error(f"Error saving database: {e}")
+                with self._lock:
+                    self._changed.update(changed)
+                    self._events[:0] = events
+                return False
+
+            with self._lock:
+                self._flushed_version = version
+            logger.debug(f"Database flushed (version {version}, {len(changed)} symbols, {len(events)} events)")
+            return True
+
+    def _flush_loop(self):
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
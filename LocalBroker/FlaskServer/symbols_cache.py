@@ -0,0 +1,118 @@
+import json
+import threading
+import zlib
+from collections import OrderedDict
+
+
+class SymbolsQuery:
+    """Parsed GET /symbols parameters: ?since=<version>&offset=<n>&limit=<n>&fields=name,state"""
+
+    __slots__ = ("since", "offset", "limit", "fields", "key")
+
+    def __init__(self, since=None, offset=0, limit=None, fields=None):
+        self.since = since
+        self.offset = offset
+        self.limit = limit
+        self.fields = tuple(sorted(set(fields))) if fields else None
+        self.key = (since, offset, limit, self.fields)
+
+    @classmethod
+    def from_args(cls, args, max_limit=None):
+        """Build from request args; raises ValueError on bad values"""
+        def integer(name, default=None, minimum=0):
+            value = args.get(name)
+            if value is None or value == "":
+                return default
+            value = int(value)
+            if value < minimum:
+                raise ValueError(f"'{name}' must be at least {minimum}")
+            return value
+
+        limit = integer("limit", minimum=1)
+        if max_limit is not None:
+            limit = min(limit or max_limit, max_limit)
+        fields = [field for field in args.get("fields", "").split(",") if field]
+        return cls(integer("since"), integer("offset", 0), limit, fields)
+
+
+class SymbolsPage:
+    """One pre-serialized /symbols response body"""
+
+    __slots__ = ("revision", "etag", "body", "total", "next_offset")
+
+    def __init__(self, revision, etag, body, total, next_offset):
+        self.revision = revision
+        self.etag = etag
+        self.body = body
+        self.total = total
+        self.next_offset = next_offset
+
+
+class SymbolsCache:
+    """Serialized GET /symbols bodies for the store's current revision.
+
+    The body is always the ``{symbol_id: data}`` map the endpoint has always
+    returned, ordered by symbol ID; ``since`` keeps only symbols changed after
+    that revision, ``offset``/``limit`` page through them and ``fields``
+    drops the other keys of each symbol. Bodies are cached per query and the
+    whole cache is dropped once the store's revision moves on, so repeated
+    polls of an unchanged store skip copying and serializing the symbols.
+    The ETag is derived from the revision and the query alone, which lets
+    ``If-None-Match`` be answered before anything is read.
+    """
+
+    def __init__(self, store, max_entries=64):
+        self.store = store
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._revision = None
+        self._pages = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def etag(revision, query):
+        variant = zlib.crc32(repr(query.key).encode())
+        return f"{revision}-{variant:08x}"
+
+    def get(self, query):
+        """Return the SymbolsPage for ``query`` at the current revision"""
+        revision = self.store.revision
+        with self._lock:
+            if revision != self._revision:
+                self._pages.clear()
+                self._revision = revision
+            page = self._pages.get(query.key)
+            if page is not None:
+                self._pages.move_to_end(query.key)
+                self.hits += 1
+                return page
+            self.misses += 1
+
+        page = self._render(query)
+        with self._lock:
+            # A render that raced a newer mutation is returned but not cached
+            if page.revision == self._revision:
+                self._pages[query.key] = page
+                while len(self._pages) > self.max_entries:
+                    self._pages.popitem(last=False)
+        return page
+
+    def _render(self, query):
+        revision, symbols = self.store.changed_since(query.since)
+        ids = sorted(symbols)
+        total = len(ids)
+        end = total if query.limit is None else query.offset + query.limit
+        page_ids = ids[query.offset:end]
+
+        if query.fields:
+            selected = {symbol_id: {field: symbols[symbol_id][field]
+                                    for field in query.fields if field in symbols[symbol_id]}
+                        for symbol_id in page_ids}
+        else:
+            selected = {symbol_id: symbols[symbol_id] for symbol_id in page_ids}
+
+        body = json.dumps(selected, separators=(",", ":")).encode()
+        return SymbolsPage(revision, self.etag(revision, query), body, total,
+                           end if end < total else None)
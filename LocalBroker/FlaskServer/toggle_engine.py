@@ -0,0 +1,61 @@
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class ToggleEngine:
+    """Serializes state transitions on the symbol store.
+
+    Every read-modify-write of a symbol runs under that symbol's own lock, so
+    two gestures for the same device can never lose a toggle while gestures
+    for unrelated devices proceed in parallel. Listeners are called with
+    ``(symbol_id, symbol_data, received_at)`` while the symbol lock is still
+    held, which keeps notifications for one symbol in the same order as its
+    transitions. ``received_at`` is the ``time.monotonic()`` at which the
+    triggering gesture or request arrived, or None.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self._locks = {}
+        self._locks_guard = threading.Lock()
+        self._listeners = []
+
+    def add_listener(self, listener):
+        """Register a callback run after every transition"""
+        self._listeners.append(listener)
+
+    def lock_for(self, symbol_id):
+        """Return the lock serializing transitions of ``symbol_id``"""
+        lock = self._locks.get(symbol_id)
+        if lock is None:
+            with self._locks_guard:
+                lock = self._locks.setdefault(symbol_id, threading.Lock())
+        return lock
+
+    def apply(self, symbol_id, transition, received_at=None):
+        """Run ``transition(current_data) -> fields`` atomically for one symbol"""
+        with self.lock_for(symbol_id):
+            current = self.store.get(symbol_id)
+            symbol_data = self.store.update(symbol_id, transition(current))
+            self._notify(symbol_id, symbol_data, received_at)
+        return symbol_data
+
+    def toggle(self, symbol_id, source="broker", received_at=None):
+        """Flip the ``state`` of a symbol and return its new data"""
+        return self.apply(symbol_id, lambda current: {
+            "state": not current.get("state", False),
+            "source": source,
+        }, received_at)
+
+    def update(self, symbol_id, fields, source="mobile", received_at=None):
+        """Merge ``fields`` into a symbol and return its new data"""
+        return self.apply(symbol_id, lambda current: {**fields, "source": source}, received_at)
+
+    def _notify(self, symbol_id, symbol_data, received_at):
+        for listener in self._listeners:
+            try:
+                listener(symbol_id, symbol_data, received_at)
+            except Exception as e:
+                logger.error(f"Toggle listener error for {symbol_id}: {e}")
@@ -1,48 +1,51 @@
-import serial
 import matplotlib.pyplot as plt
 from matplotlib.animation import FuncAnimation
 import numpy as np
 
+from imu_stream import ACCEL, GYRO, ImuStream, open_serial
+from integrator import MotionIntegrator
+
 # Initialize data containers
 x_vals = []
 y_vals = []  # For storing the calculated positions
 
+# The board sends no timestamps; one sample per frame at this interval (s)
+DT = 0.1
+
+# Velocity and position, integrated as the samples arrive
+motion = MotionIntegrator(method='trapezoid')
+samples_seen = 0
+
 # Define the serial data reading function
 def read_serial_data(port, baud_rate=9600, timeout=1):
     """
     Generator function to read data from the serial port.
     """
     try:
-        with serial.Serial(port, baud_rate, timeout=timeout) as esp32:
-            print(f"Connected to {port} at {baud_rate} baud.")
-            while True:
-                data = esp32.readline().decode('utf-8').strip()
-                
-                # Skip empty or invalid data
-                if not data:
-                    continue
-                
-                data_split = data.split(',')
-                if len(data_split) >= 7:
-                    try:
-                        # Yield the correct data values for accel and gyro
-                        accel_data = (float(data_split[0]), float(data_split[1]), float(data_split[2]))
-                        gyro_data = (float(data_split[3]), float(data_split[4]), float(data_split[5]))
-                        yield accel_data, gyro_data
-                    except ValueError:
-                        # Skip lines where conversion fails
-                        print(f"Skipping invalid data: {data}")
-                        continue
-    except serial.SerialException as e:
+        stream = ImuStream(open_serial(port, baud_rate, timeout=timeout), layout='no_timestamp', min_fields=7)
+    except OSError as e:
         print(f"Serial error: {e}")
+        return
+    print(f"Connected to {port} at {baud_rate} baud.")
+    try:
+        # Invalid lines are skipped (and counted) by the stream
+        for sample in stream.samples():
+            # Yield the correct data values for accel and gyro
+            yield tuple(sample[ACCEL]), tuple(sample[GYRO])
+    finally:
+        print(f"Skipped {stream.malformed} invalid lines")
+        stream.close()
 
 # Function to update the plot in real-time
 def update_plot(frame, x_vals, y_vals):
+    global samples_seen
+
     # Extract accel and gyro data from the frame
     accel_data, gyro_data = frame
-    
-    # Calculate position using accelerometer and gyroscope data
-    position = calculate_coordinates([accel_data], [gyro_data])
+
+    # Calculate position by integrating the acceleration twice
+    velocity, position = motion.update(samples_seen * DT, accel_data)
+    samples_seen += 1
 
     # Increment the x value for time progression
     x_vals.append(x_vals[-1] + 1 if x_vals else 0)
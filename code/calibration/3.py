@@ -1,13 +1,15 @@
-import serial
 import matplotlib
 matplotlib.use('Qt5Agg')  # Use Qt5Agg or Agg for non-interactive mode
 import matplotlib.pyplot as plt
 from matplotlib.animation import FuncAnimation
 import time
 
+from imu_stream import AX, GX, ImuStream, open_serial
+
 # Set up the serial port
-ser = serial.Serial('CO83', 112500)  # Replace 'COM3' with your actual serial port
+ser = open_serial('CO83', 112500)  # Replace 'COM3' with your actual serial port
 ser.flushInput()
+stream = ImuStream(ser, layout='no_timestamp')
 
 # Set up the plot
 fig, ax = plt.subplots(figsize=(8, 6))
@@ -28,33 +30,26 @@ ax.grid(True)
 
 # Function to update the plot
 def update(frame):
-    # Read data from serial port with error handling
-    if ser.in_waiting > 0:
-        data = ser.readline().decode('utf-8', errors='ignore').strip()
-        try:
-            # Parse the incoming comma-separated data
-            values = list(map(float, data.split(',')))
-
-            # Get the current time in seconds since the epoch
-            current_time = time.time()
-
-            # Append data to respective lists
-            data_1.append(values[0])  # Assuming first value goes to data_1
-            data_2.append(values[3])  # Assuming 4th value goes to data_2
-            times.append(current_time)  # Add timestamp
-
-            # Limit the number of data points to 10
-            if len(times) > 10:
-                times.pop(0)
-                data_1.pop(0)
-                data_2.pop(0)
-
-            # Update the plot data
-            line1.set_data(times, data_1)
-            line2.set_data(times, data_2)
-
-        except ValueError:
-            pass  # Ignore invalid data
+    # Read everything that arrived since the last frame (invalid lines are skipped)
+    block = stream.read_block()
+    if block is not None and len(block):
+        # Get the current time in seconds since the epoch
+        current_time = time.time()
+
+        # Append the latest sample to the respective lists
+        data_1.append(block[-1, AX])  # Accel X goes to data_1
+        data_2.append(block[-1, GX])  # Gyro X goes to data_2
+        times.append(current_time)  # Add timestamp
+
+        # Limit the number of data points to 10
+        if len(times) > 10:
+            times.pop(0)
+            data_1.pop(0)
+            data_2.pop(0)
+
+        # Update the plot data
+        line1.set_data(times, data_1)
+        line2.set_data(times, data_2)
 
     return line1, line2
 
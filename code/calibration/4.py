@@ -1,15 +1,19 @@
 import serial
 
-# Open the serial port COM8
-ser = serial.Serial('COM8', baudrate=115200, timeout=1)
+from imu_stream import open_serial
+
+# Open the serial port COM8 (or a recording, with IMU_REPLAY set)
+ser = open_serial('COM8', baudrate=115200, timeout=1)
 
 while True:
     try:
         # Read a line from the serial port, decode it, and strip any leading/trailing whitespace
         line = ser.readline().decode('utf-8').strip()
         
-        # Skip empty lines
+        # Skip empty lines; a replayed recording closes itself at its end
         if not line:
+            if not ser.is_open:
+                break
             continue
         
         # Debug: Print the received line
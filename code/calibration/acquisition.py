@@ -0,0 +1,158 @@
+"""
+Background acquisition for the live calibration tools.
+
+The live plots used to read one serial line per animation frame, so the
+sample rate was capped by the redraw rate and everything else piled up in
+the OS buffer. Acquisition reads the board on its own thread into the
+stream's ring buffer, and each frame takes whatever arrived since the last
+one:
+
+    acquisition = Acquisition(ImuStream(open_serial('COM9'))).start()
+    reader = acquisition.reader()
+    fig.canvas.mpl_connect('draw_event', reader.displayed)
+
+    def update(frame):
+        block = reader.read()   # every sample since the previous frame
+        ...
+
+A thread (not a process) is enough: serial reads and the NumPy parsing
+spend their time outside the GIL.
+"""
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+from imu_stream import TIMESTAMP
+
+
+class Acquisition:
+    """Reads an ImuStream on a background thread until stopped or the source ends."""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.ring = stream.ring
+        # (samples written, host time they arrived) after the newest block;
+        # replaced as one tuple so readers always see a matching pair
+        self.mark = (self.ring.written, None)
+        self.blocks = 0
+        self.error = None
+        self._stop = threading.Event()
+        self._thread = None
+        self._started_at = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        if self._thread is None:
+            self._started_at = time.monotonic()
+            self._thread = threading.Thread(target=self._run, name="imu-acquisition", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout=2.0):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def reader(self, **kwargs):
+        """A new consumer starting at the newest sample"""
+        return RingReader(self, **kwargs)
+
+    def sample_rate(self):
+        """Average samples per second since start()"""
+        if self._started_at is None:
+            return 0.0
+        elapsed = time.monotonic() - self._started_at
+        return self.ring.written / elapsed if elapsed > 0 else 0.0
+
+    def _run(self):
+        try:
+            while not self._stop.is_set():
+                block = self.stream.read_block()
+                if block is None:
+                    return
+                if len(block):
+                    self.blocks += 1
+                    self.mark = (self.ring.written, time.monotonic())
+        except Exception as e:
+            # Reported by the tool; the thread just ends
+            self.error = e
+
+
+class RingReader:
+    """One consumer's position in the acquisition ring, plus display-lag stats.
+
+    Two lags are measured each time a frame showing new samples is drawn:
+
+      * display lag: from the newest displayed sample arriving on the host
+        to the frame being drawn
+      * sensor lag: from the board taking that sample to the frame being
+        drawn. The board clock is mapped to the host clock with the smallest
+        (arrival - board timestamp) seen so far, so this includes time spent
+        queued in the serial buffers but not the fixed transfer latency.
+    """
+
+    def __init__(self, acquisition, history=1000):
+        self.acquisition = acquisition
+        self.ring = acquisition.ring
+        self.position = self.ring.written
+        self.missed = 0
+        self.frames = 0
+        self.display_lags = deque(maxlen=history)
+        self.sensor_lags = deque(maxlen=history)
+        self._pending = None
+        self._clock_offset_ms = None
+
+    @property
+    def backlog(self):
+        """Samples acquired but not read yet"""
+        return self.ring.written - self.position
+
+    def read(self):
+        """Every sample since the previous read, oldest first"""
+        end, arrival = self.acquisition.mark
+        block, self.position, missed = self.ring.read_since(self.position, end)
+        self.missed += missed
+        if len(block) and arrival is not None:
+            newest = block[-1, TIMESTAMP]
+            # The newest sample of a block is the one that just crossed the link
+            offset = arrival * 1000 - newest
+            if np.isfinite(offset) and (self._clock_offset_ms is None or offset < self._clock_offset_ms):
+                self._clock_offset_ms = offset
+            self._pending = (arrival, newest)
+        return block
+
+    def displayed(self, event=None):
+        """Call once the frame showing the last read() is on screen (e.g. from a draw_event)"""
+        if self._pending is None:
+            return
+        now = time.monotonic()
+        arrival, newest = self._pending
+        self._pending = None
+        self.frames += 1
+        self.display_lags.append(now - arrival)
+        if self._clock_offset_ms is not None and np.isfinite(newest):
+            self.sensor_lags.append(now - (newest + self._clock_offset_ms) / 1000)
+
+    def stats(self):
+        def percentiles(values):
+            if not values:
+                return {"p50_ms": None, "p99_ms": None}
+            p50, p99 = np.percentile(np.asarray(values) * 1000, [50, 99])
+            return {"p50_ms": round(float(p50), 2), "p99_ms": round(float(p99), 2)}
+
+        return {
+            "samples": self.ring.written,
+            "sample_rate": round(self.acquisition.sample_rate(), 1),
+            "frames": self.frames,
+            "backlog": self.backlog,
+            "missed": self.missed,
+            "malformed": self.acquisition.stream.malformed,
+            "display_lag": percentiles(self.display_lags),
+            "sensor_lag": percentiles(self.sensor_lags),
+        }
@@ -0,0 +1,354 @@
+"""
+Gesture accuracy and latency, from recorded sessions to the dashboard.
+
+Replays labeled sessions (build_dataset.py's format: .imu/.csv files with
+"<session>.labels.csv" sidecars or a label file-name prefix) through the
+same path a band's gestures take:
+
+    ReplaySource -> ImuStream -> GestureRecognizer -> MQTT esp/data
+        -> fake MQTT broker -> server.py.py mqtt_on_message -> toggle
+        -> Socket.IO "update" to a dashboard client
+
+Sessions play in real time (``--speed``), one band per session, several at
+once (``--bands``). Every recognized gesture is matched to a labeled
+gesture of the same symbol that it falls inside (or within
+``--match-window`` ms after). The report has:
+
+  * per-symbol precision and recall
+  * false toggles: unmatched gestures that toggled a symbol, per minute of
+    replayed data
+  * lost updates: matched gestures without a dashboard update of their own
+    (debounced, or merged into one delta with another band's toggle)
+  * latency from the end of the labeled gesture to the dashboard's update,
+    p50/p95/p99, split into recognition (session time from the gesture end
+    to the sample that completed it) and pipeline (wall time from that
+    sample's arrival to the update); recognition is negative when the
+    model fires before the labeled end
+
+The split keeps the latency meaningful at ``--speed`` above 1, as long as
+the host keeps up. Runs headless; ``--json`` writes the results for
+tracking over time:
+
+    python build_dataset.py train_sessions/ dataset/ --features --augment 3
+    python bench_gestures.py test_sessions/ --train dataset/ --save-model gestures.npz --json gestures.json
+    python bench_gestures.py test_sessions/ --model gestures.npz --speed 4
+"""
+import argparse
+import asyncio
+import glob
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from build_dataset import IDLE, find_sessions, open_session, read_segments
+from imu_stream import TIMESTAMP, ImuStream
+from recognizer import GestureModel, GestureRecognizer, window_features
+from replay import ReplaySource
+
+BROKER_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "LocalBroker", "FlaskServer")
+sys.path.insert(0, BROKER_DIR)
+
+import paho.mqtt.client as mqtt  # noqa: E402
+
+from bench_common import connect_clients, disconnect_clients, percentile, start_server, wait_healthy  # noqa: E402
+from fake_mqtt_broker import FakeMqttBroker  # noqa: E402
+from routing import RoutingTable  # noqa: E402
+
+PERCENTILES = (50, 95, 99)
+
+
+def default_hop(window):
+    """Largest hop that divides ``window`` and is at most a tenth of it (SlidingFeatures needs a divisor)"""
+    return max(hop for hop in range(1, max(1, window // 10) + 1) if window % hop == 0)
+
+
+def train_from_dataset(directory, hop, epochs):
+    """GestureModel fitted on build_dataset.py's npz shards; ``hop=None`` picks default_hop()"""
+    paths = sorted(glob.glob(os.path.join(directory, "*.npz")))
+    if not paths:
+        raise ValueError(f"No npz shards in {directory}")
+    features, targets = [], []
+    for path in paths:
+        with np.load(path) as shard:
+            features.append(shard["features"] if "features" in shard
+                            else window_features(shard["windows"].astype(float), float(shard["rate"])))
+            targets.append(shard["targets"])
+            labels, channels = [str(x) for x in shard["labels"]], [str(x) for x in shard["channels"]]
+            window, rate = shard["windows"].shape[1], float(shard["rate"])
+    hop = hop or default_hop(window)
+    if window % hop:
+        raise ValueError(f"--hop {hop} does not divide the dataset's window of {window} samples")
+    return GestureModel.fit(np.concatenate(features), np.concatenate(targets), labels, channels,
+                            window, hop, rate, epochs=epochs, idle=IDLE)
+
+
+def labeled_gestures(path, layout, rate):
+    """[(start_ms, end_ms, label)] of a session's gestures (idle excluded)"""
+    timestamps = open_session(path, layout, rate)[0]
+    return [segment for segment in read_segments(path, timestamps) if segment[2] != IDLE]
+
+
+class UpdateLog:
+    """Times of the dashboard's "update" events per symbol ID
+
+    Each update can be claimed by one event only: toggles from concurrent
+    bands merged into one delta show up as one update, so only one of their
+    events is credited with it.
+    """
+
+    def __init__(self):
+        self.times = {}
+        self.claimed = {}
+        self.lock = threading.Lock()
+
+    def on_update(self, client_index, data):
+        now = time.monotonic()
+        with self.lock:
+            for symbol_id in data:
+                self.times.setdefault(symbol_id, []).append(now)
+
+    def claim(self, symbol_id, since, timeout):
+        """The first unclaimed update of ``symbol_id`` in [since, since + timeout], now claimed; or None"""
+        times = self.times.get(symbol_id, [])
+        claimed = self.claimed.setdefault(symbol_id, set())
+        index = int(np.searchsorted(times, since))
+        while index < len(times) and times[index] <= since + timeout:
+            if index not in claimed:
+                claimed.add(index)
+                return times[index]
+            index += 1
+        return None
+
+
+def replay_session(path, band_id, model, publish, args):
+    """Play one session through a recognizer; returns its events with timing"""
+    source = ReplaySource(path, speed=args.speed, layout=args.layout, sample_rate=args.rate)
+    stream = ImuStream(source)
+    recognizer = GestureRecognizer(model, band_id)
+    events = []
+    for block in stream.blocks():
+        for event in recognizer.feed(block):
+            published = time.monotonic()
+            publish(event)
+            # The block's last sample is the one whose arrival let this event happen
+            arrived_ms = float(block[-1, TIMESTAMP])
+            events.append(dict(event, arrived_ms=arrived_ms, arrival=source.arrival(arrived_ms),
+                               published=published))
+    stream.close()
+    duration_ms = float(source.samples[-1, TIMESTAMP] - source.samples[0, TIMESTAMP]) if len(source.samples) else 0.0
+    return {"session": path, "band": band_id, "events": events, "duration_ms": duration_ms}
+
+
+def match_events(events, gestures, window_ms):
+    """Pair each event with the earliest unmatched gesture of its symbol it falls in; (pairs, unmatched events)"""
+    used = set()
+    pairs, unmatched = [], []
+    for event in sorted(events, key=lambda e: e["timestamp"]):
+        for index, (start, end, label) in enumerate(gestures):
+            if index not in used and label == event["symbol"] and start <= event["timestamp"] <= end + window_ms:
+                used.add(index)
+                pairs.append((event, gestures[index]))
+                break
+        else:
+            unmatched.append(event)
+    return pairs, unmatched
+
+
+def summarize(values):
+    stats = {f"p{pct}": round(percentile(values, pct), 1) if values else None for pct in PERCENTILES}
+    stats["samples"] = len(values)
+    return stats
+
+
+def score(replays, truth, updates, routes, args):
+    """Per-symbol precision/recall, false toggles and latency percentiles"""
+    per_symbol = {}
+    totals, recognition, pipeline = [], [], []
+    false_toggles = false_events = lost_updates = unroutable = 0
+
+    def counts(symbol):
+        return per_symbol.setdefault(symbol, {"gestures": 0, "events": 0, "true_positives": 0, "toggles": 0,
+                                              "false_toggles": 0})
+
+    # Hand out updates in publish order across all bands, one per event
+    received_at = {}
+    for event in sorted((event for replay in replays for event in replay["events"]), key=lambda e: e["published"]):
+        route = routes.resolve(event["symbol"])
+        if route is not None:
+            received_at[id(event)] = updates.claim(route.symbol_id, event["published"], args.match_timeout)
+
+    def update_time(event):
+        return received_at.get(id(event))
+
+    for replay in replays:
+        gestures = truth[replay["session"]]
+        for _, _, label in gestures:
+            counts(label)["gestures"] += 1
+        pairs, unmatched = match_events(replay["events"], gestures, args.match_window)
+
+        for event in replay["events"]:
+            counts(event["symbol"])["events"] += 1
+            if routes.resolve(event["symbol"]) is None:
+                unroutable += 1
+            elif update_time(event) is not None:
+                counts(event["symbol"])["toggles"] += 1
+
+        for event, (_, end_ms, label) in pairs:
+            counts(label)["true_positives"] += 1
+            received = update_time(event)
+            if received is None:
+                lost_updates += 1
+                continue
+            recognition_ms = event["arrived_ms"] - end_ms
+            pipeline_ms = (received - event["arrival"]) * 1000
+            recognition.append(recognition_ms)
+            pipeline.append(pipeline_ms)
+            totals.append(recognition_ms + pipeline_ms)
+
+        for event in unmatched:
+            false_events += 1
+            if update_time(event) is not None:
+                false_toggles += 1
+                counts(event["symbol"])["false_toggles"] += 1
+
+    for symbol, c in per_symbol.items():
+        c["precision"] = round(c["true_positives"] / c["events"], 3) if c["events"] else None
+        c["recall"] = round(c["true_positives"] / c["gestures"], 3) if c["gestures"] else None
+
+    minutes = sum(replay["duration_ms"] for replay in replays) / 60000
+    gestures = sum(c["gestures"] for c in per_symbol.values())
+    events = sum(c["events"] for c in per_symbol.values())
+    detected = sum(c["true_positives"] for c in per_symbol.values())
+    return {
+        "sessions": len(replays),
+        "replayed_minutes": round(minutes, 2),
+        "gestures": gestures,
+        "events": events,
+        "precision": round(detected / events, 3) if events else None,
+        "recall": round(detected / gestures, 3) if gestures else None,
+        "false_events": false_events,
+        "false_toggles": false_toggles,
+        "false_toggles_per_minute": round(false_toggles / minutes, 3) if minutes else None,
+        "lost_updates": lost_updates,
+        "unroutable_events": unroutable,
+        "latency_ms": {"total": summarize(totals), "recognition": summarize(recognition),
+                       "pipeline": summarize(pipeline)},
+        "symbols": dict(sorted(per_symbol.items())),
+    }
+
+
+async def run(args, model, sessions):
+    truth = {path: labeled_gestures(path, args.layout, args.rate) for path in sessions}
+    routes = RoutingTable.load(args.routes)
+    updates = UpdateLog()
+    url = f"http://127.0.0.1:{args.port}"
+
+    broker = FakeMqttBroker().start()
+    with tempfile.TemporaryDirectory() as workdir:
+        proc = start_server("threading", args.port, workdir, mqtt_port=broker.port,
+                            env={"BROKER_DEBOUNCE_WINDOW": str(args.debounce)})
+        client = mqtt.Client()
+        dashboards = []
+        try:
+            await wait_healthy(url, mqtt=True)
+            client.connect(broker.host, broker.port)
+            client.loop_start()
+            dashboards = await connect_clients(url, 1, 1, updates.on_update)
+            if not dashboards:
+                raise RuntimeError("Dashboard client could not connect")
+
+            def publish(event):
+                # The band's MQTT message, as mqtt_on_message expects it
+                client.publish("esp/data", json.dumps({event["symbol"]: True, "band": event["band"],
+                                                       "id": event["id"]}), qos=1)
+
+            loop = asyncio.get_running_loop()
+            started = time.monotonic()
+            with ThreadPoolExecutor(max_workers=args.bands) as pool:
+                replays = await asyncio.gather(*(
+                    loop.run_in_executor(pool, replay_session, path, f"bench-{index}", model, publish, args)
+                    for index, path in enumerate(sessions)))
+            elapsed = time.monotonic() - started
+            await asyncio.sleep(args.drain)
+        finally:
+            await disconnect_clients(dashboards)
+            client.loop_stop()
+            proc.terminate()
+            proc.wait()
+            broker.stop()
+
+    result = score(replays, truth, updates, routes, args)
+    result["wall_seconds"] = round(elapsed, 2)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("sessions", help="directory of labeled sessions to replay")
+    model_group = parser.add_mutually_exclusive_group(required=True)
+    model_group.add_argument("--model", help="GestureModel .npz")
+    model_group.add_argument("--train", metavar="DATASET", help="fit a model on build_dataset.py npz shards")
+    parser.add_argument("--save-model", help="with --train, save the fitted model here")
+    parser.add_argument("--hop", type=int,
+                        help="with --train, recognizer hop in samples; must divide the window "
+                             "(default: the largest divisor up to a tenth of it)")
+    parser.add_argument("--epochs", type=int, default=500, help="with --train, training epochs")
+    parser.add_argument("--layout", default="csv", help="column layout of CSV sessions")
+    parser.add_argument("--rate", type=float, help="sample rate in Hz (for CSV without timestamps)")
+    parser.add_argument("--speed", type=float, default=1.0, help="replay speed (1 = real time)")
+    parser.add_argument("--bands", type=int, default=4, help="sessions replayed at once")
+    parser.add_argument("--match-window", type=float, default=1500.0,
+                        help="ms after a labeled gesture's end in which a recognition still counts")
+    parser.add_argument("--match-timeout", type=float, default=2.0, help="seconds to wait for an event's update")
+    parser.add_argument("--debounce", type=float, default=0.3, help="broker's BROKER_DEBOUNCE_WINDOW")
+    parser.add_argument("--drain", type=float, default=2.0, help="seconds to wait for the last updates")
+    parser.add_argument("--port", type=int, default=5057)
+    parser.add_argument("--routes", default=os.path.join(BROKER_DIR, "routes.json"))
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+    if args.speed <= 0:
+        parser.error("--speed must be positive: latency needs timed replay")
+
+    sessions = find_sessions(args.sessions)
+    if not sessions:
+        parser.error(f"No .imu or .csv sessions in {args.sessions}")
+    try:
+        model = GestureModel.load(args.model) if args.model else train_from_dataset(args.train, args.hop, args.epochs)
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
+    if args.train and args.save_model:
+        model.save(args.save_model)
+
+    result = asyncio.run(run(args, model, sessions))
+    result["config"] = {key: getattr(args, key) for key in ("model", "train", "speed", "bands", "match_window",
+                                                            "debounce")}
+    result["model"] = {"labels": model.labels, "window": model.window, "hop": model.hop, "rate": model.rate,
+                       "threshold": model.threshold}
+
+    latency = result["latency_ms"]
+    print(f"{result['sessions']} sessions, {result['replayed_minutes']} min replayed in {result['wall_seconds']} s: "
+          f"{result['events']} recognized / {result['gestures']} labeled gestures")
+    print(f"precision {result['precision']}, recall {result['recall']}, "
+          f"false toggles {result['false_toggles']} ({result['false_toggles_per_minute']}/min), "
+          f"lost updates {result['lost_updates']}")
+    for part in ("total", "recognition", "pipeline"):
+        stats = latency[part]
+        print(f"  {part:12s} latency: p50 {stats['p50']} ms, p95 {stats['p95']} ms, p99 {stats['p99']} ms "
+              f"({stats['samples']} gestures)")
+    for symbol, c in result["symbols"].items():
+        print(f"  {symbol:12s} precision {c['precision']}, recall {c['recall']} "
+              f"({c['true_positives']}/{c['gestures']} gestures, {c['events']} events, "
+              f"{c['false_toggles']} false toggles)")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""
+How many 100 Hz bands can one hub process ingest?
+
+Sender processes play N synthetic bands over UDP (sensor.py's line format,
+a datagram of --samples-per-datagram samples per band every few ms) while
+the hub runs in this process with --subscribers no-op consumers attached.
+For each band count it reports the samples received, loss, and the hub's
+own CPU time per sample. The CPU time gives the capacity of one core
+independent of the senders, which may share the core with the hub:
+
+    capacity = 1 / (hub CPU seconds per sample) / rate
+
+    python bench_hub.py
+    python bench_hub.py --bands 50 200 800 --seconds 10 --json hub.json
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import socket
+import time
+
+from hub import Hub
+
+
+def send_bands(port, first, count, rate, per_datagram, seconds, start_at):
+    """Sender process: bands first..first+count-1 at ``rate`` Hz until ``seconds`` pass"""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    headers = [b"@synthetic-%d\n" % band for band in range(first, first + count)]
+    row = b",0.01,-0.02,0.98,1.5,-2.25,0.5,25.0\n"
+    interval = per_datagram / rate
+    while time.time() < start_at:
+        time.sleep(0.001)
+    started = time.monotonic()
+    sent = 0
+    while sent < int(seconds / interval):
+        due = started + sent * interval
+        now = time.monotonic()
+        if due > now:
+            time.sleep(due - now)
+        base_ms = int(sent * interval * 1000)
+        lines = b"".join(b"%d%s" % (base_ms + int(i * 1000 / rate), row) for i in range(per_datagram))
+        for header in headers:
+            sock.sendto(header + lines, ("127.0.0.1", port))
+        sent += 1
+    sock.close()
+
+
+async def run_step(bands, args):
+    hub = Hub()
+    transport = await hub.listen_udp("127.0.0.1", 0)
+    sock = transport.get_extra_info("socket")
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 8 << 20)
+    port = transport.get_extra_info("sockname")[1]
+    for _ in range(args.subscribers):
+        hub.consume(lambda band_id, block: None)
+
+    senders = max(1, min(args.senders, bands))
+    per_sender = -(-bands // senders)
+    start_at = time.time() + 0.5
+    processes = []
+    for index in range(senders):
+        first = index * per_sender
+        count = min(per_sender, bands - first)
+        if count <= 0:
+            break
+        process = multiprocessing.Process(target=send_bands, args=(
+            port, first, count, args.rate, args.samples_per_datagram, args.seconds, start_at))
+        process.start()
+        processes.append(process)
+
+    await asyncio.sleep(max(0.0, start_at - time.time()))
+    cpu_started, wall_started = time.process_time(), time.monotonic()
+    while any(process.is_alive() for process in processes):
+        await asyncio.sleep(0.05)
+    await asyncio.sleep(0.2)  # Let the last datagrams drain
+    cpu, wall = time.process_time() - cpu_started, time.monotonic() - wall_started
+    for process in processes:
+        process.join()
+
+    stats = hub.stats()
+    received = sum(band["samples"] for band in stats["bands"].values())
+    expected = bands * int(args.seconds * args.rate / args.samples_per_datagram) * args.samples_per_datagram
+    await hub.close()
+    per_sample = cpu / received if received else float("inf")
+    return {
+        "bands": bands,
+        "expected_samples": expected,
+        "received_samples": received,
+        "loss": round(1 - received / expected, 4) if expected else 0.0,
+        "gaps": sum(band["gaps"] for band in stats["bands"].values()),
+        "subscriber_dropped": sum(sub["dropped"] for sub in stats["subscribers"]),
+        "hub_cpu_fraction": round(cpu / wall, 3),
+        "hub_us_per_sample": round(per_sample * 1e6, 2),
+        "bands_per_core": int(1 / per_sample / args.rate) if received else 0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--bands", type=int, nargs="+", default=[10, 50, 100, 200, 400])
+    parser.add_argument("--rate", type=float, default=100.0, help="samples per second per band")
+    parser.add_argument("--samples-per-datagram", type=int, default=5)
+    parser.add_argument("--seconds", type=float, default=5.0, help="duration of each step")
+    parser.add_argument("--subscribers", type=int, default=1)
+    parser.add_argument("--senders", type=int, default=max(1, (os.cpu_count() or 2) - 1),
+                        help="sender processes")
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    results = []
+    for bands in args.bands:
+        result = asyncio.run(run_step(bands, args))
+        results.append(result)
+        print(f"{bands:5d} bands: {result['received_samples']}/{result['expected_samples']} samples "
+              f"(loss {result['loss']:.2%}), hub CPU {result['hub_cpu_fraction']:.0%}, "
+              f"{result['hub_us_per_sample']} us/sample -> ~{result['bands_per_core']} bands per core")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"args": vars(args), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
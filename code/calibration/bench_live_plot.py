@@ -0,0 +1,173 @@
+"""
+Frame-time benchmark: clear-and-replot (as main.py and 5.py used to do)
+against LivePlot's persistent, blitted artists.
+
+Renders off-screen with the Agg backend, so it runs headless and measures
+drawing cost only. Each frame appends a few synthetic samples, like a 100 Hz
+board drawn at 20 FPS.
+
+    python bench_live_plot.py
+    python bench_live_plot.py --frames 500 --window 500 --json frames.json
+"""
+import argparse
+import json
+import time
+
+import matplotlib
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt
+import numpy as np
+
+from live_plot import LivePlot
+
+
+def synthetic_samples(count, rng):
+    """Random-walk accel/gyro/position rows: 9 columns"""
+    return np.cumsum(rng.normal(0, 0.01, size=(count, 9)), axis=0)
+
+
+def frame_times(step, frames, warmup=10):
+    for _ in range(warmup):
+        step()
+    times = np.empty(frames)
+    for index in range(frames):
+        started = time.perf_counter()
+        step()
+        times[index] = time.perf_counter() - started
+    return times
+
+
+def old_path_plot(args, rng):
+    """main.py before: lists with pop(0), ax.clear() and a full replot every frame"""
+    fig = plt.figure(figsize=(8, 6))
+    ax = fig.add_subplot(111, projection="3d")
+    pos_x, pos_y, pos_z = [], [], []
+
+    def step():
+        for row in synthetic_samples(args.samples_per_frame, rng):
+            pos_x.append(row[6])
+            pos_y.append(row[7])
+            pos_z.append(row[8])
+            if len(pos_x) > args.window:
+                pos_x.pop(0)
+                pos_y.pop(0)
+                pos_z.pop(0)
+        ax.clear()
+        ax.plot(pos_x, pos_y, pos_z, color="b", label="Path")
+        ax.scatter(pos_x[-1], pos_y[-1], pos_z[-1], color="r", marker="o", label="Current Position")
+        ax.set_xlim(-0.5, 0.5)
+        ax.set_ylim(-0.5, 0.5)
+        ax.set_zlim(-0.5, 0.5)
+        ax.legend()
+        fig.canvas.draw()
+
+    return fig, step
+
+
+def live_path_plot(args, rng):
+    fig = plt.figure(figsize=(8, 6))
+    ax = fig.add_subplot(111, projection="3d")
+    live = LivePlot(fig)
+    path = live.add_path3d(ax, window=args.window, limit=0.5)
+
+    def step():
+        path.extend(synthetic_samples(args.samples_per_frame, rng)[:, 6:9])
+        live.refresh()
+
+    return fig, step
+
+
+def old_three_panel(args, rng):
+    """5.py before: three axes cleared and replotted every frame"""
+    fig = plt.figure(figsize=(10, 12))
+    ax1 = fig.add_subplot(311)
+    ax2 = fig.add_subplot(312)
+    ax3 = fig.add_subplot(313, projection="3d")
+    history = [[] for _ in range(10)]
+
+    def step():
+        for row in synthetic_samples(args.samples_per_frame, rng):
+            history[0].append(len(history[0]))
+            for column in range(9):
+                history[column + 1].append(row[column])
+        for column in range(10):
+            del history[column][:-args.window]
+        t = history[0]
+        for ax in (ax1, ax2, ax3):
+            ax.clear()
+        for column, label in enumerate(["AccelX", "AccelY", "AccelZ"]):
+            ax1.plot(t, history[column + 1], label=label)
+        ax1.legend()
+        ax1.grid(True)
+        for column, label in enumerate(["GyroX", "GyroY", "GyroZ"]):
+            ax2.plot(t, history[column + 4], label=label)
+        ax2.legend()
+        ax2.grid(True)
+        ax3.plot(history[7], history[8], history[9], label="Path")
+        ax3.legend()
+        fig.canvas.draw()
+
+    return fig, step
+
+
+def live_three_panel(args, rng):
+    fig = plt.figure(figsize=(10, 12))
+    ax1 = fig.add_subplot(311)
+    ax2 = fig.add_subplot(312)
+    ax3 = fig.add_subplot(313, projection="3d")
+    live = LivePlot(fig)
+    accel = live.add_lines(ax1, ["AccelX", "AccelY", "AccelZ"], window=args.window)
+    gyro = live.add_lines(ax2, ["GyroX", "GyroY", "GyroZ"], window=args.window)
+    path = live.add_path3d(ax3, window=args.window, limit=0.5)
+
+    def step():
+        block = synthetic_samples(args.samples_per_frame, rng)
+        accel.extend(block[:, 0:3])
+        gyro.extend(block[:, 3:6])
+        path.extend(block[:, 6:9])
+        live.refresh()
+
+    return fig, step
+
+
+SCENARIOS = {
+    "path3d": (old_path_plot, live_path_plot),
+    "three_panel": (old_three_panel, live_three_panel),
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--frames", type=int, default=200)
+    parser.add_argument("--window", type=int, default=200, help="samples of history shown")
+    parser.add_argument("--samples-per-frame", type=int, default=5)
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    results = {}
+    for name, (old, new) in SCENARIOS.items():
+        result = {}
+        for label, build in (("clear_replot", old), ("live_plot", new)):
+            rng = np.random.default_rng(0)
+            fig, step = build(args, rng)
+            times = frame_times(step, args.frames) * 1000
+            plt.close(fig)
+            result[label] = {
+                "mean_ms": float(times.mean()),
+                "p50_ms": float(np.percentile(times, 50)),
+                "p99_ms": float(np.percentile(times, 99)),
+            }
+        result["speedup"] = result["clear_replot"]["mean_ms"] / result["live_plot"]["mean_ms"]
+        results[name] = result
+        print(f"{name}: clear+replot {result['clear_replot']['mean_ms']:.2f} ms/frame "
+              f"(p99 {result['clear_replot']['p99_ms']:.2f}), "
+              f"live_plot {result['live_plot']['mean_ms']:.2f} ms/frame "
+              f"(p99 {result['live_plot']['p99_ms']:.2f}): {result['speedup']:.1f}x faster")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"args": vars(args), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
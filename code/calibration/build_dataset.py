@@ -0,0 +1,365 @@
+"""
+Build gesture training data from recorded IMU sessions.
+
+Takes a directory of sessions (capture.py .imu files or CSV recordings) and
+cuts them into fixed-length labeled windows, optionally augmented, written
+as NumPy shards or as Edge Impulse data-acquisition files. Sessions are
+processed in a pool of worker processes, one file per task. Each worker
+cuts its session CHUNK_WINDOWS windows (plus their augmented copies) at a
+time and writes its shards as it goes. For .imu captures each chunk is a
+memmap slice, so memory stays bounded by a chunk however long the
+session. CSV sessions are parsed whole into memory first; convert long
+ones with capture.py.
+
+Labels for a session come from a sidecar file "<session>.labels.csv" with
+rows "start_ms,end_ms,label" (sample timestamps). Without one, the part of
+the file name before the first dot is the label for the whole session, as
+in Edge Impulse ("circle.band1-0001.imu"). Labels must be gesture names in
+the broker's routes.json, or "idle".
+
+    python build_dataset.py sessions/ dataset/ --window 118 --stride 20 --augment 3
+    python build_dataset.py sessions/ ei_upload/ --format ei-json --rate 59
+"""
+import argparse
+import csv
+import json
+import os
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from capture import Capture, is_capture
+from imu_stream import FIELDS, TIMESTAMP
+from recognizer import BAND_EDGES, window_features
+
+ROUTES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..",
+                           "LocalBroker", "FlaskServer", "routes.json")
+IDLE = "idle"
+SESSION_EXTENSIONS = (".imu", ".csv")
+# Windows cut from a segment at a time
+CHUNK_WINDOWS = 1024
+# Edge Impulse sensor names and units for our channels
+EI_SENSORS = {"ax": ("accX", "g"), "ay": ("accY", "g"), "az": ("accZ", "g"),
+              "gx": ("gyrX", "deg/s"), "gy": ("gyrY", "deg/s"), "gz": ("gyrZ", "deg/s"), "temp": ("temp", "C")}
+
+
+def known_labels(routes_path=ROUTES_PATH):
+    """Gesture names from the broker's routing table, plus idle"""
+    with open(routes_path) as f:
+        return [IDLE] + sorted(json.load(f)["symbols"])
+
+
+def find_sessions(directory):
+    return sorted(os.path.join(root, name)
+                  for root, _, names in os.walk(directory)
+                  for name in names
+                  if name.endswith(SESSION_EXTENSIONS) and not name.endswith(".labels.csv"))
+
+
+def read_segments(session, timestamps):
+    """[(start_ms, end_ms, label)] for a session, from its sidecar or its file name"""
+    sidecar = os.path.splitext(session)[0] + ".labels.csv"
+    if os.path.exists(sidecar):
+        segments = []
+        with open(sidecar, newline="") as f:
+            for row in csv.reader(f):
+                if len(row) < 3:
+                    continue
+                try:
+                    segments.append((float(row[0]), float(row[1]), row[2].strip()))
+                except ValueError:
+                    continue  # Header
+        return segments
+    label = os.path.basename(session).split(".")[0]
+    return [(timestamps[0], timestamps[-1] + 1, label)] if len(timestamps) else []
+
+
+def open_session(path, layout, rate):
+    """(timestamps, slice-able samples, rate): a memmap for captures, the whole file parsed for CSV"""
+    if is_capture(path):
+        capture = Capture(path)
+        timestamps = np.asarray(capture.timestamps, dtype=float)
+        return timestamps, capture, rate or capture.sample_rate
+    from replay import load_session
+    samples, rate = load_session(path, layout, rate)
+    return samples[:, TIMESTAMP], samples, rate
+
+
+def session_key(path, root):
+    """Stable number for a session: CRC-32 of its path relative to ``root``, with / separators"""
+    relative = os.path.relpath(path, root).replace(os.sep, "/")
+    return zlib.crc32(relative.encode("utf-8"))
+
+
+def session_prefix(path, root):
+    """Output file prefix for a session: its path under ``root``, without extension, flattened
+
+    Dots become "_" too, since Edge Impulse reads the label up to the first dot.
+    """
+    relative = os.path.splitext(os.path.relpath(path, root))[0]
+    return relative.replace(os.sep, "__").replace("/", "__").replace(".", "_")
+
+
+def segment_samples(source, start, stop):
+    return source.samples(start, stop) if isinstance(source, Capture) else source[start:stop]
+
+
+# -- augmentation -----------------------------------------------------------
+
+def jitter(windows, rng, sigma):
+    return windows + rng.normal(0.0, sigma, windows.shape)
+
+
+def scale(windows, rng, sigma):
+    return windows * rng.normal(1.0, sigma, (len(windows), 1, windows.shape[2]))
+
+
+def time_warp(windows, rng, sigma, knots=4):
+    """Resample each window along a smooth random time axis (speed varies by ~sigma)"""
+    count, length, _ = windows.shape
+    speed_knots = np.clip(rng.normal(1.0, sigma, (count, knots + 2)), 0.1, None)
+    grid = np.linspace(0, 1, knots + 2)
+    position = np.linspace(0, 1, length)
+    # Piecewise-linear speed curve per window, integrated and rescaled to [0, length - 1]
+    segment = np.minimum((position * (knots + 1)).astype(int), knots)
+    fraction = (position - grid[segment]) * (knots + 1)
+    speed = speed_knots[:, segment] * (1 - fraction) + speed_knots[:, segment + 1] * fraction
+    warped = np.cumsum(speed, axis=1)
+    warped = (warped - warped[:, :1]) / (warped[:, -1:] - warped[:, :1]) * (length - 1)
+
+    below = np.clip(np.floor(warped).astype(int), 0, length - 2)
+    weight = (warped - below)[:, :, None]
+    rows = np.arange(count)[:, None]
+    return windows[rows, below] * (1 - weight) + windows[rows, below + 1] * weight
+
+
+def augment(windows, rng, copies, jitter_sigma, scale_sigma, warp_sigma):
+    """``copies`` augmented versions of every window, each with jitter, scaling and time warp"""
+    if not copies or not len(windows):
+        return np.empty((0,) + windows.shape[1:])
+    repeated = np.repeat(windows, copies, axis=0)
+    if warp_sigma:
+        repeated = time_warp(repeated, rng, warp_sigma)
+    if scale_sigma:
+        repeated = scale(repeated, rng, scale_sigma)
+    if jitter_sigma:
+        repeated = jitter(repeated, rng, jitter_sigma * windows.std(axis=(0, 1)))
+    return repeated
+
+
+# -- writers ----------------------------------------------------------------
+
+class ShardWriter:
+    """Buffers windows and writes .npz shards of up to ``shard_size`` windows"""
+
+    def __init__(self, directory, prefix, labels, channels, rate, shard_size, features):
+        self.directory = directory
+        self.prefix = prefix
+        self.labels = labels
+        self.channels = channels
+        self.rate = rate
+        self.shard_size = shard_size
+        self.features = features
+        self.paths = []
+        self._windows, self._targets, self._offsets = [], [], []
+        self._buffered = 0
+
+    def add(self, windows, label, offsets):
+        self._windows.append(windows.astype(np.float32))
+        self._targets.append(np.full(len(windows), self.labels.index(label), dtype=np.int16))
+        self._offsets.append(offsets)
+        self._buffered += len(windows)
+        while self._buffered >= self.shard_size:
+            self._write(self.shard_size)
+
+    def close(self):
+        if self._buffered:
+            self._write(self._buffered)
+
+    def _write(self, count):
+        windows, targets, offsets = (np.concatenate(parts) for parts in (self._windows, self._targets, self._offsets))
+        path = os.path.join(self.directory, f"{self.prefix}-{len(self.paths):05d}.npz")
+        arrays = {"windows": windows[:count], "targets": targets[:count], "offsets": offsets[:count],
+                  "labels": np.array(self.labels), "channels": np.array(self.channels), "rate": self.rate}
+        if self.features:
+            arrays["features"] = window_features(windows[:count], self.rate, BAND_EDGES).astype(np.float32)
+        np.savez_compressed(path, **arrays)
+        self.paths.append(path)
+        self._windows, self._targets, self._offsets = [windows[count:]], [targets[count:]], [offsets[count:]]
+        self._buffered = len(windows) - count
+
+
+class EdgeImpulseWriter:
+    """One Edge Impulse data-acquisition file per window: "<label>.<session>_<n>.json|csv"
+
+    Edge Impulse takes the label from the file name up to the first dot.
+    """
+
+    def __init__(self, directory, prefix, channels, rate, file_format):
+        self.directory = directory
+        self.prefix = prefix
+        self.channels = channels
+        self.interval_ms = 1000.0 / rate
+        self.file_format = file_format
+        self.paths = []
+
+    def add(self, windows, label, offsets):
+        for window in windows:
+            path = os.path.join(self.directory, f"{label}.{self.prefix}_{len(self.paths):06d}.{self.file_format}")
+            if self.file_format == "json":
+                self._write_json(path, window)
+            else:
+                self._write_csv(path, window)
+            self.paths.append(path)
+
+    def _write_json(self, path, window):
+        document = {
+            "protected": {"ver": "v1", "alg": "none"},
+            "signature": "0" * 64,
+            "payload": {
+                "device_type": "FLICKNEST_BAND",
+                "interval_ms": self.interval_ms,
+                "sensors": [{"name": EI_SENSORS[name][0], "units": EI_SENSORS[name][1]} for name in self.channels],
+                "values": np.round(window, 5).tolist(),
+            },
+        }
+        with open(path, "w") as f:
+            json.dump(document, f)
+
+    def _write_csv(self, path, window):
+        timestamps = np.arange(len(window)) * self.interval_ms
+        header = ",".join(["timestamp"] + [EI_SENSORS[name][0] for name in self.channels])
+        np.savetxt(path, np.column_stack((timestamps, window)), delimiter=",", header=header, comments="", fmt="%.5g")
+
+    def close(self):
+        pass
+
+
+# -- per-session work (runs in the pool) ---------------------------------------
+
+def process_session(path, options):
+    """Window, augment and write one session; returns its summary"""
+    labels = options["labels"]
+    channels = [FIELDS.index(name) for name in options["channels"]]
+    window, stride = options["window"], options["stride"]
+    timestamps, source, rate = open_session(path, options["layout"], options["rate"])
+    if not rate:
+        rate = 1000.0 / np.median(np.diff(timestamps)) if len(timestamps) > 1 else 1.0
+
+    prefix = session_prefix(path, options["sessions"])
+    if options["format"] == "npz":
+        writer = ShardWriter(options["out"], prefix, labels, options["channels"], rate,
+                             options["shard_size"], options["features"])
+    else:
+        writer = EdgeImpulseWriter(options["out"], prefix, options["channels"], rate, options["format"].split("-")[1])
+
+    calibration = None
+    if options["profile"]:
+        from calibrate import Calibration
+        calibration = Calibration.load(options["profile"])
+
+    # Seeded per file, by its path under the input directory, so rebuilding gives the same dataset
+    rng = np.random.default_rng([options["seed"], session_key(path, options["sessions"])])
+    counts, skipped = {}, []
+    for start_ms, end_ms, label in read_segments(path, timestamps):
+        if label not in labels:
+            skipped.append(label)
+            continue
+        start, stop = (int(index) for index in np.searchsorted(timestamps, [start_ms, end_ms]))
+        # A chunk of CHUNK_WINDOWS windows at a time, so a long segment is never held whole
+        for first in range(start, stop - window + 1, stride * CHUNK_WINDOWS):
+            last = min(stop, first + stride * (CHUNK_WINDOWS - 1) + window)
+            samples = segment_samples(source, first, last)
+            if calibration is not None:
+                # Into a new array: CSV sessions slice one shared array
+                samples = calibration.apply(samples, out=np.empty_like(samples))
+            values = np.nan_to_num(samples[:, channels])
+
+            # All windows of the chunk as one strided view; stride picks every n-th
+            windows = sliding_window_view(values, window, axis=0)[::stride].transpose(0, 2, 1)
+            offsets = first + np.arange(len(windows)) * stride
+            extra = augment(windows, rng, options["augment"], options["jitter"], options["scale"], options["warp"])
+            writer.add(np.concatenate((windows, extra)), label,
+                       np.concatenate((offsets, np.repeat(offsets, options["augment"]))))
+            counts[label] = counts.get(label, 0) + len(windows) + len(extra)
+    writer.close()
+    return {"session": path, "rate": rate, "counts": counts, "files": len(writer.paths),
+            "shards": [os.path.basename(p) for p in writer.paths] if options["format"] == "npz" else [],
+            "unknown_labels": sorted(set(skipped))}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("sessions", help="directory of .imu / .csv sessions (searched recursively)")
+    parser.add_argument("out", help="output directory")
+    parser.add_argument("--format", choices=("npz", "ei-json", "ei-csv"), default="npz")
+    parser.add_argument("--window", type=int, default=118, help="samples per window (the bands' model uses 118)")
+    parser.add_argument("--stride", type=int, default=20, help="samples between window starts")
+    parser.add_argument("--channels", nargs="+", default=["ax", "ay", "az", "gx", "gy", "gz"])
+    parser.add_argument("--layout", default="csv", help="column layout of CSV sessions")
+    parser.add_argument("--rate", type=float, help="sample rate in Hz (needed for CSV without timestamps)")
+    parser.add_argument("--augment", type=int, default=0, help="augmented copies per window")
+    parser.add_argument("--jitter", type=float, default=0.05, help="noise, as a fraction of each channel's std")
+    parser.add_argument("--scale", type=float, default=0.1, help="std of the per-channel scale factor")
+    parser.add_argument("--warp", type=float, default=0.2, help="std of the time-warp speed")
+    parser.add_argument("--features", action="store_true", help="also store recognizer features in npz shards")
+    parser.add_argument("--shard-size", type=int, default=4096, help="windows per npz shard")
+    parser.add_argument("--profile", help="calibration profile to apply to every session")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="worker processes")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    sessions = find_sessions(args.sessions)
+    if not sessions:
+        parser.error(f"No .imu or .csv sessions in {args.sessions}")
+    # Sessions write files named after their prefix; two with one prefix would overwrite each other
+    prefixes = {}
+    for path in sessions:
+        prefixes.setdefault(session_prefix(path, args.sessions), []).append(path)
+    clashes = [paths for paths in prefixes.values() if len(paths) > 1]
+    if clashes:
+        parser.error("Sessions would write the same output files; rename them: "
+                     + "; ".join(", ".join(paths) for paths in clashes))
+    os.makedirs(args.out, exist_ok=True)
+    options = dict(vars(args), labels=known_labels())
+
+    started = time.perf_counter()
+    summaries, failed = [], []
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        futures = {pool.submit(process_session, path, options): path for path in sessions}
+        for future in as_completed(futures):
+            try:
+                summary = future.result()
+            except Exception as e:
+                # One bad session (unreadable file, malformed labels) must not lose the rest
+                failed.append({"session": futures[future], "error": f"{type(e).__name__}: {e}"})
+                print(f"FAILED {futures[future]}: {e}")
+                continue
+            summaries.append(summary)
+            print(f"{summary['session']}: {sum(summary['counts'].values())} windows {summary['counts']}"
+                  + (f", unknown labels {summary['unknown_labels']}" if summary["unknown_labels"] else ""))
+
+    totals = {}
+    for summary in summaries:
+        for label, count in summary["counts"].items():
+            totals[label] = totals.get(label, 0) + count
+    manifest = {
+        "created": time.time(),
+        "config": {key: options[key] for key in ("format", "window", "stride", "channels", "augment",
+                                                  "jitter", "scale", "warp", "seed", "profile")},
+        "labels": options["labels"],
+        "totals": totals,
+        "sessions": sorted(summaries, key=lambda s: s["session"]),
+        "failed": failed,
+    }
+    with open(os.path.join(args.out, "manifest.json"), "w") as f:
+        json.dump(manifest, f, indent=2)
+    print(f"{sum(totals.values())} windows from {len(summaries)} sessions in "
+          f"{time.perf_counter() - started:.1f} s: {totals}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,247 @@
+"""
+IMU calibration: estimate a board's sensor errors from a recorded session
+and correct live samples with them.
+
+Nothing in this directory corrected sensor offsets (the gyro reads tens of
+deg/s in parts of output.csv, and main.py assumed exactly 9.81 of gravity).
+From a recording in which the board is held still in several orientations,
+estimate_profile() finds, vectorized over the whole recording:
+
+  * gyro bias: mean rate while still, as a linear function of temperature
+    when the recording spans enough of it (temperature drift)
+  * accelerometer bias and scale per axis: least-squares fit of the
+    still-pose means to a sphere of radius 1 g (needs >= 6 poses that
+    point in different directions; fewer poses only fit a common scale)
+
+Still periods are found by the rolling standard deviation of both sensors,
+so a large gyro bias doesn't hide them.
+
+A profile is a JSON file per device. Calibration.apply() corrects a whole
+(k, len(FIELDS)) block in place with one multiply-add (plus the
+temperature term), so ImuStream can apply it to every block it reads:
+
+    python calibrate.py session.imu --sensor band-1 --out profiles/band-1.json
+    stream = ImuStream(open_serial('COM9'), calibration=Calibration.load('profiles/band-1.json'))
+"""
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+
+from imu_stream import ACCEL, FIELDS, GYRO, TEMP, TIMESTAMP
+
+# Still means the rolling std over STILL_WINDOW seconds is below these (g, deg/s)
+STILL_WINDOW = 1.0
+ACCEL_STILL_STD = 0.02
+GYRO_STILL_STD = 1.0
+# Still periods whose mean accel directions are closer than this are one pose
+POSE_SEPARATION = 0.3
+MIN_POSES_FOR_ELLIPSOID = 6
+# Temperature range (deg C) below which drift is not fitted
+MIN_TEMPERATURE_SPAN = 2.0
+
+
+def rolling_std(values, window):
+    """Std of each ``window``-sample run ending at every sample (n, c), vectorized with cumsums"""
+    values = np.asarray(values, dtype=float)
+    padded = np.vstack((np.zeros((1, values.shape[1])), values))
+    total = np.cumsum(padded, axis=0)
+    squares = np.cumsum(padded ** 2, axis=0)
+    window = max(1, min(window, len(values)))
+    result = np.full(values.shape, np.inf)
+    total = total[window:] - total[:-window]
+    squares = squares[window:] - squares[:-window]
+    result[window - 1:] = np.sqrt(np.maximum(squares / window - (total / window) ** 2, 0.0))
+    return result
+
+
+def still_mask(samples, rate, window=STILL_WINDOW, accel_std=ACCEL_STILL_STD, gyro_std=GYRO_STILL_STD):
+    """True for samples inside a still period (every sample of a still window)"""
+    size = max(2, int(round(window * rate)))
+    accel = rolling_std(samples[:, ACCEL], size).max(axis=1) < accel_std
+    gyro = rolling_std(samples[:, GYRO], size).max(axis=1) < gyro_std
+    ends = accel & gyro
+    # A window ending at i marks samples i - size + 1 .. i as still
+    counts = np.cumsum(np.concatenate(([0], ends.astype(int))))
+    covered = counts[np.minimum(np.arange(len(ends)) + size, len(ends))] - counts[np.arange(len(ends))]
+    return covered > 0
+
+
+def still_periods(mask):
+    """(start, stop) index pairs of the runs of True in ``mask``"""
+    edges = np.flatnonzero(np.diff(np.concatenate(([0], mask.astype(int), [0]))))
+    return list(zip(edges[::2], edges[1::2]))
+
+
+def group_poses(means, separation=POSE_SEPARATION):
+    """Merge still-period mean accel vectors pointing the same way; returns pose means (p, 3)"""
+    poses, weights = [], []
+    for mean, weight in means:
+        direction = mean / (np.linalg.norm(mean) or 1.0)
+        for index, pose in enumerate(poses):
+            if np.linalg.norm(direction - pose / np.linalg.norm(pose)) < separation:
+                total = weights[index] + weight
+                poses[index] = (pose * weights[index] + mean * weight) / total
+                weights[index] = total
+                break
+        else:
+            poses.append(mean.copy())
+            weights.append(weight)
+    return np.array(poses).reshape(-1, 3)
+
+
+def fit_accelerometer(poses):
+    """Per-axis bias and scale mapping every pose onto |a| = 1 g
+
+    Fits u . a^2 + v . a = 1 by least squares; completing the square gives
+    bias = -v / 2u and scale = sqrt(u / (1 + sum(v^2 / 4u))).
+    """
+    design = np.hstack((poses ** 2, poses))
+    solution = np.linalg.lstsq(design, np.ones(len(poses)), rcond=None)[0]
+    u, v = solution[:3], solution[3:]
+    if np.any(u <= 0):
+        raise ValueError("Accelerometer poses don't constrain an ellipsoid; record more orientations")
+    bias = -v / (2 * u)
+    scale = np.sqrt(u / (1 + np.sum(v * v / (4 * u))))
+    return bias, scale
+
+
+def estimate_profile(samples, rate, sensor_id="", **still_options):
+    """Calibration profile (a dict, see Calibration) from a (n, len(FIELDS)) recording"""
+    samples = np.asarray(samples, dtype=float)
+    samples = samples[np.isfinite(samples[:, ACCEL]).all(axis=1) & np.isfinite(samples[:, GYRO]).all(axis=1)]
+    mask = still_mask(samples, rate, **still_options)
+    if not mask.any():
+        raise ValueError("No still periods found; hold the board still for a few seconds in each pose")
+    still = samples[mask]
+
+    # Gyro bias, with temperature drift if the temperature moved enough
+    gyro = still[:, GYRO]
+    temperature = still[:, TEMP]
+    known = np.isfinite(temperature)
+    gyro_bias = gyro.mean(axis=0)
+    temp_ref = float(np.median(temperature[known])) if known.any() else None
+    drift = np.zeros(3)
+    if known.sum() > 10 and np.ptp(temperature[known]) >= MIN_TEMPERATURE_SPAN:
+        design = np.column_stack((np.ones(known.sum()), temperature[known] - temp_ref))
+        gyro_bias, drift = np.linalg.lstsq(design, gyro[known], rcond=None)[0]
+
+    # Accelerometer: one mean vector per still period, merged into poses
+    periods = still_periods(mask)
+    means = [(samples[start:stop, ACCEL].mean(axis=0), stop - start) for start, stop in periods]
+    poses = group_poses(means)
+    if len(poses) >= MIN_POSES_FOR_ELLIPSOID:
+        accel_bias, accel_scale = fit_accelerometer(poses)
+        method = "ellipsoid"
+    else:
+        accel_bias = np.zeros(3)
+        accel_scale = np.full(3, 1.0 / np.mean(np.linalg.norm(poses, axis=1)))
+        method = "magnitude"
+    corrected = (poses - accel_bias) * accel_scale
+    residual = np.abs(np.linalg.norm(corrected, axis=1) - 1.0)
+
+    return {
+        "sensor_id": sensor_id,
+        "created": time.time(),
+        "samples": int(len(samples)),
+        "still_samples": int(mask.sum()),
+        "poses": int(len(poses)),
+        "accel": {"method": method, "bias": accel_bias.tolist(), "scale": accel_scale.tolist(),
+                  "residual_g": float(residual.max())},
+        "gyro": {"bias": np.asarray(gyro_bias).tolist(), "temp_coeff": np.asarray(drift).tolist(),
+                 "temp_ref": temp_ref},
+    }
+
+
+class Calibration:
+    """Applies a calibration profile to sample blocks.
+
+    The correction is affine per column: ``block * scale + offset``, plus
+    ``-temp_coeff * (temp - temp_ref)`` on the gyro when the profile has
+    a temperature drift. Timestamp and temperature pass through.
+    """
+
+    def __init__(self, profile):
+        self.profile = profile
+        accel, gyro = profile["accel"], profile["gyro"]
+        self.scale = np.ones(len(FIELDS))
+        self.offset = np.zeros(len(FIELDS))
+        self.scale[ACCEL] = accel["scale"]
+        self.offset[ACCEL] = -np.asarray(accel["bias"]) * np.asarray(accel["scale"])
+        self.offset[GYRO] = -np.asarray(gyro["bias"])
+        self.temp_coeff = np.asarray(gyro.get("temp_coeff") or np.zeros(3), dtype=float)
+        self.temp_ref = gyro.get("temp_ref")
+        self.drift = self.temp_ref is not None and bool(np.any(self.temp_coeff))
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            return cls(json.load(f))
+
+    def save(self, path):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path, "w") as f:
+            json.dump(self.profile, f, indent=2)
+
+    def apply(self, block, out=None):
+        """Correct a (k, len(FIELDS)) block; in place unless ``out`` is given"""
+        out = block if out is None else out
+        np.multiply(block, self.scale, out=out)
+        out += self.offset
+        if self.drift:
+            # Unknown temperature: assume the reference (no drift term)
+            delta = np.nan_to_num(block[:, TEMP] - self.temp_ref)
+            out[:, GYRO] -= delta[:, None] * self.temp_coeff
+        return out
+
+
+def main():
+    from capture import Capture, is_capture
+    from replay import load_session
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("recording", help="CSV recording or capture.py file with the board held in several poses")
+    parser.add_argument("--layout", default="csv", help="the CSV's column layout")
+    parser.add_argument("--rate", type=float, help="sample rate in Hz (default: capture header or timestamps)")
+    parser.add_argument("--sensor", help="sensor ID (default: capture header or file name)")
+    parser.add_argument("--out", help="profile to write (default: profiles/<sensor>.json)")
+    args = parser.parse_args()
+
+    try:
+        samples, rate = load_session(args.recording, args.layout, args.rate)
+    except ValueError as e:
+        parser.error(str(e))
+    if not rate:
+        rate = 1000 / np.median(np.diff(samples[:, TIMESTAMP]))
+    sensor = args.sensor or (Capture(args.recording).sensor_id if is_capture(args.recording) else "")
+    sensor = sensor or os.path.splitext(os.path.basename(args.recording))[0]
+
+    started = time.perf_counter()
+    try:
+        profile = estimate_profile(samples, rate, sensor)
+    except ValueError as e:
+        parser.error(str(e))
+    elapsed = time.perf_counter() - started
+
+    calibration = Calibration(profile)
+    out = args.out or os.path.join("profiles", f"{sensor}.json")
+    calibration.save(out)
+
+    corrected = calibration.apply(samples.copy())
+    still = still_mask(samples, rate)
+    print(f"{profile['samples']} samples, {profile['still_samples']} still, {profile['poses']} poses "
+          f"({profile['accel']['method']} fit) in {elapsed * 1000:.1f} ms")
+    print(f"gyro bias (deg/s): {np.round(profile['gyro']['bias'], 3)}, "
+          f"drift (deg/s/C): {np.round(profile['gyro']['temp_coeff'], 4)}")
+    print(f"accel bias (g): {np.round(profile['accel']['bias'], 4)}, scale: {np.round(profile['accel']['scale'], 4)}")
+    print(f"still gyro after: {np.round(np.abs(corrected[still][:, GYRO].mean(axis=0)), 3)} deg/s, "
+          f"|accel| {np.mean(np.linalg.norm(corrected[still][:, ACCEL], axis=1)):.4f} g")
+    print("Wrote", out)
+
+
+if __name__ == "__main__":
+    main()
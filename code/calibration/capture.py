@@ -0,0 +1,248 @@
+"""
+Binary IMU captures: a fixed-width record per sample, memory-mapped for reading.
+
+Recordings used to be CSV text (output.csv), parsed with float() per field
+every time they were loaded. A capture file is a 64-byte header followed by
+packed records of RECORD_DTYPE, so loading a session is an np.memmap: no
+parsing, no copy, and any time range is a slice found by binary search.
+
+Header (little-endian):
+
+    magic        8s   b"FNIMU\\0\\0\\0"
+    version      u2   SCHEMA_VERSION
+    record_size  u2   bytes per record, so readers can check the schema
+    sample_rate  f8   Hz, 0 if unknown
+    started      f8   Unix time the capture started
+    sensor_id    32s  UTF-8, NUL padded (band or board name)
+    (padding up to HEADER_SIZE)
+
+Records hold the imu_stream FIELDS: timestamp in ms as float64, the rest as
+float32. The sample count is not stored; it follows from the file size, so a
+capture cut short by a crash is still readable.
+
+    python capture.py convert output.csv output.imu --rate 10 --sensor band-1
+    python capture.py record COM9 session.imu --seconds 60 --sensor band-1
+    python capture.py info session.imu
+"""
+import argparse
+import os
+import struct
+import time
+
+import numpy as np
+
+from imu_stream import FIELDS, ImuStream, TIMESTAMP, layout_columns, open_serial
+
+MAGIC = b"FNIMU\0\0\0"
+SCHEMA_VERSION = 1
+HEADER_SIZE = 64
+HEADER_FORMAT = "<8sHHdd32s"
+
+RECORD_DTYPE = np.dtype([(name, "<f8" if name == "timestamp" else "<f4") for name in FIELDS])
+
+
+def is_capture(path):
+    """True if the file starts with the capture magic"""
+    with open(path, "rb") as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+def to_records(block):
+    """(k, len(FIELDS)) sample block -> structured records"""
+    block = np.asarray(block, dtype=float).reshape(-1, len(FIELDS))
+    records = np.empty(len(block), dtype=RECORD_DTYPE)
+    for column, name in enumerate(FIELDS):
+        records[name] = block[:, column]
+    return records
+
+
+def to_block(records):
+    """Structured records -> (k, len(FIELDS)) float64 sample block"""
+    block = np.empty((len(records), len(FIELDS)))
+    for column, name in enumerate(FIELDS):
+        block[:, column] = records[name]
+    return block
+
+
+class CaptureWriter:
+    """Appends sample blocks to a new capture file."""
+
+    def __init__(self, path, sample_rate=0.0, sensor_id="", started=None):
+        self.path = path
+        self.samples = 0
+        self._file = open(path, "wb")
+        sensor = sensor_id.encode("utf-8")[:32]
+        header = struct.pack(HEADER_FORMAT, MAGIC, SCHEMA_VERSION, RECORD_DTYPE.itemsize,
+                             float(sample_rate or 0.0), time.time() if started is None else started, sensor)
+        self._file.write(header.ljust(HEADER_SIZE, b"\0"))
+
+    def write(self, block):
+        """Append a (k, len(FIELDS)) sample block, e.g. from ImuStream.read_block()"""
+        if len(block):
+            self._file.write(to_records(block).tobytes())
+            self.samples += len(block)
+
+    def flush(self):
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class Capture:
+    """A capture file opened for reading, memory-mapped.
+
+    ``records`` is the structured memmap (zero-copy); ``samples()`` and
+    ``time_range()`` return float blocks in the imu_stream schema.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            header = f.read(HEADER_SIZE)
+        if len(header) < HEADER_SIZE or header[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} is not an IMU capture")
+        magic, version, record_size, sample_rate, started, sensor = struct.unpack_from(HEADER_FORMAT, header)
+        if version != SCHEMA_VERSION or record_size != RECORD_DTYPE.itemsize:
+            raise ValueError(f"{path}: unsupported capture version {version} ({record_size}-byte records)")
+        self.version = version
+        self.sample_rate = sample_rate or None
+        self.started = started
+        self.sensor_id = sensor.rstrip(b"\0").decode("utf-8", errors="replace")
+
+        # A partly written last record (crash mid-write) is ignored
+        count = (os.path.getsize(path) - HEADER_SIZE) // RECORD_DTYPE.itemsize
+        if count:
+            self.records = np.memmap(path, dtype=RECORD_DTYPE, mode="r", offset=HEADER_SIZE, shape=(count,))
+        else:
+            self.records = np.empty(0, dtype=RECORD_DTYPE)
+
+    def __len__(self):
+        return len(self.records)
+
+    @property
+    def timestamps(self):
+        """Sample timestamps in ms (a view)"""
+        return self.records["timestamp"]
+
+    @property
+    def duration(self):
+        """Seconds between the first and last sample"""
+        if len(self) < 2:
+            return 0.0
+        return float(self.timestamps[-1] - self.timestamps[0]) / 1000
+
+    def samples(self, start=0, stop=None):
+        """Samples [start, stop) as a (k, len(FIELDS)) block"""
+        return to_block(self.records[start:stop])
+
+    def index_range(self, start_ms=None, end_ms=None):
+        """Indices [first, last) of the samples with start_ms <= timestamp < end_ms"""
+        timestamps = self.timestamps
+        first = 0 if start_ms is None else int(np.searchsorted(timestamps, start_ms, side="left"))
+        last = len(self) if end_ms is None else int(np.searchsorted(timestamps, end_ms, side="left"))
+        return first, max(first, last)
+
+    def time_range(self, start_ms=None, end_ms=None):
+        """Samples with start_ms <= timestamp < end_ms (timestamps must be increasing)"""
+        return self.samples(*self.index_range(start_ms, end_ms))
+
+    def info(self):
+        return {
+            "path": self.path,
+            "version": self.version,
+            "sensor_id": self.sensor_id,
+            "sample_rate": self.sample_rate,
+            "started": self.started,
+            "samples": len(self),
+            "duration_s": round(self.duration, 3),
+            "bytes": os.path.getsize(self.path),
+        }
+
+    def close(self):
+        # Drop the reference; the mapping closes once no views remain
+        self.records = np.empty(0, dtype=RECORD_DTYPE)
+
+
+def convert_csv(csv_path, capture_path, layout="csv", sample_rate=None, sensor_id=""):
+    """Convert a CSV recording to a capture; returns the number of samples.
+
+    Layouts without timestamps get ``i * 1000 / sample_rate`` ms.
+    """
+    has_timestamp = "timestamp" in layout_columns(layout)
+    if not has_timestamp and not sample_rate:
+        raise ValueError(f"layout '{layout}' has no timestamps: a sample rate is needed")
+    with open(csv_path, "rb") as source, CaptureWriter(capture_path, sample_rate, sensor_id,
+                                                       started=os.path.getmtime(csv_path)) as writer:
+        stream = ImuStream(source, layout=layout, capacity=1, chunk_size=1 << 20)
+        for block in stream.blocks():
+            if not has_timestamp:
+                block[:, TIMESTAMP] = (writer.samples + np.arange(len(block))) * 1000 / sample_rate
+            writer.write(block)
+        return writer.samples
+
+
+def record(port, capture_path, layout="sensor", seconds=None, sensor_id="", sample_rate=None):
+    """Record a live board to a capture until ``seconds`` pass or Ctrl+C"""
+    stream = ImuStream(open_serial(port), layout=layout)
+    deadline = None if seconds is None else time.monotonic() + seconds
+    with CaptureWriter(capture_path, sample_rate, sensor_id or port) as writer:
+        try:
+            while deadline is None or time.monotonic() < deadline:
+                block = stream.read_block()
+                if block is None:
+                    break
+                writer.write(block)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            stream.close()
+        return writer.samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    convert = commands.add_parser("convert", help="convert a CSV recording")
+    convert.add_argument("csv")
+    convert.add_argument("capture")
+    convert.add_argument("--layout", default="csv", help="column layout (see imu_stream.LAYOUTS)")
+    convert.add_argument("--rate", type=float, help="sample rate in Hz (needed without timestamps)")
+    convert.add_argument("--sensor", default="", help="sensor / band ID stored in the header")
+
+    rec = commands.add_parser("record", help="record a live board")
+    rec.add_argument("port")
+    rec.add_argument("capture")
+    rec.add_argument("--layout", default="sensor")
+    rec.add_argument("--seconds", type=float)
+    rec.add_argument("--rate", type=float, help="nominal sample rate stored in the header")
+    rec.add_argument("--sensor", default="")
+
+    info = commands.add_parser("info", help="show a capture's header")
+    info.add_argument("capture")
+
+    args = parser.parse_args()
+    if args.command == "convert":
+        started = time.perf_counter()
+        try:
+            count = convert_csv(args.csv, args.capture, args.layout, args.rate, args.sensor)
+        except ValueError as e:
+            parser.error(str(e))
+        print(f"Wrote {count} samples to {args.capture} in {time.perf_counter() - started:.3f} s")
+    elif args.command == "record":
+        count = record(args.port, args.capture, args.layout, args.seconds, args.sensor, args.rate)
+        print(f"Recorded {count} samples to {args.capture}")
+    else:
+        for key, value in Capture(args.capture).info().items():
+            print(f"{key}: {value}")
+
+
+if __name__ == "__main__":
+    main()
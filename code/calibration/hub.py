@@ -0,0 +1,398 @@
+"""
+One process ingesting many bands at once: serial ports, UDP and TCP.
+
+Every tool so far reads one board on one hard-coded port in a blocking
+loop. The hub runs all sources on one asyncio loop, tags each sample block
+with its band ID, keeps the latest samples of every band in its own
+SampleRing and fans blocks out to subscribers (recorder, recognizer,
+plots, ...) through bounded queues, so a slow consumer drops its own
+oldest blocks instead of stalling ingestion.
+
+Wire format for UDP and TCP: CSV lines in the hub's layout (sensor.py's by
+default). A line "@<band id>" names the band for the rest of the datagram
+or connection; without one the sender's address is the band ID.
+
+    python hub.py --udp 0.0.0.0:9000 --tcp 0.0.0.0:9001 --serial band-1=COM9
+    python hub.py --udp 0.0.0.0:9000 --record captures/ --model gestures.npz --broker http://localhost:5000
+
+bench_hub.py measures how many 100 Hz bands one core can take.
+"""
+import argparse
+import asyncio
+import logging
+import os
+import time
+
+import numpy as np
+
+from imu_stream import TIMESTAMP, ImuStream, LineParser, SampleRing, open_serial
+
+logger = logging.getLogger(__name__)
+
+# A sample interval this many times the band's typical interval counts as a gap
+GAP_FACTOR = 3.0
+
+# A TCP peer's unfinished line longer than this is dropped as malformed
+MAX_LINE_BYTES = 4096
+
+
+class Band:
+    """One band's ring buffer, line parser and statistics."""
+
+    def __init__(self, band_id, layout="sensor", capacity=4096):
+        self.id = band_id
+        self.parser = LineParser(layout)
+        self.ring = SampleRing(capacity)
+        self.first_arrival = None
+        self.last_arrival = None
+        self.gaps = 0
+        self.max_gap_ms = 0.0
+        self._last_timestamp = None
+        self._interval_ms = None
+        self._rate_mark = (0, None)
+
+    @property
+    def samples(self):
+        return self.ring.written
+
+    def add(self, block, arrival):
+        """Store a parsed block and update the gap statistics"""
+        if not len(block):
+            return
+        if self.first_arrival is None:
+            self.first_arrival = arrival
+            self._rate_mark = (0, arrival)
+        self.last_arrival = arrival
+
+        # Interval statistics in scalars where possible: this runs per datagram
+        timestamps = block[:, TIMESTAMP]
+        previous = self._last_timestamp
+        self._last_timestamp = float(timestamps[-1])
+        count = len(timestamps) - (previous is None)
+        if count > 0:
+            start = float(timestamps[0]) if previous is None else previous
+            mean = (self._last_timestamp - start) / count
+            typical = self._interval_ms or mean
+            if typical > 0:
+                limit = GAP_FACTOR * typical
+                intervals = np.diff(timestamps) if previous is None else np.diff(timestamps, prepend=previous)
+                longest = float(intervals.max())
+                if longest > limit:
+                    self.gaps += int((intervals > limit).sum())
+                    self.max_gap_ms = max(self.max_gap_ms, longest)
+                else:
+                    # Only gap-free blocks move the estimate, so gaps never become "typical"
+                    self._interval_ms = 0.9 * typical + 0.1 * mean
+        self.ring.write(block)
+
+    def stats(self, now):
+        """Statistics; ``rate_hz`` is measured since the previous stats() call"""
+        written, since = self._rate_mark
+        rate = (self.samples - written) / (now - since) if since is not None and now > since else 0.0
+        if since is not None:
+            self._rate_mark = (self.samples, now)
+        return {
+            "samples": self.samples,
+            "rate_hz": round(rate, 1),
+            "interval_ms": None if self._interval_ms is None else round(self._interval_ms, 2),
+            "gaps": self.gaps,
+            "max_gap_ms": round(self.max_gap_ms, 1),
+            "malformed": self.parser.malformed,
+            "idle_s": None if self.last_arrival is None else round(now - self.last_arrival, 2),
+        }
+
+
+class Subscription:
+    """A bounded queue of (band_id, block) for one consumer"""
+
+    def __init__(self, bands=None, maxsize=1000):
+        self.bands = None if bands is None else set(bands)
+        self.queue = asyncio.Queue(maxsize)
+        self.dropped = 0
+
+    def offer(self, band_id, block):
+        if self.bands is not None and band_id not in self.bands:
+            return
+        if self.queue.full():
+            # Drop the oldest block: consumers want recent data
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait((band_id, block))
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        return await self.queue.get()
+
+
+class Hub:
+    """Multiplexes band sources onto one event loop and fans the samples out."""
+
+    def __init__(self, layout="sensor", capacity=4096):
+        self.layout = layout
+        self.capacity = capacity
+        self.bands = {}
+        self.subscriptions = []
+        self.datagrams = 0
+        self._tasks = []
+        self._servers = []
+        self._transports = []
+
+    def band(self, band_id):
+        band = self.bands.get(band_id)
+        if band is None:
+            band = self.bands[band_id] = Band(band_id, self.layout, self.capacity)
+            logger.info(f"New band {band_id}")
+        return band
+
+    def subscribe(self, bands=None, maxsize=1000):
+        """A Subscription receiving every new block (of ``bands``, or all)"""
+        subscription = Subscription(bands, maxsize)
+        self.subscriptions.append(subscription)
+        return subscription
+
+    def consume(self, handler, bands=None, maxsize=1000):
+        """Run ``handler(band_id, block)`` for every new block, in its own task
+
+        A coroutine function handler is awaited, one block at a time, so it
+        can hand blocking work to a thread without reordering blocks.
+        """
+        subscription = self.subscribe(bands, maxsize)
+        is_async = asyncio.iscoroutinefunction(handler)
+
+        async def run():
+            async for band_id, block in subscription:
+                try:
+                    if is_async:
+                        await handler(band_id, block)
+                    else:
+                        handler(band_id, block)
+                except Exception as e:
+                    logger.error(f"Subscriber {handler} failed on {band_id}: {e}")
+
+        self._tasks.append(asyncio.get_running_loop().create_task(run()))
+        return subscription
+
+    def publish(self, band_id, block, arrival=None):
+        """Add a parsed (k, len(FIELDS)) block from any source"""
+        if not len(block):
+            return
+        self.band(band_id).add(block, time.monotonic() if arrival is None else arrival)
+        for subscription in self.subscriptions:
+            subscription.offer(band_id, block)
+
+    def feed(self, data, default_band, band=None):
+        """Parse complete lines of raw bytes; returns the band ID in effect afterwards (for streams)"""
+        arrival = time.monotonic()
+        current = band or default_band
+        lines = data.split(b"\n")
+        start = 0
+        for index, line in enumerate(lines):
+            if line.startswith(b"@"):
+                self._parse(current, lines[start:index], arrival)
+                current = line[1:].strip().decode("utf-8", errors="replace") or default_band
+                start = index + 1
+        self._parse(current, lines[start:], arrival)
+        return current
+
+    def _parse(self, band_id, lines, arrival):
+        if lines:
+            band = self.band(band_id)
+            self.publish(band_id, band.parser.parse(lines, arrival * 1000), arrival)
+
+    # -- sources ----------------------------------------------------------
+
+    async def listen_udp(self, host, port):
+        loop = asyncio.get_running_loop()
+        transport, _ = await loop.create_datagram_endpoint(lambda: _UdpProtocol(self), local_addr=(host, port))
+        self._transports.append(transport)
+        return transport
+
+    async def listen_tcp(self, host, port):
+        server = await asyncio.start_server(self._serve_tcp, host, port)
+        self._servers.append(server)
+        return server
+
+    async def _serve_tcp(self, reader, writer):
+        peer = "%s:%s" % writer.get_extra_info("peername")[:2]
+        band = None
+        partial = b""
+        overlong = False
+        try:
+            while True:
+                data = await reader.read(65536)
+                if not data:
+                    break
+                if overlong:
+                    # Skip the rest of a line already dropped as too long
+                    end = data.find(b"\n")
+                    if end < 0:
+                        continue
+                    data = data[end + 1:]
+                    overlong = False
+                # The unfinished last line waits for the next read
+                data = partial + data
+                cut = data.rfind(b"\n") + 1
+                partial = data[cut:]
+                if cut:
+                    band = self.feed(data[:cut], peer, band)
+                if len(partial) > MAX_LINE_BYTES:
+                    # No newline in sight: not a line the parser could use
+                    self.band(band or peer).parser.malformed += 1
+                    partial = b""
+                    overlong = True
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    def add_serial(self, band_id, port, layout=None, executor=None):
+        """Read a serial port (or replayed recording) as ``band_id``"""
+        async def run():
+            loop = asyncio.get_running_loop()
+            try:
+                # Opening a port (or loading a recording to replay) blocks
+                stream = await loop.run_in_executor(
+                    executor, lambda: ImuStream(open_serial(port), layout=layout or self.layout))
+            except (OSError, ValueError) as e:
+                logger.error(f"Could not open {port} for {band_id}: {e}")
+                return
+            # The stream parses this band's lines, so its malformed count is the band's
+            self.band(band_id).parser = stream.parser
+            try:
+                async for block in stream.ablocks(executor):
+                    self.publish(band_id, block)
+            except (OSError, ValueError) as e:
+                logger.error(f"Serial source {port} ({band_id}) failed: {e}")
+            finally:
+                await loop.run_in_executor(executor, stream.close)
+                logger.info(f"Serial source {port} ({band_id}) ended")
+
+        self.band(band_id)
+        task = asyncio.get_running_loop().create_task(run())
+        self._tasks.append(task)
+        return task
+
+    # -- reporting --------------------------------------------------------
+
+    def stats(self):
+        now = time.monotonic()
+        return {
+            "bands": {band_id: band.stats(now) for band_id, band in self.bands.items()},
+            "subscribers": [{"backlog": s.queue.qsize(), "dropped": s.dropped} for s in self.subscriptions],
+            "datagrams": self.datagrams,
+        }
+
+    async def close(self):
+        for transport in self._transports:
+            transport.close()
+        for server in self._servers:
+            server.close()
+            await server.wait_closed()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+
+class _UdpProtocol(asyncio.DatagramProtocol):
+    def __init__(self, hub):
+        self.hub = hub
+
+    def datagram_received(self, data, addr):
+        # A datagram holds whole lines; the last one may lack its newline
+        self.hub.datagrams += 1
+        self.hub.feed(data, "%s:%s" % addr[:2])
+
+
+def parse_address(text, default_host="0.0.0.0"):
+    host, _, port = text.rpartition(":")
+    return host or default_host, int(port)
+
+
+async def run(args):
+    hub = Hub(args.layout)
+    for address in args.udp:
+        await hub.listen_udp(*parse_address(address))
+        logger.info(f"Listening for UDP on {address}")
+    for address in args.tcp:
+        await hub.listen_tcp(*parse_address(address))
+        logger.info(f"Listening for TCP on {address}")
+    for spec in args.serial:
+        band_id, _, port = spec.rpartition("=")
+        hub.add_serial(band_id or port, port)
+
+    writers = {}
+    if args.record:
+        from capture import CaptureWriter
+        os.makedirs(args.record, exist_ok=True)
+
+        def write(band_id, block):
+            writer = writers.get(band_id)
+            if writer is None:
+                name = "".join(c if c.isalnum() or c in "-_" else "_" for c in band_id)
+                path = os.path.join(args.record, f"{name}-{int(time.time())}.imu")
+                writer = writers[band_id] = CaptureWriter(path, sensor_id=band_id)
+            writer.write(block)
+
+        async def record(band_id, block):
+            # File I/O off the event loop; awaited, so blocks are written in order
+            await asyncio.to_thread(write, band_id, block)
+
+        hub.consume(record)
+
+    emitter = None
+    if args.model:
+        from recognizer import BrokerEmitter, GestureModel, GestureRecognizer
+        model = GestureModel.load(args.model)
+        emitter = BrokerEmitter(args.broker) if args.broker else None
+        recognizers = {}
+
+        def recognize(band_id, block):
+            recognizer = recognizers.get(band_id)
+            if recognizer is None:
+                recognizer = recognizers[band_id] = GestureRecognizer(model, band_id, emitter)
+            for event in recognizer.feed(block):
+                logger.info(f"{band_id}: {event['symbol']} ({event['confidence']})")
+
+        hub.consume(recognize)
+
+    try:
+        while True:
+            await asyncio.sleep(args.stats_interval)
+            stats = hub.stats()
+            for band_id, band in sorted(stats["bands"].items()):
+                logger.info(f"{band_id}: {band}")
+            if stats["subscribers"]:
+                logger.info(f"subscribers: {stats['subscribers']}")
+    finally:
+        await hub.close()
+        for writer in writers.values():
+            writer.close()
+        if emitter is not None:
+            emitter.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--udp", action="append", default=[], metavar="HOST:PORT")
+    parser.add_argument("--tcp", action="append", default=[], metavar="HOST:PORT")
+    parser.add_argument("--serial", action="append", default=[], metavar="BAND=PORT")
+    parser.add_argument("--layout", default="sensor", help="line layout the bands send")
+    parser.add_argument("--record", metavar="DIR", help="write one capture file per band here")
+    parser.add_argument("--model", help="run the gesture recognizer with this model on every band")
+    parser.add_argument("--broker", help="post recognized gestures to this broker URL")
+    parser.add_argument("--stats-interval", type=float, default=5.0)
+    args = parser.parse_args()
+    if not (args.udp or args.tcp or args.serial):
+        parser.error("give at least one --udp, --tcp or --serial source")
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+
+    try:
+        asyncio.run(run(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,311 @@
+"""
+Streaming reader for the IMU boards' CSV output.
+
+Every calibration tool used to open the serial port itself and parse one
+line at a time with readline().decode().split(','), each with its own idea of
+the column order. ImuStream does it once for all of them:
+
+  * reads whatever bytes are waiting in one call instead of line by line
+  * parses a whole chunk of lines with a single NumPy call
+  * returns samples in one fixed schema (FIELDS) whatever the board sends
+  * counts malformed lines instead of crashing or printing each one
+  * keeps the latest samples in a preallocated ring buffer
+
+    stream = ImuStream(open_serial('COM9'), layout='sensor')
+    for block in stream.blocks():      # (k, 8) arrays as they arrive
+        ax = block[:, AX]
+"""
+import asyncio
+import os
+import time
+
+import numpy as np
+
+# Sample schema: one row per sample, one column per field
+FIELDS = ("timestamp", "ax", "ay", "az", "gx", "gy", "gz", "temp")
+TIMESTAMP, AX, AY, AZ, GX, GY, GZ, TEMP = range(len(FIELDS))
+ACCEL = slice(AX, AZ + 1)
+GYRO = slice(GX, GZ + 1)
+
+# Column order of the line formats our boards and recordings use. Fields a
+# layout does not have are NaN, except the timestamp, which is filled with
+# the host time (ms) at which the chunk was read.
+LAYOUTS = {
+    # sensor.py: timestamp (ticks_ms), accel (g), gyro (deg/s), temperature
+    "sensor": ("timestamp", "ax", "ay", "az", "gx", "gy", "gz", "temp"),
+    # Firmware without timestamps (test.py, 2.py, mainprev.py)
+    "no_timestamp": ("ax", "ay", "az", "gx", "gy", "gz", "temp"),
+    # MPU6050 register order, temperature between accel and gyro (5.py)
+    "register": ("ax", "ay", "az", "temp", "gx", "gy", "gz"),
+    # Recorded CSV such as output.csv (header Ax,Ay,Az,Gx,Gy,Gz)
+    "csv": ("ax", "ay", "az", "gx", "gy", "gz"),
+}
+
+
+def open_serial(port, baudrate=115200, timeout=0.1):
+    """Open a board's serial port (pyserial is only needed for live boards).
+
+    With IMU_REPLAY set, or ``port`` naming a recording file, a recorded
+    session is replayed instead (see replay.py).
+    """
+    recording = os.environ.get("IMU_REPLAY") or (port if os.path.isfile(port) else None)
+    if recording:
+        from replay import ReplaySource
+        return ReplaySource.from_env(recording, timeout=timeout)
+    import serial
+    return serial.Serial(port, baudrate, timeout=timeout)
+
+
+def layout_columns(layout):
+    """Column order for a layout name or an explicit tuple of field names"""
+    columns = LAYOUTS[layout] if isinstance(layout, str) else tuple(layout)
+    unknown = [name for name in columns if name not in FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown fields in layout: {unknown}")
+    return columns
+
+
+class LineParser:
+    """Turns chunks of CSV lines into (k, len(FIELDS)) sample blocks.
+
+    By default a line must have exactly the layout's columns, separated by
+    commas. With ``min_fields`` the parser accepts what older firmware and
+    scripts did: values separated by commas and/or whitespace, at least
+    ``min_fields`` of them; extra values are ignored and missing trailing
+    fields are NaN.
+    """
+
+    def __init__(self, layout="sensor", min_fields=None):
+        self.columns = layout_columns(layout)
+        self.width = len(self.columns)
+        self.targets = np.array([FIELDS.index(name) for name in self.columns])
+        self.has_timestamp = "timestamp" in self.columns
+        self.min_fields = min_fields
+        self.lines = 0
+        self.malformed = 0
+
+    def parse(self, lines, host_time_ms=None):
+        """Parse a list of byte lines (without newlines) into a sample block"""
+        commas = self.width - 1
+        good = []
+        for line in lines:
+            # Some firmware ends lines with a comma, some with \r
+            line = line.rstrip(b", \r\t")
+            if line:
+                good.append(line)
+        self.lines += len(good)
+        if self.min_fields is not None:
+            return self._block(self._parse_tolerant(good), host_time_ms)
+
+        # Right number of columns and not a header line
+        candidates = [line for line in good if line.count(b",") == commas and not line[:1].isalpha()]
+        self.malformed += len(good) - len(candidates)
+        if not candidates:
+            return np.empty((0, len(FIELDS)))
+
+        text = b",".join(candidates).decode("ascii", errors="replace")
+        try:
+            values = np.fromstring(text, sep=",")
+        except ValueError:
+            values = None
+        if values is None or values.size != len(candidates) * self.width:
+            # Something in the chunk isn't a number: find the bad lines one by one
+            values = self._parse_slow(candidates)
+        return self._block(values.reshape(-1, self.width), host_time_ms)
+
+    def _block(self, raw, host_time_ms):
+        block = np.full((len(raw), len(FIELDS)), np.nan)
+        block[:, self.targets] = raw
+        if not self.has_timestamp:
+            block[:, TIMESTAMP] = time.monotonic() * 1000 if host_time_ms is None else host_time_ms
+        return block
+
+    def _parse_tolerant(self, lines):
+        rows = []
+        for line in lines:
+            fields = line.replace(b",", b" ").split()
+            if len(fields) < self.min_fields or line[:1].isalpha():
+                self.malformed += 1
+                continue
+            fields = fields[:self.width]
+            try:
+                rows.append([float(field) for field in fields] + [np.nan] * (self.width - len(fields)))
+            except ValueError:
+                self.malformed += 1
+        return np.array(rows, dtype=float).reshape(-1, self.width)
+
+    def _parse_slow(self, lines):
+        rows = []
+        for line in lines:
+            try:
+                rows.append([float(field) for field in line.split(b",")])
+            except ValueError:
+                self.malformed += 1
+        return np.array(rows, dtype=float).reshape(-1)
+
+
+class SampleRing:
+    """Fixed-size ring of the latest samples, preallocated.
+
+    One thread writes, any number read. ``written`` only moves forward after
+    the rows are in place, so readers can copy without a lock; a reader that
+    falls more than ``capacity`` samples behind gets the latest ``capacity``
+    and is told how many it missed.
+    """
+
+    def __init__(self, capacity=4096, width=len(FIELDS)):
+        self.capacity = capacity
+        self.data = np.full((capacity, width), np.nan)
+        self.written = 0
+
+    def __len__(self):
+        return min(self.written, self.capacity)
+
+    def write(self, block):
+        count = len(block)
+        if count == 0:
+            return
+        # Only the last ``capacity`` rows can be kept; they go where they would
+        # have landed had every row been written, and ``written`` moves once,
+        # after they are all in place
+        total = count
+        if count >= self.capacity:
+            block = block[-self.capacity:]
+            count = self.capacity
+        start = (self.written + total - count) % self.capacity
+        first = min(count, self.capacity - start)
+        self.data[start:start + first] = block[:first]
+        self.data[:count - first] = block[first:]
+        self.written += total
+
+    def latest(self, count=None):
+        """Copy of the last ``count`` samples (all stored ones by default), oldest first"""
+        written = self.written
+        count = min(len(self) if count is None else count, written, self.capacity)
+        block, _ = self._copy(written - count, written)
+        return block
+
+    def read_since(self, position, end=None):
+        """Samples written after ``position`` (up to ``end``): returns (block, new_position, missed)"""
+        written = self.written if end is None else min(end, self.written)
+        missed = max(0, written - position - self.capacity)
+        block, overwritten = self._copy(position + missed, written)
+        return block, written, missed + overwritten
+
+    def _copy(self, start, end):
+        count = end - start
+        first = start % self.capacity
+        if first + count <= self.capacity:
+            block = self.data[first:first + count].copy()
+        else:
+            block = np.concatenate((self.data[first:], self.data[:first + count - self.capacity]))
+        # Rows the writer replaced while we were copying are not trustworthy
+        overwritten = max(0, self.written - start - self.capacity)
+        return block[overwritten:], overwritten
+
+
+class ImuStream:
+    """Buffered, vectorized reader over a serial port or any binary file.
+
+    ``source`` needs ``read(n)``; if it also has ``in_waiting`` (pyserial),
+    each read takes everything already buffered by the OS. Parsed samples go
+    to ``ring`` and are returned to the caller. ``read_block`` returns None
+    once the source is exhausted (a file, or a closed port). With a
+    ``calibration`` (calibrate.Calibration) every block is corrected in
+    place as it is parsed. ``min_fields`` relaxes the line format (see
+    LineParser).
+    """
+
+    def __init__(self, source, layout="sensor", capacity=4096, chunk_size=4096, calibration=None,
+                 min_fields=None):
+        self.source = source
+        self.parser = LineParser(layout, min_fields)
+        self.calibration = calibration
+        # A replayed session sends its lines in whatever layout we read
+        if hasattr(source, "use_layout"):
+            source.use_layout(layout)
+        self.ring = SampleRing(capacity)
+        self.chunk_size = chunk_size
+        self.bytes_read = 0
+        self._partial = b""
+        self._eof = False
+
+    @property
+    def lines(self):
+        return self.parser.lines
+
+    @property
+    def malformed(self):
+        return self.parser.malformed
+
+    @property
+    def samples_read(self):
+        return self.ring.written
+
+    def read_block(self):
+        """Read what is available and return it as a (k, len(FIELDS)) block"""
+        if self._eof:
+            return None
+        waiting = getattr(self.source, "in_waiting", None)
+        size = self.chunk_size if waiting is None else min(max(waiting, 1), self.chunk_size * 16)
+        try:
+            chunk = self.source.read(size)
+        except (OSError, ValueError):
+            # Port unplugged or closed
+            chunk = b""
+        host_time_ms = time.monotonic() * 1000
+
+        if not chunk:
+            if waiting is not None and getattr(self.source, "is_open", False):
+                # Serial read timed out with nothing new
+                return np.empty((0, len(FIELDS)))
+            self._eof = True
+            lines, self._partial = [self._partial], b""
+        else:
+            self.bytes_read += len(chunk)
+            lines = (self._partial + chunk).split(b"\n")
+            # The last piece is an unfinished line until the next chunk
+            self._partial = lines.pop()
+
+        block = self.parser.parse(lines, host_time_ms)
+        if self.calibration is not None and len(block):
+            self.calibration.apply(block)
+        self.ring.write(block)
+        if self._eof and not len(block):
+            return None
+        return block
+
+    def blocks(self):
+        """Yield sample blocks until the source is exhausted (empty blocks are skipped)"""
+        while True:
+            block = self.read_block()
+            if block is None:
+                return
+            if len(block):
+                yield block
+
+    def samples(self):
+        """Yield one sample row at a time"""
+        for block in self.blocks():
+            yield from block
+
+    async def ablocks(self, executor=None):
+        """Async version of blocks(); the blocking reads run in ``executor``"""
+        loop = asyncio.get_running_loop()
+        while True:
+            block = await loop.run_in_executor(executor, self.read_block)
+            if block is None:
+                return
+            if len(block):
+                yield block
+
+    def stats(self):
+        return {
+            "bytes": self.bytes_read,
+            "lines": self.lines,
+            "samples": self.samples_read,
+            "malformed": self.malformed,
+        }
+
+    def close(self):
+        self.source.close()
@@ -0,0 +1,157 @@
+"""
+Streaming integration of IMU samples: acceleration -> velocity -> position.
+
+5.py used to call cumulative_trapezoid on single values each sample, which
+never integrated over the history, and doing it properly by integrating the
+whole window again for every sample costs O(n). These integrators keep just
+the running total and the last two samples, so each sample costs O(1) and a
+block of k samples is integrated in one vectorized O(k) step.
+
+    motion = MotionIntegrator(method='simpson', detectors=[ZeroVelocityDetector(gravity=1.0)])
+    velocity, position = motion.extend(t, accel, gyro)   # (k, 3) each
+
+Times are in seconds and may be unevenly spaced.
+"""
+import numpy as np
+
+METHODS = ("trapezoid", "simpson")
+
+
+class StreamingIntegrator:
+    """Running integral of a sampled vector signal.
+
+    "trapezoid" is exact for piecewise-linear signals. "simpson" integrates
+    each new interval under the parabola through the last three samples
+    (third order, uneven steps allowed); the very first interval falls back
+    to the trapezoid rule.
+    """
+
+    def __init__(self, width=3, method="trapezoid", initial=0.0):
+        if method not in METHODS:
+            raise ValueError(f"Unknown integration method '{method}', expected one of {METHODS}")
+        self.width = width
+        self.method = method
+        self.total = np.zeros(width) + initial
+        # Last two samples, needed for the next increment
+        self._t = np.empty(0)
+        self._y = np.empty((0, width))
+
+    def reset(self, value=0.0):
+        """Set the running integral (e.g. zero velocity); the sample history is kept"""
+        self.total[:] = value
+
+    def add(self, t, y):
+        """Add one sample and return the integral up to it"""
+        return self.extend([t], np.reshape(y, (1, self.width)))[0]
+
+    def extend(self, t, y):
+        """Add k samples; returns the (k, width) integral after each of them"""
+        t = np.asarray(t, dtype=float).reshape(-1)
+        y = np.asarray(y, dtype=float).reshape(len(t), self.width)
+        if not len(t):
+            return np.empty((0, self.width))
+
+        history = len(self._t)
+        times = np.concatenate((self._t, t))
+        values = np.concatenate((self._y, y))
+
+        # Increment over each interval [times[m], times[m + 1]]
+        h1 = np.diff(times)[:, None]
+        increments = 0.5 * h1 * (values[1:] + values[:-1])
+        if self.method == "simpson" and len(times) > 2:
+            h0 = h1[:-1]
+            h = h1[1:]
+            usable = (h0 > 0)[:, 0]
+            with np.errstate(divide="ignore", invalid="ignore"):
+                w0 = -h ** 3 / (6 * h0 * (h0 + h))
+                w1 = h * (h + 3 * h0) / (6 * h0)
+                w2 = h * (2 * h + 3 * h0) / (6 * (h0 + h))
+                simpson = w0 * values[:-2] + w1 * values[1:-1] + w2 * values[2:]
+            increments[1:][usable] = simpson[usable]
+
+        # One increment per new sample; the first sample ever has none
+        new = increments[history - 1:] if history else np.vstack((np.zeros((1, self.width)), increments))
+        integrals = self.total + np.cumsum(new, axis=0)
+        self.total = integrals[-1].copy()
+        self._t = times[-2:]
+        self._y = values[-2:]
+        return integrals
+
+
+class ZeroVelocityDetector:
+    """Flags samples where the sensor is at rest (for zero-velocity updates).
+
+    At rest the accelerometer only measures gravity and the gyro reads ~0:
+    | |accel| - gravity | < accel_tolerance and |gyro| < gyro_threshold.
+    ``gravity`` is in the accelerometer's units (1.0 for g, 9.81 for m/s^2).
+    """
+
+    def __init__(self, gravity=1.0, accel_tolerance=0.05, gyro_threshold=5.0):
+        self.gravity = gravity
+        self.accel_tolerance = accel_tolerance
+        self.gyro_threshold = gyro_threshold
+
+    def __call__(self, t, accel, gyro):
+        still = np.abs(np.linalg.norm(accel, axis=1) - self.gravity) < self.accel_tolerance
+        if gyro is not None:
+            still &= np.linalg.norm(gyro, axis=1) < self.gyro_threshold
+        return still
+
+
+class MotionIntegrator:
+    """Velocity and position from (gravity-free) acceleration, with drift correction.
+
+    ``detectors`` are callables ``(t, accel, gyro) -> bool mask`` marking
+    samples where the velocity is known to be zero; the velocity is clamped
+    there and the integration restarts from zero, which stops drift from
+    accumulating between movements. ``raw_accel`` is passed to the detectors
+    instead of ``accel`` when given (they usually need the gravity-included
+    reading).
+    """
+
+    def __init__(self, method="trapezoid", detectors=()):
+        self.velocity_integrator = StreamingIntegrator(3, method)
+        self.position_integrator = StreamingIntegrator(3, method)
+        self.detectors = list(detectors)
+        self.zero_velocity_updates = 0
+
+    @property
+    def velocity(self):
+        return self.velocity_integrator.total
+
+    @property
+    def position(self):
+        return self.position_integrator.total
+
+    def reset(self, position=0.0):
+        self.velocity_integrator.reset()
+        self.position_integrator.reset(position)
+
+    def update(self, t, accel, gyro=None, raw_accel=None):
+        """Add one sample; returns (velocity, position) after it"""
+        as_block = lambda value: None if value is None else np.reshape(value, (1, 3))
+        velocity, position = self.extend([t], as_block(accel), as_block(gyro), as_block(raw_accel))
+        return velocity[0], position[0]
+
+    def extend(self, t, accel, gyro=None, raw_accel=None):
+        """Add k samples; returns (velocity, position) arrays of shape (k, 3)"""
+        t = np.asarray(t, dtype=float).reshape(-1)
+        accel = np.asarray(accel, dtype=float).reshape(len(t), 3)
+        velocity = self.velocity_integrator.extend(t, accel)
+
+        if self.detectors:
+            at_rest = np.zeros(len(t), dtype=bool)
+            for detector in self.detectors:
+                at_rest |= detector(t, accel if raw_accel is None else np.asarray(raw_accel).reshape(len(t), 3),
+                                    None if gyro is None else np.asarray(gyro).reshape(len(t), 3))
+            if at_rest.any():
+                # Velocity restarts from zero at every rest sample:
+                # subtract the raw velocity at the latest rest sample so far
+                last_rest = np.maximum.accumulate(np.where(at_rest, np.arange(len(t)), -1))
+                baseline = np.where((last_rest >= 0)[:, None], velocity[np.maximum(last_rest, 0)], 0.0)
+                velocity = velocity - baseline
+                self.velocity_integrator.reset(velocity[-1])
+                self.zero_velocity_updates += int(at_rest.sum())
+
+        position = self.position_integrator.extend(t, velocity)
+        return velocity, position
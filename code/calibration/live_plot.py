@@ -0,0 +1,220 @@
+"""
+Live plots that update persistent artists instead of redrawing the figure.
+
+The calibration tools used to call ax.clear() every frame and re-create
+every line, scatter, limit and legend, with history kept in Python lists
+trimmed by list.pop(0). LivePlot creates the artists once, updates them with
+set_data / set_data_3d and blits only those artists over a cached
+background. Limits and legends are redrawn only when the data leaves the
+current limits. History is kept in RollingWindow, a fixed NumPy buffer
+where appending is O(1) per sample and reading the window needs no copy.
+
+    live = LivePlot(fig)
+    accel = live.add_lines(ax1, ["AccelX", "AccelY", "AccelZ"], window=500)
+    path = live.add_path3d(ax3, window=200, limit=0.5)
+
+    def update():
+        block = reader.read()
+        accel.extend(block[:, ACCEL])
+        path.extend(positions)
+
+    live.run(update, fps=30)
+    plt.show()
+
+bench_live_plot.py compares frame times with the old clear-and-replot code.
+"""
+import numpy as np
+
+
+class RollingWindow:
+    """The last ``length`` rows of a stream, stored twice in one array.
+
+    Every row is written at ``i`` and ``i + length``, so the current window
+    is always one contiguous slice: ``view()`` costs nothing and appending k
+    rows costs O(k) regardless of the window length.
+    """
+
+    def __init__(self, length, width=1):
+        self.length = length
+        self.width = width
+        self._data = np.full((2 * length, width), np.nan)
+        self.written = 0
+
+    def __len__(self):
+        return min(self.written, self.length)
+
+    def extend(self, rows):
+        rows = np.asarray(rows, dtype=float).reshape(-1, self.width)
+        skipped = max(0, len(rows) - self.length)
+        rows = rows[skipped:]
+        self.written += skipped
+        index = (self.written + np.arange(len(rows))) % self.length
+        self._data[index] = rows
+        self._data[index + self.length] = rows
+        self.written += len(rows)
+
+    def append(self, row):
+        self.extend(row)
+
+    def view(self):
+        """The window, oldest row first (a view: copy it if you keep it)"""
+        count = len(self)
+        end = self.written % self.length + self.length
+        return self._data[end - count:end]
+
+
+class LinePanel:
+    """Scrolling time series, one line per column, on a 2D axes.
+
+    The x axis is the sample offset from the newest sample (or seconds ago,
+    given ``rate``), so it never moves and blitting stays valid. The y
+    limits grow to fit the data when ``ylim`` is None.
+    """
+
+    def __init__(self, ax, labels, window, rate=None, ylim=None, margin=0.1):
+        self.ax = ax
+        self.history = RollingWindow(window, len(labels))
+        self.margin = margin
+        self.autoscale = ylim is None
+        self._x = np.arange(-window + 1, 1, dtype=float)
+        if rate:
+            self._x /= rate
+        self.lines = [ax.plot([], [], label=label)[0] for label in labels]
+        ax.set_xlim(self._x[0], 0)
+        ax.set_ylim(*(ylim or (-1, 1)))
+        ax.legend(loc="upper left")
+        ax.grid(True)
+
+    @property
+    def artists(self):
+        return self.lines
+
+    def extend(self, rows):
+        self.history.extend(rows)
+
+    def update(self):
+        """Push the window into the artists; True if the limits had to change"""
+        values = self.history.view()
+        x = self._x[len(self._x) - len(values):]
+        for column, line in enumerate(self.lines):
+            line.set_data(x, values[:, column])
+        if not self.autoscale or not len(values):
+            return False
+
+        low, high = np.nanmin(values), np.nanmax(values)
+        bottom, top = self.ax.get_ylim()
+        if np.isfinite(low) and np.isfinite(high) and (low < bottom or high > top):
+            pad = (high - low) * self.margin or 1.0
+            self.ax.set_ylim(min(bottom, low - pad), max(top, high + pad))
+            return True
+        return False
+
+
+class PathPanel:
+    """Trail of the last ``window`` 3D positions plus a marker at the newest one."""
+
+    def __init__(self, ax, window, limit=0.5, label="Path"):
+        self.ax = ax
+        self.history = RollingWindow(window, 3)
+        self.line = ax.plot([], [], [], color="b", label=label)[0]
+        self.marker = ax.plot([], [], [], "o", color="r", label="Current Position")[0]
+        for set_lim in (ax.set_xlim, ax.set_ylim, ax.set_zlim):
+            set_lim(-limit, limit)
+        ax.legend(loc="upper left")
+
+    @property
+    def artists(self):
+        return [self.line, self.marker]
+
+    def extend(self, positions):
+        self.history.extend(positions)
+
+    def update(self):
+        path = self.history.view()
+        if len(path):
+            self.line.set_data_3d(path[:, 0], path[:, 1], path[:, 2])
+            self.marker.set_data_3d(path[-1:, 0], path[-1:, 1], path[-1:, 2])
+        return False
+
+
+class LivePlot:
+    """Owns the panels of one figure and redraws them each frame.
+
+    With ``blit`` (the default where the backend supports it), a frame
+    restores the cached background and draws only the panel artists. A full
+    redraw happens on the first frame, after a resize, or when a panel's
+    limits change. Callbacks added with ``on_frame`` run after every frame
+    is drawn, e.g. RingReader.displayed from acquisition.py.
+    """
+
+    def __init__(self, fig, blit=None):
+        self.fig = fig
+        self.canvas = fig.canvas
+        self.blit = self.canvas.supports_blit if blit is None else blit
+        self.panels = []
+        self.frames = 0
+        self.full_redraws = 0
+        self._background = None
+        self._callbacks = []
+        self._timer = None
+        self.canvas.mpl_connect("draw_event", self._on_draw)
+
+    def add_lines(self, ax, labels, window, **kwargs):
+        return self._add(LinePanel(ax, labels, window, **kwargs))
+
+    def add_path3d(self, ax, window, **kwargs):
+        return self._add(PathPanel(ax, window, **kwargs))
+
+    def _add(self, panel):
+        # Animated artists are left out of full redraws and drawn by _draw_artists
+        for artist in panel.artists:
+            artist.set_animated(self.blit)
+        self.panels.append(panel)
+        return panel
+
+    def on_frame(self, callback):
+        self._callbacks.append(callback)
+
+    def refresh(self):
+        """Update every panel and put the frame on screen"""
+        limits_changed = False
+        for panel in self.panels:
+            limits_changed |= panel.update()
+
+        if not self.blit:
+            self.canvas.draw_idle()
+        elif limits_changed or self._background is None:
+            # Draws the static parts and grabs them as the new background
+            self.canvas.draw()
+        else:
+            self.canvas.restore_region(self._background)
+            self._draw_artists()
+            self.canvas.blit(self.fig.bbox)
+        self.canvas.flush_events()
+
+        self.frames += 1
+        for callback in self._callbacks:
+            callback()
+
+    def run(self, update, fps=30):
+        """Call ``update()`` then refresh() ``fps`` times per second (keep the returned timer)"""
+        def tick():
+            update()
+            self.refresh()
+
+        self._timer = self.canvas.new_timer(interval=1000 / fps)
+        self._timer.add_callback(tick)
+        self._timer.start()
+        return self._timer
+
+    def _on_draw(self, event):
+        self.full_redraws += 1
+        if self.blit:
+            self._background = self.canvas.copy_from_bbox(self.fig.bbox)
+            self._draw_artists()
+
+    def _draw_artists(self):
+        for panel in self.panels:
+            for artist in panel.artists:
+                self.fig.draw_artist(artist)
+
@@ -1,15 +1,34 @@
+import os
 import time
 import numpy as np
-import serial
 import matplotlib.pyplot as plt
-from matplotlib.animation import FuncAnimation
-from scipy.integrate import cumulative_trapezoid as cumtrapz
 
 from ahrs.filters import Madgwick
 from ahrs.common.orientation import acc2q
 
+from acquisition import Acquisition
+from calibrate import Calibration
+from imu_stream import ImuStream, open_serial
+from integrator import MotionIntegrator, ZeroVelocityDetector
+from live_plot import LivePlot
+
+# Plot refresh rate; independent of the sensor's sample rate
+FPS = 20
+
+# Standard gravity: the board reports acceleration in g
+STANDARD_GRAVITY = 9.80665
+
+# Calibration profile from calibrate.py (gyro bias, accel bias/scale); used if present
+CALIBRATION_PROFILE = 'profiles/COM9.json'
+calibration = Calibration.load(CALIBRATION_PROFILE) if os.path.exists(CALIBRATION_PROFILE) else None
+
 # Initialize Serial Port (Modify as needed)
-ser = serial.Serial('COM9', 115200)  # Adjust the COM port
+ser = open_serial('COM9', 115200, timeout=0.1)  # Adjust the COM port
+stream = ImuStream(ser, layout='sensor', calibration=calibration)  # timestamp,ax,ay,az,gx,gy,gz,temp (sensor.py)
+
+# Read the board on its own thread so no samples wait for the plot
+acquisition = Acquisition(stream).start()
+reader = acquisition.reader()
 
 # Initialize Madgwick Filter
 madgwick = Madgwick()
@@ -17,25 +36,20 @@ madgwick = Madgwick()
 # Initial quaternion (Identity quaternion to start)
 q = np.array([1.0, 0.0, 0.0, 0.0])
 
-# Position, Velocity, and Time Tracking
-position = np.array([0.0, 0.0, 0.0])  # Initial position [x, y, z]
-velocity = np.array([0.0, 0.0, 0.0])  # Initial velocity [vx, vy, vz]
-prev_time = None  # Used for time integration
+# Previous sample's timestamp (ms): the filter steps by the actual time between
+# samples, not Madgwick's default 100 Hz, since the boards run slower than that
+last_timestamp = None
 
-# Data storage for plotting
-pos_x, pos_y, pos_z = [], [], []
+# Position and velocity, integrated sample by sample (trapezoidal, O(1) per sample).
+# Velocity is reset whenever the board is held still, so drift doesn't build up.
+motion = MotionIntegrator(method='trapezoid', detectors=[ZeroVelocityDetector(gravity=1.0, accel_tolerance=0.05)])
 
-def process_mpu6050_data(data):
-    """Process the raw sensor data from MPU6050 and compute position."""
-    global q, velocity, position, prev_time
+def process_mpu6050_data(sample):
+    """Process one parsed MPU6050 sample (imu_stream.FIELDS) and compute position."""
+    global q, last_timestamp
 
     try:
-        values = list(map(float, data.split(',')))  # Convert CSV string to float list
-        
-        if len(values) < 7:
-            return None
-
-        timestamp, ax, ay, az, gx, gy, gz = values[:7]  # Ignore temperature
+        timestamp, ax, ay, az, gx, gy, gz = sample[:7]  # Ignore temperature
 
         # Convert gyroscope data from degrees/sec to radians/sec
         gx, gy, gz = np.radians([gx, gy, gz])
@@ -44,8 +58,10 @@ def process_mpu6050_data(data):
         if np.array_equal(q, np.array([1.0, 0.0, 0.0, 0.0])):
             q = acc2q([ax, ay, az])  
 
-        # Apply Madgwick Filter to update orientation
-        q = madgwick.updateIMU(q, gyr=[gx, gy, gz], acc=[ax, ay, az])
+        # Apply Madgwick Filter to update orientation (the first sample has no step yet)
+        dt = (timestamp - last_timestamp) / 1000.0 if last_timestamp is not None else 0.0
+        last_timestamp = timestamp
+        q = madgwick.updateIMU(q, gyr=[gx, gy, gz], acc=[ax, ay, az], dt=dt)
 
         # Convert quaternion to rotation matrix
         R = np.array([
@@ -54,25 +70,16 @@ def process_mpu6050_data(data):
             [2 * (q[1] * q[3] - q[0] * q[2]), 2 * (q[2] * q[3] + q[0] * q[1]), 1 - 2 * (q[1] ** 2 + q[2] ** 2)]
         ])
 
-        # Transform accelerometer readings to world coordinates
-        acc_world = R @ np.array([ax, ay, az])
+        # Transform accelerometer readings to world coordinates (m/s^2)
+        acc_world = R @ np.array([ax, ay, az]) * STANDARD_GRAVITY
 
         # Subtract gravity (assuming gravity acts along Z-axis)
-        acc_world[2] -= 9.81  
-
-        # Compute time difference (dt)
-        if prev_time is None:
-            prev_time = timestamp
-            return position  # No update on first run
+        acc_world[2] -= STANDARD_GRAVITY
 
-        dt = (timestamp - prev_time) / 1000.0  # Convert ms to seconds
-        prev_time = timestamp  # Update previous time
-
-        # Integrate acceleration to get velocity (Trapezoidal Integration)
-        velocity += acc_world * dt
-
-        # Integrate velocity to get position (Trapezoidal Integration)
-        position += velocity * dt
+        # Integrate acceleration to velocity and velocity to position
+        # (timestamps are in ms; the first sample starts at rest)
+        velocity, position = motion.update(timestamp / 1000.0, acc_world,
+                                           gyro=sample[4:7], raw_accel=[ax, ay, az])
 
         return position
 
@@ -88,44 +95,27 @@ ax.set_xlabel("X Position (m)")
 ax.set_ylabel("Y Position (m)")
 ax.set_zlabel("Z Position (m)")
 
-# Set axis limits for 50 cm movement range
-ax.set_xlim(-0.5, 0.5)  # X-axis (meters)
-ax.set_ylim(-0.5, 0.5)  # Y-axis (meters)
-ax.set_zlim(-0.5, 0.5)  # Z-axis (meters)
+# Path of the last 200 positions, axis limits set for 50 cm movement range (meters).
+# The artists are created once and blitted each frame.
+live = LivePlot(fig)
+path = live.add_path3d(ax, window=200, limit=0.5)
 
-def update(frame):
+def update():
     """Updates the 3D plot in real-time."""
-    raw_data = ser.readline().decode('utf-8').strip()
-    result = process_mpu6050_data(raw_data)
-
-    if result is not None:
-        x, y, z = result
-        pos_x.append(x)
-        pos_y.append(y)
-        pos_z.append(z)
-
-        # Keep only last 200 points for real-time effect
-        if len(pos_x) > 200:
-            pos_x.pop(0)
-            pos_y.pop(0)
-            pos_z.pop(0)
-
-        ax.clear()
-        ax.plot(pos_x, pos_y, pos_z, color='b', label="Path")
-        ax.scatter(pos_x[-1], pos_y[-1], pos_z[-1], color='r', marker='o', label="Current Position")
-
-        # Set axis limits for 50 cm movement
-        ax.set_xlim(-0.5, 0.5)
-        ax.set_ylim(-0.5, 0.5)
-        ax.set_zlim(-0.5, 0.5)
-
-        ax.legend()
+    # Process every sample that arrived since the last frame
+    for sample in reader.read():
+        result = process_mpu6050_data(sample)
+        if result is not None:
+            path.extend(result)
 
-    return ax
+# Measure how far the display lags behind the sensor
+live.on_frame(reader.displayed)
 
 # Animate real-time 3D position tracking
-ani = FuncAnimation(fig, update, interval=50, blit=False)
+timer = live.run(update, fps=FPS)
 plt.show()
 
 # Close Serial Connection when done
-ser.close()
+acquisition.stop()
+stream.close()
+print("Acquisition:", reader.stats())
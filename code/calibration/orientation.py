@@ -0,0 +1,239 @@
+"""
+Batch orientation estimation for recorded IMU data.
+
+main.py runs ahrs' Madgwick filter one sample at a time, building the
+rotation matrix by hand for every sample. For offline work (output.csv and
+longer captures) this module processes a whole recording at once:
+
+  * the Madgwick IMU update runs in one tight loop, compiled with Numba when
+    it is installed and over plain floats otherwise (the filter is
+    sequential, so this loop is the only per-sample part)
+  * rotation matrices, the world-frame transform and gravity removal are
+    vectorized over all samples
+  * velocity and position come from integrator.MotionIntegrator in one block
+
+    python orientation.py output.csv --layout csv --rate 10 --out output.npz
+    python orientation.py session.imu
+
+The filter matches ahrs.filters.Madgwick.updateIMU (same gain, same initial
+quaternion from acc2q). Both here and in main.py it steps by the time between
+consecutive timestamps, so results agree with main.py; with ``--rate`` the
+step is 1 / rate instead.
+"""
+import argparse
+import math
+import time
+
+import numpy as np
+
+from calibrate import Calibration
+from capture import Capture, is_capture
+from imu_stream import ACCEL, GYRO, TIMESTAMP, ImuStream, layout_columns
+from integrator import MotionIntegrator, ZeroVelocityDetector
+
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+# ahrs' defaults for the IMU (gyro + accelerometer) filter
+MADGWICK_GAIN = 0.033
+STANDARD_GRAVITY = 9.80665
+
+
+def acc2q(accel):
+    """Initial orientation from a gravity reading (roll and pitch, no yaw), like ahrs.common.orientation.acc2q"""
+    ax, ay, az = np.asarray(accel, dtype=float)
+    roll = math.atan2(ay, az)
+    pitch = math.atan2(-ax, math.sqrt(ay * ay + az * az))
+    cr, sr = math.cos(roll / 2), math.sin(roll / 2)
+    cp, sp = math.cos(pitch / 2), math.sin(pitch / 2)
+    q = np.array([cr * cp, sr * cp, cr * sp, -sr * sp])
+    return q / np.linalg.norm(q)
+
+
+def _madgwick_loop(gyro, accel, dt, gain, q0, out):
+    """Madgwick IMU update for every sample; written so Numba can compile it as is"""
+    qw, qx, qy, qz = q0[0], q0[1], q0[2], q0[3]
+    for i in range(len(gyro)):
+        gx, gy, gz = gyro[i][0], gyro[i][1], gyro[i][2]
+        ax, ay, az = accel[i][0], accel[i][1], accel[i][2]
+
+        # Rate of change from the gyro: 0.5 * q * (0, w)
+        dw = 0.5 * (-qx * gx - qy * gy - qz * gz)
+        dx = 0.5 * (qw * gx + qy * gz - qz * gy)
+        dy = 0.5 * (qw * gy - qx * gz + qz * gx)
+        dz = 0.5 * (qw * gz + qx * gy - qy * gx)
+
+        norm = math.sqrt(ax * ax + ay * ay + az * az)
+        if norm > 0.0:
+            ax /= norm
+            ay /= norm
+            az /= norm
+            # Gradient step towards the orientation that explains gravity
+            f0 = 2.0 * (qx * qz - qw * qy) - ax
+            f1 = 2.0 * (qw * qx + qy * qz) - ay
+            f2 = 2.0 * (0.5 - qx * qx - qy * qy) - az
+            sw = -2.0 * qy * f0 + 2.0 * qx * f1
+            sx = 2.0 * qz * f0 + 2.0 * qw * f1 - 4.0 * qx * f2
+            sy = -2.0 * qw * f0 + 2.0 * qz * f1 - 4.0 * qy * f2
+            sz = 2.0 * qx * f0 + 2.0 * qy * f1
+            step = math.sqrt(sw * sw + sx * sx + sy * sy + sz * sz)
+            if step > 0.0:
+                dw -= gain * sw / step
+                dx -= gain * sx / step
+                dy -= gain * sy / step
+                dz -= gain * sz / step
+
+        h = dt[i]
+        qw += dw * h
+        qx += dx * h
+        qy += dy * h
+        qz += dz * h
+        norm = math.sqrt(qw * qw + qx * qx + qy * qy + qz * qz)
+        qw /= norm
+        qx /= norm
+        qy /= norm
+        qz /= norm
+        out[i][0] = qw
+        out[i][1] = qx
+        out[i][2] = qy
+        out[i][3] = qz
+    return out
+
+
+_compiled_loop = njit(cache=True, fastmath=True)(_madgwick_loop) if njit is not None else None
+
+
+def madgwick(gyro, accel, dt, gain=MADGWICK_GAIN, q0=None):
+    """Orientation quaternions (n, 4), w first, for every sample.
+
+    ``gyro`` in rad/s, ``accel`` in any unit (only its direction is used),
+    ``dt`` in seconds: one value or one per sample.
+    """
+    gyro = np.ascontiguousarray(gyro, dtype=float)
+    accel = np.ascontiguousarray(accel, dtype=float)
+    count = len(gyro)
+    dt = np.broadcast_to(np.asarray(dt, dtype=float), (count,))
+    if q0 is None:
+        q0 = acc2q(accel[0]) if count else np.array([1.0, 0.0, 0.0, 0.0])
+    q0 = np.asarray(q0, dtype=float)
+
+    if _compiled_loop is not None:
+        return _compiled_loop(gyro, accel, np.ascontiguousarray(dt), gain, q0, np.empty((count, 4)))
+    # Without Numba, floats in lists are several times faster than indexing arrays
+    out = [[0.0] * 4 for _ in range(count)]
+    _madgwick_loop(gyro.tolist(), accel.tolist(), dt.tolist(), gain, q0.tolist(), out)
+    return np.array(out).reshape(count, 4)
+
+
+def rotation_matrices(q):
+    """Body-to-world rotation matrices (n, 3, 3) for quaternions (n, 4)"""
+    q = np.asarray(q, dtype=float)
+    w, x, y, z = q[:, 0], q[:, 1], q[:, 2], q[:, 3]
+    R = np.empty((len(q), 3, 3))
+    R[:, 0, 0] = 1 - 2 * (y * y + z * z)
+    R[:, 0, 1] = 2 * (x * y - w * z)
+    R[:, 0, 2] = 2 * (x * z + w * y)
+    R[:, 1, 0] = 2 * (x * y + w * z)
+    R[:, 1, 1] = 1 - 2 * (x * x + z * z)
+    R[:, 1, 2] = 2 * (y * z - w * x)
+    R[:, 2, 0] = 2 * (x * z - w * y)
+    R[:, 2, 1] = 2 * (y * z + w * x)
+    R[:, 2, 2] = 1 - 2 * (x * x + y * y)
+    return R
+
+
+def to_world(q, vectors):
+    """Rotate body-frame vectors (n, 3) into the world frame"""
+    return np.einsum("nij,nj->ni", rotation_matrices(q), vectors)
+
+
+def sample_times(samples, rate=None):
+    """Sample times in seconds: from the board's timestamps (ms), or i / rate"""
+    if rate:
+        return np.arange(len(samples)) / rate
+    return (samples[:, TIMESTAMP] - samples[0, TIMESTAMP]) / 1000.0
+
+
+def process_recording(samples, rate=None, gain=MADGWICK_GAIN, accel_scale=STANDARD_GRAVITY,
+                      method="trapezoid", zero_velocity=True):
+    """Orientation, linear acceleration, velocity and position for a whole recording.
+
+    ``samples`` is an (n, len(FIELDS)) block from imu_stream with accel in g
+    and gyro in deg/s (the boards' units). ``rate`` (Hz) overrides the
+    timestamps, for recordings without usable ones. Accelerations come back
+    in m/s^2 (``accel_scale`` per accelerometer unit).
+    """
+    samples = np.asarray(samples, dtype=float)
+    samples = samples[np.isfinite(samples[:, ACCEL]).all(axis=1) & np.isfinite(samples[:, GYRO]).all(axis=1)]
+    t = sample_times(samples, rate)
+    dt = np.diff(t, prepend=t[0] if len(t) else 0.0)
+
+    gyro = np.radians(samples[:, GYRO])
+    accel = samples[:, ACCEL] * accel_scale
+    q = madgwick(gyro, accel, dt, gain)
+
+    accel_world = to_world(q, accel)
+    linear = accel_world.copy()
+    linear[:, 2] -= accel_scale
+
+    detectors = [ZeroVelocityDetector(gravity=accel_scale, accel_tolerance=0.05 * accel_scale)] if zero_velocity else []
+    motion = MotionIntegrator(method, detectors)
+    velocity, position = motion.extend(t, linear, samples[:, GYRO], raw_accel=accel)
+    return {
+        "t": t,
+        "quaternion": q,
+        "accel_world": accel_world,
+        "linear_accel": linear,
+        "velocity": velocity,
+        "position": position,
+    }
+
+
+def load_recording(path, layout="csv"):
+    """Every sample of a recording (CSV or binary capture) as one block"""
+    if is_capture(path):
+        capture = Capture(path)
+        return capture.samples(), {"malformed": 0, "sample_rate": capture.sample_rate}
+    with open(path, "rb") as f:
+        stream = ImuStream(f, layout=layout, capacity=1, chunk_size=1 << 20)
+        blocks = list(stream.blocks())
+    samples = np.concatenate(blocks) if blocks else np.empty((0, 8))
+    return samples, stream.stats()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("recording", help="CSV recording (e.g. output.csv) or capture.py file")
+    parser.add_argument("--layout", default="csv", help="column layout (see imu_stream.LAYOUTS)")
+    parser.add_argument("--rate", type=float, help="sample rate in Hz; required if the file has no timestamps")
+    parser.add_argument("--gain", type=float, default=MADGWICK_GAIN)
+    parser.add_argument("--method", choices=("trapezoid", "simpson"), default="trapezoid")
+    parser.add_argument("--no-zupt", action="store_true", help="don't reset velocity while the sensor is still")
+    parser.add_argument("--profile", help="calibration profile from calibrate.py to apply first")
+    parser.add_argument("--out", help="write the results to this .npz file")
+    args = parser.parse_args()
+
+    if not is_capture(args.recording) and "timestamp" not in layout_columns(args.layout) and not args.rate:
+        parser.error(f"layout '{args.layout}' has no timestamps, pass --rate")
+    samples, stats = load_recording(args.recording, args.layout)
+    if args.profile:
+        Calibration.load(args.profile).apply(samples)
+
+    started = time.perf_counter()
+    result = process_recording(samples, args.rate, args.gain, method=args.method, zero_velocity=not args.no_zupt)
+    elapsed = time.perf_counter() - started
+
+    count = len(result["t"])
+    print(f"{count} samples ({stats['malformed']} malformed lines) in {elapsed:.3f} s "
+          f"({count / elapsed / 1e6 * 60:.1f} M samples/min, numba {'on' if njit else 'off'})")
+    if count:
+        print("Final position (m):", np.round(result["position"][-1], 3))
+    if args.out:
+        np.savez_compressed(args.out, **result)
+        print("Wrote", args.out)
+
+
+if __name__ == "__main__":
+    main()
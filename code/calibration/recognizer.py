@@ -0,0 +1,358 @@
+"""
+Host-side gesture recognition on the raw IMU stream.
+
+Gestures are normally recognized on the band by the Edge Impulse library,
+and the broker only sees {"circle": true}. This recognizer runs the same
+kind of pipeline on the host from the raw samples sensor.py sends: a
+sliding window advanced one hop at a time, statistical and spectral band
+energy features per channel, and a small softmax model loaded from disk.
+Recognized gestures are posted to the broker like a band's events.
+
+Features are updated per hop, not recomputed over the whole window:
+
+  * mean/std/min/max come from per-hop partial sums and extrema, so a hop
+    costs O(hop) plus combining window/hop partials
+  * the spectrum is a sliding DFT: each hop rotates the previous spectrum
+    and adds the new-minus-expired samples, O(hop x bins), with a full FFT
+    every ``resync_every`` hops to stop rounding error from accumulating
+
+    python recognizer.py gestures.npz COM9 --band band-1 --broker http://localhost:5000
+    IMU_REPLAY=session.imu python recognizer.py gestures.npz replay --band band-1 --print
+
+The model file is a .npz written by GestureModel.save(); window_features()
+computes the same features from whole windows, for training.
+"""
+import argparse
+import json
+import logging
+import queue
+import threading
+import time
+import urllib.request
+
+import numpy as np
+
+from imu_stream import FIELDS, TIMESTAMP, ImuStream, open_serial
+
+logger = logging.getLogger(__name__)
+
+# Spectral power band edges in Hz, as in the bands' Edge Impulse impulse
+BAND_EDGES = (0.1, 0.5, 1.0, 2.0, 5.0)
+STATS = ("mean", "std", "min", "max")
+
+
+def feature_names(channels, band_edges=BAND_EDGES):
+    names = [f"{channel}_{stat}" for stat in STATS for channel in channels]
+    for low, high in zip(band_edges[:-1], band_edges[1:]):
+        names += [f"{channel}_power_{low:g}_{high:g}hz" for channel in channels]
+    return names
+
+
+def band_matrix(window, rate, band_edges=BAND_EDGES):
+    """(bands, bins) 0/1 matrix summing rfft bins into each power band"""
+    freqs = np.fft.rfftfreq(window, 1 / rate)
+    return np.array([(freqs >= low) & (freqs < high) for low, high in zip(band_edges[:-1], band_edges[1:])], dtype=float)
+
+
+def _combine(mean, std, low, high, power, bands):
+    """Feature vectors from per-channel stats and the power spectrum (..., bins, channels)"""
+    energies = np.log1p(np.einsum("bk,...kc->...bc", bands, power))
+    stats = np.concatenate((mean, std, low, high), axis=-1)
+    return np.concatenate((stats, energies.reshape(*energies.shape[:-2], -1)), axis=-1)
+
+
+def window_features(windows, rate, band_edges=BAND_EDGES):
+    """Features of whole windows, (n, window, channels) -> (n, features), vectorized"""
+    windows = np.asarray(windows, dtype=float)
+    size = windows.shape[-2]
+    power = np.abs(np.fft.rfft(windows, axis=-2)) ** 2 / size
+    return _combine(windows.mean(axis=-2), windows.std(axis=-2), windows.min(axis=-2), windows.max(axis=-2),
+                    power, band_matrix(size, rate, band_edges))
+
+
+class SlidingFeatures:
+    """Window features of a stream, updated once per hop.
+
+    ``extend(rows)`` takes any number of samples and returns the feature
+    vector for every hop completed, once the first full window is in.
+    """
+
+    def __init__(self, window, hop, channels, rate, band_edges=BAND_EDGES, resync_every=64):
+        if window % hop:
+            raise ValueError(f"Window ({window}) must be a multiple of the hop ({hop})")
+        self.window = window
+        self.hop = hop
+        self.channels = channels
+        self.resync_every = resync_every
+        self.hops = window // hop
+        self.size = len(feature_names(range(channels), band_edges))
+        self.count = 0
+
+        self._samples = np.zeros((window, channels))
+        self._pending = np.empty((0, channels))
+        self._sum = np.zeros((self.hops, channels))
+        self._sumsq = np.zeros((self.hops, channels))
+        self._min = np.full((self.hops, channels), np.inf)
+        self._max = np.full((self.hops, channels), -np.inf)
+
+        # Sliding DFT: X(n + h) = w^h X(n) + sum_m w^(h - m + 1) (x[n + m] - x[n + m - N])
+        k = np.arange(window // 2 + 1)
+        self._spectrum = np.zeros((len(k), channels), dtype=complex)
+        self._rotate = np.exp(2j * np.pi * k * hop / window)[:, None]
+        steps = hop - np.arange(1, hop + 1) + 1
+        self._twiddle = np.exp(2j * np.pi * np.outer(k, steps) / window)
+        self._bands = band_matrix(window, rate, band_edges)
+
+    def extend(self, rows):
+        """Add samples (k, channels); returns (row index ending each hop, features) for completed hops"""
+        rows = np.asarray(rows, dtype=float).reshape(-1, self.channels)
+        pending = len(self._pending)
+        data = np.concatenate((self._pending, rows)) if pending else rows
+        complete = len(data) // self.hop
+        self._pending = data[complete * self.hop:].copy()
+
+        ends, features = [], []
+        for index in range(complete):
+            self._push(data[index * self.hop:(index + 1) * self.hop])
+            if self.count >= self.window:
+                ends.append((index + 1) * self.hop - 1 - pending)
+                features.append(self.current())
+        if not features:
+            return np.empty(0, dtype=int), np.empty((0, self.size))
+        return np.array(ends), np.array(features)
+
+    def _push(self, block):
+        start = self.count % self.window
+        expired = self._samples[start:start + self.hop]
+        self._spectrum = self._rotate * self._spectrum + self._twiddle @ (block - expired)
+        self._samples[start:start + self.hop] = block
+
+        slot = (self.count // self.hop) % self.hops
+        self._sum[slot] = block.sum(axis=0)
+        self._sumsq[slot] = (block * block).sum(axis=0)
+        self._min[slot] = block.min(axis=0)
+        self._max[slot] = block.max(axis=0)
+        self.count += self.hop
+
+        if self.resync_every and (self.count // self.hop) % self.resync_every == 0:
+            oldest = self.count % self.window
+            self._spectrum = np.fft.rfft(np.roll(self._samples, -oldest, axis=0), axis=0)
+
+    def current(self):
+        """Features of the current window"""
+        size = self.window
+        mean = self._sum.sum(axis=0) / size
+        std = np.sqrt(np.maximum(self._sumsq.sum(axis=0) / size - mean * mean, 0.0))
+        power = (self._spectrum.real ** 2 + self._spectrum.imag ** 2) / size
+        return _combine(mean, std, self._min.min(axis=0), self._max.max(axis=0), power, self._bands)
+
+
+class GestureModel:
+    """Standardized features -> softmax over gesture labels.
+
+    Also stores how the features were computed (channels, window, hop,
+    rate, band edges), so a model file is all the recognizer needs.
+    """
+
+    def __init__(self, labels, weights, bias, mean, scale, channels, window, hop, rate,
+                 band_edges=BAND_EDGES, threshold=0.6, idle="idle"):
+        self.labels = list(labels)
+        self.weights = np.asarray(weights, dtype=float)
+        self.bias = np.asarray(bias, dtype=float)
+        self.mean = np.asarray(mean, dtype=float)
+        self.scale = np.asarray(scale, dtype=float)
+        self.channels = list(channels)
+        self.window = int(window)
+        self.hop = int(hop)
+        self.rate = float(rate)
+        self.band_edges = tuple(float(edge) for edge in band_edges)
+        self.threshold = float(threshold)
+        self.idle = idle
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            config = json.loads(str(data["config"]))
+            return cls(weights=data["weights"], bias=data["bias"], mean=data["mean"], scale=data["scale"], **config)
+
+    def save(self, path):
+        config = {
+            "labels": self.labels, "channels": self.channels, "window": self.window, "hop": self.hop,
+            "rate": self.rate, "band_edges": list(self.band_edges), "threshold": self.threshold, "idle": self.idle,
+        }
+        np.savez(path, weights=self.weights, bias=self.bias, mean=self.mean, scale=self.scale,
+                 config=json.dumps(config))
+
+    @classmethod
+    def fit(cls, features, targets, labels, channels, window, hop, rate, band_edges=BAND_EDGES,
+            epochs=500, learning_rate=0.5, l2=1e-3, **kwargs):
+        """Train on (n, features) with integer ``targets`` indexing ``labels`` (full-batch gradient descent)"""
+        features = np.asarray(features, dtype=float)
+        targets = np.asarray(targets)
+        mean = features.mean(axis=0)
+        scale = features.std(axis=0)
+        scale[scale == 0] = 1.0
+        x = (features - mean) / scale
+        onehot = np.eye(len(labels))[targets]
+        weights = np.zeros((x.shape[1], len(labels)))
+        bias = np.zeros(len(labels))
+        for _ in range(epochs):
+            error = _softmax(x @ weights + bias) - onehot
+            weights -= learning_rate * (x.T @ error / len(x) + l2 * weights)
+            bias -= learning_rate * error.mean(axis=0)
+        return cls(labels, weights, bias, mean, scale, channels, window, hop, rate, band_edges, **kwargs)
+
+    def predict_proba(self, features):
+        """Class probabilities, (n, features) -> (n, labels)"""
+        return _softmax(((np.atleast_2d(features) - self.mean) / self.scale) @ self.weights + self.bias)
+
+
+def _softmax(logits):
+    logits = logits - logits.max(axis=-1, keepdims=True)
+    exp = np.exp(logits)
+    return exp / exp.sum(axis=-1, keepdims=True)
+
+
+class GestureRecognizer:
+    """Runs a GestureModel over one band's sample blocks.
+
+    Like the band firmware, a gesture is reported when its probability is
+    above the model's threshold and it differs from the last one reported;
+    the idle label is never reported but resets the state, so the same
+    gesture made twice is reported twice. Overlapping windows see the edges
+    of a gesture several times, so a label must win ``confirm`` consecutive
+    hops before the state changes.
+    """
+
+    def __init__(self, model, band=None, on_event=None, confirm=3):
+        self.model = model
+        self.band = band
+        self.on_event = on_event
+        self.columns = [FIELDS.index(name) for name in model.channels]
+        self.features = SlidingFeatures(model.window, model.hop, len(self.columns), model.rate, model.band_edges)
+        self.confirm = confirm
+        self.state = None
+        self.hops = 0
+        self.events = 0
+        self._candidate = None
+        self._streak = 0
+
+    def feed(self, block):
+        """Process a (k, len(FIELDS)) sample block; returns the gesture events it completed"""
+        if not len(block):
+            return []
+        ends, features = self.features.extend(block[:, self.columns])
+        if not len(ends):
+            return []
+        self.hops += len(ends)
+        probabilities = self.model.predict_proba(np.nan_to_num(features))
+        best = probabilities.argmax(axis=1)
+
+        events = []
+        for end, index, probability in zip(ends, best, probabilities[np.arange(len(best)), best]):
+            label = self.model.labels[index] if probability >= self.model.threshold else None
+            if label == self._candidate:
+                self._streak += 1
+            else:
+                self._candidate, self._streak = label, 1
+            if label is None or label == self.state or self._streak < self.confirm:
+                continue
+            self.state = label
+            if label == self.model.idle:
+                continue
+            timestamp = int(block[end, TIMESTAMP])
+            event = {"symbol": label, "band": self.band, "timestamp": timestamp,
+                     "id": f"{self.band}-{timestamp}", "confidence": round(float(probability), 3)}
+            events.append(event)
+        self.events += len(events)
+        if self.on_event is not None:
+            for event in events:
+                self.on_event(event)
+        return events
+
+
+class BrokerEmitter:
+    """Posts gesture events to the broker's /esp_upload/batch from a worker thread.
+
+    ``emit`` only enqueues, so recognition never waits on the network;
+    events queued while a request is in flight go out together in the next.
+    """
+
+    def __init__(self, url="http://localhost:5000", max_batch=100, timeout=5.0):
+        self.url = url.rstrip("/") + "/esp_upload/batch"
+        self.max_batch = max_batch
+        self.timeout = timeout
+        self.sent = 0
+        self.failed = 0
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="gesture-emitter", daemon=True)
+        self._thread.start()
+
+    def emit(self, event):
+        self._queue.put(event)
+
+    __call__ = emit
+
+    def close(self, timeout=5.0):
+        self._queue.put(None)
+        self._thread.join(timeout)
+
+    def _run(self):
+        while True:
+            events = [self._queue.get()]
+            while len(events) < self.max_batch and not self._queue.empty():
+                events.append(self._queue.get())
+            stop = None in events
+            events = [event for event in events if event is not None]
+            if events:
+                self._post(events)
+            if stop:
+                return
+
+    def _post(self, events):
+        body = json.dumps({"events": events}).encode()
+        request = urllib.request.Request(self.url, body, {"Content-Type": "application/json"})
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                response.read()
+            self.sent += len(events)
+        except OSError as e:
+            self.failed += len(events)
+            logger.warning(f"Could not post {len(events)} gesture events: {e}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("model", help="model .npz (GestureModel.save)")
+    parser.add_argument("port", help="serial port or recording (or anything, with IMU_REPLAY set)")
+    parser.add_argument("--band", default="band-1", help="band ID sent with the events")
+    parser.add_argument("--layout", default="sensor", help="line layout the board sends")
+    parser.add_argument("--broker", help="broker URL to post events to, e.g. http://localhost:5000")
+    parser.add_argument("--print", action="store_true", help="print events")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    model = GestureModel.load(args.model)
+    emitter = BrokerEmitter(args.broker) if args.broker else None
+    recognizer = GestureRecognizer(model, args.band, emitter)
+    stream = ImuStream(open_serial(args.port), layout=args.layout)
+
+    started = time.perf_counter()
+    try:
+        for block in stream.blocks():
+            for event in recognizer.feed(block):
+                if args.print:
+                    print(json.dumps(event))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stream.close()
+        if emitter is not None:
+            emitter.close()
+    elapsed = time.perf_counter() - started
+    print(f"{stream.samples_read} samples, {recognizer.hops} hops, {recognizer.events} gestures "
+          f"in {elapsed:.2f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,211 @@
+"""
+Replay a recorded session as if it came from a board's serial port.
+
+ReplaySource has the parts of serial.Serial the tools use (read, readline,
+in_waiting, is_open, timeout, reset_input_buffer, close), so it works
+anywhere a port is opened. The samples come out as CSV lines in the layout
+of the ImuStream reading them. They are paced by the recording's timestamps
+at ``speed`` x real time, or sent as fast as possible with ``speed=0``.
+
+Any tool runs without hardware by pointing open_serial at a recording:
+
+    IMU_REPLAY=output.csv IMU_REPLAY_RATE=10 python 5.py
+    IMU_REPLAY=session.imu IMU_REPLAY_SPEED=4 python main.py
+
+Settings: IMU_REPLAY (recording: CSV or capture.py file), IMU_REPLAY_SPEED
+(1 = original timing, 0 = as fast as possible), IMU_REPLAY_LAYOUT (the CSV's
+layout, default csv) and IMU_REPLAY_RATE (Hz, for CSV without timestamps).
+
+Run directly, it measures how fast the parsing pipeline can go:
+
+    python replay.py output.csv --rate 10 --repeat 2000
+"""
+import argparse
+import os
+import time
+
+import numpy as np
+
+from capture import Capture, is_capture
+from imu_stream import FIELDS, TIMESTAMP, ImuStream, layout_columns
+
+# Samples formatted per refill of the output buffer
+FORMAT_CHUNK = 4096
+
+
+def load_session(path, layout="csv", sample_rate=None):
+    """(samples, sample_rate) of a CSV recording or capture, with timestamps in ms"""
+    if is_capture(path):
+        capture = Capture(path)
+        return capture.samples(), capture.sample_rate
+    if "timestamp" not in layout_columns(layout) and not sample_rate:
+        raise ValueError(f"layout '{layout}' has no timestamps: a sample rate is needed")
+    with open(path, "rb") as f:
+        stream = ImuStream(f, layout=layout, capacity=1, chunk_size=1 << 20)
+        blocks = list(stream.blocks())
+    samples = np.concatenate(blocks) if blocks else np.empty((0, len(FIELDS)))
+    if "timestamp" not in layout_columns(layout):
+        samples[:, TIMESTAMP] = np.arange(len(samples)) * 1000 / sample_rate
+    return samples, sample_rate
+
+
+class ReplaySource:
+    """A recorded session behind a serial-port interface.
+
+    The clock starts at the first read. Once every sample has been read the
+    source reports ``is_open = False`` and reads return b"", which ImuStream
+    (and a loop checking ``is_open``) treats as the end.
+    ``repeat`` plays the session that many times back to back.
+    """
+
+    def __init__(self, path, speed=1.0, layout="csv", sample_rate=None, timeout=0.1, repeat=1):
+        samples, self.sample_rate = load_session(path, layout, sample_rate)
+        if repeat > 1 and len(samples):
+            samples = self._repeated(samples, repeat)
+        self.path = path
+        self.port = path
+        self.samples = samples
+        self.speed = speed
+        self.timeout = timeout
+        self.is_open = True
+        self.position = 0
+        timestamps = samples[:, TIMESTAMP]
+        # Seconds after the first read at which each sample is "received"
+        self._due = (timestamps - timestamps[0]) / 1000 / speed if speed and len(samples) else None
+        self._buffer = bytearray()
+        self._started = None
+        self.use_layout("sensor")
+
+    @classmethod
+    def from_env(cls, path, timeout=0.1):
+        """A ReplaySource configured by the IMU_REPLAY_* environment variables"""
+        rate = os.environ.get("IMU_REPLAY_RATE")
+        return cls(path,
+                   speed=float(os.environ.get("IMU_REPLAY_SPEED", "1")),
+                   layout=os.environ.get("IMU_REPLAY_LAYOUT", "csv"),
+                   sample_rate=float(rate) if rate else None,
+                   timeout=timeout)
+
+    @staticmethod
+    def _repeated(samples, repeat):
+        timestamps = samples[:, TIMESTAMP]
+        step = np.median(np.diff(timestamps)) if len(samples) > 1 else 1.0
+        period = timestamps[-1] - timestamps[0] + step
+        tiled = np.tile(samples, (repeat, 1))
+        tiled[:, TIMESTAMP] += np.repeat(np.arange(repeat) * period, len(samples))
+        return tiled
+
+    def use_layout(self, layout):
+        """Format lines in this layout (ImuStream calls it with its own)"""
+        columns = layout_columns(layout)
+        self._columns = [FIELDS.index(name) for name in columns]
+        # Timestamps are large integers in ms; sensor values need ~4 digits
+        row = ",".join("%.10g" if name == "timestamp" else "%.6g" for name in columns)
+        self._row_format = row + "\n"
+
+    @property
+    def in_waiting(self):
+        self._fill(FORMAT_CHUNK)
+        return len(self._buffer)
+
+    def arrival(self, timestamp_ms):
+        """time.monotonic() at which the sample stamped ``timestamp_ms`` is (or was) released
+
+        None before the first read, or with ``speed=0``.
+        """
+        if self._started is None or self._due is None:
+            return None
+        return self._started + (timestamp_ms - self.samples[0, TIMESTAMP]) / 1000 / self.speed
+
+    def _released(self):
+        """Number of samples whose time has come"""
+        if self._started is None:
+            self._started = time.monotonic()
+        if self._due is None:
+            return len(self.samples)
+        elapsed = time.monotonic() - self._started
+        return int(np.searchsorted(self._due, elapsed, side="right"))
+
+    def _fill(self, size):
+        """Format released samples into the buffer until it holds ``size`` bytes"""
+        released = self._released()
+        while len(self._buffer) < size and self.position < released:
+            end = min(released, self.position + FORMAT_CHUNK)
+            block = self.samples[self.position:end][:, self._columns]
+            self._buffer += ((self._row_format * len(block)) % tuple(block.ravel())).encode("ascii")
+            self.position = end
+
+    def _wait(self, deadline):
+        """Sleep until the next sample is due or the deadline; False if there's nothing left"""
+        if self.position >= len(self.samples):
+            self.is_open = False
+            return False
+        now = time.monotonic()
+        due = self._started + self._due[self.position] if self._due is not None else now
+        until = due if deadline is None else min(due, deadline)
+        if until > now:
+            time.sleep(until - now)
+        return deadline is None or time.monotonic() < deadline
+
+    def read(self, size=1):
+        """Up to ``size`` bytes; waits up to ``timeout`` for data like pyserial"""
+        if not self.is_open:
+            # The end of the recording: nothing more, like an exhausted port; callers check is_open
+            return b""
+        deadline = None if self.timeout is None else time.monotonic() + self.timeout
+        while True:
+            self._fill(size)
+            if self._buffer:
+                data = bytes(self._buffer[:size])
+                del self._buffer[:size]
+                return data
+            if not self._wait(deadline):
+                return b""
+
+    def readline(self):
+        """One line including the newline (or b"" on timeout / end)"""
+        line = bytearray()
+        while not line.endswith(b"\n"):
+            chunk = self.read(1)
+            if not chunk:
+                break
+            line += chunk
+        return bytes(line)
+
+    def reset_input_buffer(self):
+        # Like a real port: drop what has arrived but not been read
+        self.position = max(self.position, self._released())
+        self._buffer.clear()
+
+    flushInput = reset_input_buffer
+
+    def close(self):
+        self.is_open = False
+        self._buffer.clear()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("recording", help="CSV recording or capture.py file")
+    parser.add_argument("--layout", default="csv", help="the CSV's column layout")
+    parser.add_argument("--rate", type=float, help="sample rate in Hz, for CSV without timestamps")
+    parser.add_argument("--speed", type=float, default=0, help="x real time (0 = as fast as possible)")
+    parser.add_argument("--repeat", type=int, default=1, help="play the session this many times")
+    parser.add_argument("--stream-layout", default="sensor", help="layout the lines are sent in")
+    args = parser.parse_args()
+
+    try:
+        source = ReplaySource(args.recording, args.speed, args.layout, args.rate, repeat=args.repeat)
+    except ValueError as e:
+        parser.error(str(e))
+    stream = ImuStream(source, layout=args.stream_layout)
+
+    started = time.perf_counter()
+    samples = sum(len(block) for block in stream.blocks())
+    elapsed = time.perf_counter() - started
+    print(f"Replayed {samples} samples ({stream.bytes_read / 1e6:.1f} MB) in {elapsed:.3f} s: "
+          f"{samples / elapsed:,.0f} samples/s, {stream.malformed} malformed")
+
+
+if __name__ == "__main__":
+    main()